@@ -1,26 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
-from typing import List
+from fastapi import APIRouter, Header
+from pydantic import TypeAdapter
+import schemas, crud
+from database import DbSession, ReadOnlyDbSession, async_session_scope
+from catalog_cache import ACHIEVEMENTS, catalog_response
+from typing import List, Optional
 
 router = APIRouter(prefix="/achievements", tags=["achievements"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+ACHIEVEMENT_LIST = TypeAdapter(List[schemas.AchievementOut])
 
 @router.get("/", response_model=List[schemas.AchievementOut])
-def get_achievements(db: Session = Depends(get_db)):
-    return crud.get_achievements(db)
+async def get_achievements(if_none_match: Optional[str] = Header(None)):
+    """
+    成就目录：序列化结果按目录版本缓存，命中时不访问数据库
+    """
+    return await catalog_response(ACHIEVEMENTS, render_achievements, if_none_match)
+
+async def render_achievements() -> bytes:
+    """查询并序列化成就目录（仅缓存未命中时打开会话）"""
+    async with async_session_scope(read_only=True) as db:
+        achievements = await crud.get_achievements(db)
+        return ACHIEVEMENT_LIST.dump_json(ACHIEVEMENT_LIST.validate_python(achievements, from_attributes=True))
 
 @router.post("/{user_id}/unlock/{achievement_id}", response_model=schemas.UserAchievementOut)
-def unlock_achievement(user_id: int, achievement_id: int, db: Session = Depends(get_db)):
-    return crud.unlock_achievement(db, user_id, achievement_id)
+async def unlock_achievement(user_id: int, achievement_id: int, db: DbSession):
+    return await crud.unlock_achievement(db, user_id, achievement_id)
 
 @router.get("/{user_id}/user", response_model=List[schemas.UserAchievementOut])
-def get_user_achievements(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_user_achievements(db, user_id)
+async def get_user_achievements(user_id: int, db: ReadOnlyDbSession):
+    return await crud.get_user_achievements(db, user_id)
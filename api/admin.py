@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Header
+import hmac
+import os
+import schemas, crud
+from database import DbSession
+from catalog_cache import ACHIEVEMENTS, CATALOGS, SHARE_TASKS, catalog_cache
+from typing import Optional
+
+# 管理接口令牌，未配置时管理接口不可用
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """校验请求头X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="管理接口未启用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="管理令牌无效")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.post("/achievements", response_model=schemas.AchievementOut)
+async def create_achievement(achievement: schemas.AchievementCreate, db: DbSession):
+    db_achievement = await crud.create_achievement(db, achievement)
+    catalog_cache.invalidate(ACHIEVEMENTS)
+    return db_achievement
+
+@router.post("/share/tasks", response_model=schemas.ShareTaskOut)
+async def create_share_task(task: schemas.ShareTaskCreate, db: DbSession):
+    db_task = await crud.create_share_task(db, task)
+    catalog_cache.invalidate(SHARE_TASKS)
+    return db_task
+
+@router.post("/catalog/invalidate")
+async def invalidate_catalog(catalog: Optional[str] = None):
+    """
+    使目录缓存失效（不指定catalog时全部失效），用于直接修改数据库后
+    """
+    if catalog is not None and catalog not in CATALOGS:
+        raise HTTPException(status_code=404, detail="目录不存在")
+    return {"versions": catalog_cache.invalidate(catalog)}
+
+@router.get("/catalog")
+async def catalog_metrics():
+    """目录缓存版本号及命中计数"""
+    return catalog_cache.snapshot()
@@ -1,18 +1,157 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
-from typing import List
+from fastapi import APIRouter, HTTPException, Header, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+import schemas, crud
+from database import ReadOnlyDbSession
+from leaderboard_engine import leaderboard_engine
+from leaderboard_archive import get_ranked_archive
+from response_cache import leaderboard_cache
+from datetime import date
+from typing import List, Optional
 
 router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 单次返回的最大条数及相邻用户数
+MAX_LIMIT = 100
+MAX_NEIGHBOURS = 50
+
+LEADERBOARD_LIST = TypeAdapter(List[schemas.LeaderboardOut])
 
 @router.get("/{period}", response_model=List[schemas.LeaderboardOut])
-def get_leaderboard(period: str, db: Session = Depends(get_db)):
-    return crud.get_leaderboard(db, period)
+async def get_leaderboard(period: str, db: ReadOnlyDbSession, limit: int = 10,
+                          if_none_match: Optional[str] = Header(None)):
+    """
+    前N名榜单：序列化结果按榜单版本缓存，客户端携带相同ETag时返回304
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    return await cached_response(
+        (period, limit), period, lambda: render_leaderboard(db, period, limit), if_none_match
+    )
+
+@router.get("/{period}/regions/{province}", response_model=List[schemas.LeaderboardOut])
+async def get_regional_leaderboard(period: str, province: str, db: ReadOnlyDbSession,
+                                   city: Optional[str] = None, limit: int = 10,
+                                   if_none_match: Optional[str] = Header(None)):
+    """
+    省份榜（指定city时为城市榜），名次为地区内名次
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    return await cached_response(
+        (period, province, city, limit), period,
+        lambda: render_regional_leaderboard(db, period, province, city, limit), if_none_match
+    )
+
+@router.get("/{period}/friends/{user_id}", response_model=List[schemas.LeaderboardOut])
+async def get_friend_leaderboard(period: str, user_id: int, db: ReadOnlyDbSession):
+    """
+    好友榜（包含用户本人），名次为好友间名次
+    """
+    user_ids = await crud.get_friend_ids(db, user_id) + [str(user_id)]
+    if leaderboard_engine.is_ready(period):
+        return entries_to_out(period, leaderboard_engine.friends(period, user_ids))
+    return rows_to_out(await crud.get_friend_leaderboard(db, period, user_ids), renumber=True)
+
+@router.get("/{period}/history/{day}", response_model=List[schemas.LeaderboardOut])
+async def get_history_leaderboard(period: str, day: date, db: ReadOnlyDbSession,
+                                  limit: int = 10, offset: int = 0):
+    """
+    历史榜单：直接读取已结束周期的归档，day可为周期内任意一天
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    offset = max(0, offset)
+    board = await get_ranked_archive(db, period, day)
+    if not board:
+        raise HTTPException(status_code=404, detail="历史榜单不存在")
+
+    created_at, ranked = board
+    page = ranked[offset:offset + limit]
+    usernames = await crud.get_usernames(db, [user_id for _, user_id, _ in page])
+    return [
+        schemas.LeaderboardOut(
+            user_id=user_id,
+            period=period,
+            rank=rank,
+            tap_count=taps,
+            created_at=created_at,
+            username=usernames.get(user_id, "")
+        )
+        for rank, user_id, taps in page
+    ]
+
+async def cached_response(key, period: str, render, if_none_match: Optional[str]) -> Response:
+    """经响应缓存返回序列化的榜单"""
+    # 引擎榜单按版本号失效；读取leaderboard表时版本未知，按缓存有效期过期
+    version = leaderboard_engine.version(period) if leaderboard_engine.is_ready(period) else None
+    cached = await leaderboard_cache.get_or_compute_async(key, version, render)
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if cached.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+async def render_leaderboard(db: AsyncSession, period: str, limit: int) -> bytes:
+    """查询并序列化前N名榜单"""
+    if leaderboard_engine.is_ready(period):
+        outs = entries_to_out(period, leaderboard_engine.top(period, limit))
+    else:
+        outs = rows_to_out(await crud.get_leaderboard(db, period, limit))
+    return LEADERBOARD_LIST.dump_json(outs)
+
+async def render_regional_leaderboard(db: AsyncSession, period: str, province: str, city: Optional[str],
+                                      limit: int) -> bytes:
+    """查询并序列化地区前N名榜单"""
+    if leaderboard_engine.is_ready(period):
+        outs = entries_to_out(period, leaderboard_engine.top(period, limit, province, city))
+    else:
+        outs = rows_to_out(await crud.get_regional_leaderboard(db, period, province, city, limit), renumber=True)
+    return LEADERBOARD_LIST.dump_json(outs)
+
+@router.get("/{period}/users/{user_id}", response_model=schemas.LeaderboardAroundOut)
+async def get_user_rank(period: str, user_id: int, db: ReadOnlyDbSession, k: int = 5):
+    """
+    用户名次及上下各k名
+    """
+    k = max(0, min(k, MAX_NEIGHBOURS))
+
+    if leaderboard_engine.is_ready(period):
+        rank, start, entries = leaderboard_engine.around(period, user_id, k)
+        if rank is None:
+            raise HTTPException(status_code=404, detail="用户未上榜")
+        return schemas.LeaderboardAroundOut(
+            period=period, user_id=user_id, rank=rank,
+            tap_count=entries[rank - start][1], entries=entries_to_out(period, entries, start)
+        )
+
+    # 通过(period, user_id)索引定位名次，再按(period, rank)索引从用户所在行向两侧各取k行
+    entry = await crud.get_leaderboard_entry(db, period, user_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="用户未上榜")
+    rank = entry.rank
+    rows = await crud.get_leaderboard_neighbours(db, period, rank, user_id, k)
+    return schemas.LeaderboardAroundOut(
+        period=period, user_id=user_id, rank=rank,
+        tap_count=entry.tap_count, entries=rows_to_out(rows)
+    )
+
+def entries_to_out(period: str, entries, start: int = 1) -> List[schemas.LeaderboardOut]:
+    """引擎榜单条目转换为响应，名次从start起连续编号；用户名、头像取自引擎，不查询数据库"""
+    profiles = leaderboard_engine.profiles(user_id for user_id, _ in entries)
+    return [
+        schemas.LeaderboardOut(
+            user_id=user_id,
+            period=period,
+            rank=rank,
+            tap_count=score,
+            created_at=leaderboard_engine.updated_at,
+            username=profiles[user_id][0],
+            avatar=profiles[user_id][1]
+        )
+        for rank, (user_id, score) in enumerate(entries, start=start)
+    ]
+
+def rows_to_out(rows, renumber: bool = False) -> List[schemas.LeaderboardOut]:
+    """榜单记录转换为响应，renumber时按结果顺序重新编号（地区榜、好友榜）"""
+    outs = [schemas.LeaderboardOut.model_validate(row) for row in rows]
+    if renumber:
+        outs = [out.model_copy(update={"rank": rank}) for rank, out in enumerate(outs, start=1)]
+    return outs
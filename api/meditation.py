@@ -1,22 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
+from fastapi import APIRouter
+import schemas, crud
+from database import DbSession, ReadOnlyDbSession
+from batch_dedupe import is_duplicate_batch, release_batch
 from typing import List
 
 router = APIRouter(prefix="/meditation", tags=["meditation"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/{user_id}/sessions", response_model=schemas.MeditationSessionOut)
-def create_session(user_id: int, session: schemas.MeditationSessionCreate, db: Session = Depends(get_db)):
-    return crud.create_meditation_session(db, user_id, session)
+async def create_session(user_id: int, session: schemas.MeditationSessionCreate, db: DbSession):
+    """
+    上传冥想记录；客户端重试已上传的批次时返回原记录，不重复写入
+    """
+    if is_duplicate_batch("meditation", user_id, session.client_id, session.batch_seq):
+        stored = await crud.get_meditation_session_by_batch(db, user_id, session.client_id, session.batch_seq)
+        if stored is not None:
+            return stored
+        # 首次请求尚未提交或序号已超出去重窗口，按批次唯一索引写入，由数据库判重
+    try:
+        return await crud.create_meditation_session(db, user_id, session)
+    except Exception:
+        release_batch("meditation", user_id, session.client_id, session.batch_seq)
+        raise
 
 @router.get("/{user_id}/sessions", response_model=List[schemas.MeditationSessionOut])
-def get_sessions(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_meditation_sessions(db, user_id)
+async def get_sessions(user_id: int, db: ReadOnlyDbSession):
+    return await crud.get_meditation_sessions(db, user_id)
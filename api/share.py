@@ -1,26 +1,31 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
-from typing import List
+from fastapi import APIRouter, Header
+from pydantic import TypeAdapter
+import schemas, crud
+from database import DbSession, ReadOnlyDbSession, async_session_scope
+from catalog_cache import SHARE_TASKS, catalog_response
+from typing import List, Optional
 
 router = APIRouter(prefix="/share", tags=["share"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+SHARE_TASK_LIST = TypeAdapter(List[schemas.ShareTaskOut])
 
 @router.get("/tasks", response_model=List[schemas.ShareTaskOut])
-def get_share_tasks(db: Session = Depends(get_db)):
-    return crud.get_share_tasks(db)
+async def get_share_tasks(if_none_match: Optional[str] = Header(None)):
+    """
+    分享任务目录：序列化结果按目录版本缓存，命中时不访问数据库
+    """
+    return await catalog_response(SHARE_TASKS, render_share_tasks, if_none_match)
+
+async def render_share_tasks() -> bytes:
+    """查询并序列化分享任务目录（仅缓存未命中时打开会话）"""
+    async with async_session_scope(read_only=True) as db:
+        tasks = await crud.get_share_tasks(db)
+        return SHARE_TASK_LIST.dump_json(SHARE_TASK_LIST.validate_python(tasks, from_attributes=True))
 
 @router.post("/{user_id}/complete/{task_id}", response_model=schemas.UserShareTaskOut)
-def complete_task(user_id: int, task_id: int, db: Session = Depends(get_db)):
-    return crud.complete_share_task(db, user_id, task_id)
+async def complete_task(user_id: int, task_id: int, db: DbSession):
+    return await crud.complete_share_task(db, user_id, task_id)
 
 @router.get("/{user_id}/user", response_model=List[schemas.UserShareTaskOut])
-def get_user_share_tasks(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_user_share_tasks(db, user_id)
+async def get_user_share_tasks(user_id: int, db: ReadOnlyDbSession):
+    return await crud.get_user_share_tasks(db, user_id)
@@ -1,20 +1,97 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal
+from fastapi import APIRouter, HTTPException, Query
+import schemas, crud
+from database import ReadOnlyDbSession
+from datetime import datetime, timedelta, timezone
+from periods import local_day, local_today, day_start_utc
+from tap_aggregator import tap_aggregator
+from batch_dedupe import is_duplicate_batch, release_batch
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 单批次允许的最大敲击数及敲击频率上限（次/秒）
+MAX_TAPS_PER_BATCH = 100000
+MAX_TAPS_PER_SECOND = 20
+# 批次结束时间允许早于当前时间的最长时长，更早的按此计入，避免补记到已结束的周期或已合并的分桶
+MAX_BATCH_AGE = timedelta(hours=1)
+
+def tap_rate_exceeded(count: int, seconds: float) -> bool:
+    """按时间范围校验敲击频率（至少按1秒计算），HTTP批量上报与敲击流共用"""
+    return count / max(seconds, 1) > MAX_TAPS_PER_SECOND
+
+# 分布图范围对应的天数
+HISTOGRAM_RANGES = {"week": 7, "month": 30}
 
 @router.get("/{user_id}", response_model=schemas.UserStatOut)
-def get_user_stat(user_id: int, db: Session = Depends(get_db)):
-    stat = crud.get_user_stat(db, user_id)
+async def get_user_stat(user_id: int, db: ReadOnlyDbSession):
+    stat = await crud.get_user_stat(db, user_id)
     if not stat:
         raise HTTPException(status_code=404, detail="统计数据不存在")
     return stat
+
+@router.get("/{user_id}/histogram", response_model=schemas.TapHistogramOut)
+async def get_tap_histogram(user_id: int, db: ReadOnlyDbSession, span: str = Query("day", alias="range")):
+    """
+    敲击分布图：day为最近24小时按小时，week/month为最近7/30天按天
+    """
+    if span == "day":
+        end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        start = end - timedelta(hours=23)
+        taps = {}
+        for bucket in await crud.get_tap_histogram(db, user_id, start):
+            if bucket.granularity == "hour":
+                taps[bucket.bucket_start] = taps.get(bucket.bucket_start, 0) + bucket.taps
+        points = [start + timedelta(hours=i) for i in range(24)]
+        granularity = "hour"
+    elif span in HISTOGRAM_RANGES:
+        first_day = local_today() - timedelta(days=HISTOGRAM_RANGES[span] - 1)
+        taps = {}
+        # 保留期内为小时桶、之前为日桶，统一按日切时区汇总到天
+        for bucket in await crud.get_tap_histogram(db, user_id, day_start_utc(first_day)):
+            day_start = day_start_utc(local_day(bucket.bucket_start))
+            taps[day_start] = taps.get(day_start, 0) + bucket.taps
+        points = [day_start_utc(first_day + timedelta(days=i)) for i in range(HISTOGRAM_RANGES[span])]
+        granularity = "day"
+    else:
+        raise HTTPException(status_code=400, detail="无效的时间范围")
+
+    return schemas.TapHistogramOut(
+        range=span,
+        granularity=granularity,
+        points=[schemas.TapHistogramPoint(bucket_start=point, taps=taps.get(point, 0)) for point in points]
+    )
+
+@router.post("/{user_id}/taps", response_model=schemas.TapBatchAck)
+async def upload_taps(user_id: int, batch: schemas.TapBatchCreate, db: ReadOnlyDbSession):
+    """
+    批量上报敲击，写入聚合缓冲区后由后台定期落库
+
+    批次结束时间限定在[当前时间 - MAX_BATCH_AGE, 当前时间]内，客户端时钟偏差不会把敲击记到未来或过早的时间。
+    """
+    if batch.count <= 0 or batch.count > MAX_TAPS_PER_BATCH:
+        raise HTTPException(status_code=400, detail="敲击数无效")
+    if batch.ended_at < batch.started_at:
+        raise HTTPException(status_code=400, detail="时间范围无效")
+
+    if tap_rate_exceeded(batch.count, (batch.ended_at - batch.started_at).total_seconds()):
+        raise HTTPException(status_code=400, detail="敲击频率异常")
+
+    if not await crud.get_user(db, user_id):
+        raise HTTPException(status_code=404, detail="用户不存在")
+
+    ended_at = batch.ended_at
+    if ended_at.tzinfo is not None:
+        ended_at = ended_at.astimezone(timezone.utc).replace(tzinfo=None)
+    now = datetime.utcnow()
+    ended_at = min(max(ended_at, now - MAX_BATCH_AGE), now)
+
+    # 客户端重试的批次直接确认，不重复计数
+    if is_duplicate_batch("taps", user_id, batch.client_id, batch.batch_seq):
+        return schemas.TapBatchAck(user_id=user_id, accepted=0,
+                                   pending_taps=tap_aggregator.pending_taps(user_id), duplicate=True)
+
+    try:
+        pending = tap_aggregator.add(user_id, batch.count, ended_at)
+    except Exception:
+        release_batch("taps", user_id, batch.client_id, batch.batch_seq)
+        raise
+    return schemas.TapBatchAck(user_id=user_id, accepted=batch.count, pending_taps=pending)
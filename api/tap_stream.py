@@ -0,0 +1,65 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import crud
+from database import async_session_scope
+from tap_aggregator import tap_aggregator
+from api.stat import tap_rate_exceeded
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+# 单条消息允许的最大敲击数
+MAX_TAPS_PER_MESSAGE = 200
+
+async def get_persisted_total(user_id: int) -> int:
+    """读取已落库的累计敲击数（仅在建立连接时读取一次）"""
+    # 不通过依赖注入获取会话，避免长连接期间一直占用会话
+    async with async_session_scope(read_only=True) as db:
+        stat = await crud.get_user_stat(db, user_id)
+        return (stat.total_taps or 0) if stat else 0
+
+@router.websocket("/{user_id}/stream")
+async def tap_stream(websocket: WebSocket, user_id: int):
+    """
+    冥想过程中的敲击流
+
+    客户端发送 {"seq": 序号, "count": 敲击增量}，服务端确认并返回累计值。
+    敲击频率按连接建立以来的累计敲击数校验，与批量上报的上限相同；无效消息返回错误且不计数。
+    所有连接共用同一个聚合缓冲区，由后台统一落库。
+    """
+    await websocket.accept()
+    base_total = await get_persisted_total(user_id) + tap_aggregator.pending_taps(user_id)
+    session_taps = 0
+    connected_at = time.monotonic()
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"seq": None, "error": "消息格式无效"})
+                continue
+            seq = message.get("seq") if isinstance(message, dict) else None
+            count = message.get("count") if isinstance(message, dict) else None
+
+            if not isinstance(count, int) or isinstance(count, bool) or count <= 0 or count > MAX_TAPS_PER_MESSAGE:
+                await websocket.send_json({"seq": seq, "error": "敲击数无效"})
+                continue
+            if tap_rate_exceeded(session_taps + count, time.monotonic() - connected_at):
+                await websocket.send_json({"seq": seq, "error": "敲击频率异常"})
+                continue
+
+            # 追加事件日志只写入文件不做fsync，直接在事件循环中调用
+            pending = tap_aggregator.add(user_id, count)
+            session_taps += count
+            await websocket.send_json({
+                "seq": seq,
+                "session_taps": session_taps,
+                "total_taps": base_total + session_taps,
+                "pending_taps": pending
+            })
+    except WebSocketDisconnect:
+        logger.info(f"用户 {user_id} 敲击流断开，本次共 {session_taps} 次")
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal, get_db
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from starlette.concurrency import run_in_threadpool
+import schemas, crud
+from database import DbSession, ReadOnlyDbSession
+from typing import List, Optional
 import random
 import string
 from datetime import datetime, timedelta
 from sms_service import sms_service
 from third_party_auth import apple_auth_service, wechat_auth_service
 import third_party_auth
+from leaderboard_engine import leaderboard_engine
+from profile_cache import profile_cache
+from session_tokens import token_service
+from pydantic import TypeAdapter
 import logging
 import re
 
@@ -16,19 +20,24 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-# 简单的用户认证函数（用于需要认证的接口）
-def get_current_user(db: Session = Depends(get_db)) -> models.User:
-    """获取当前用户（简化版本，实际项目中应该使用JWT等认证方式）"""
-    # 这里是一个简化的实现，实际项目中应该从JWT token或session中获取用户信息
-    # 为了修复当前错误，我们暂时返回一个默认用户或抛出异常
-    raise HTTPException(status_code=401, detail="需要用户认证")
+# 用户认证（用于需要认证的接口）
+async def get_current_user(authorization: Optional[str] = Header(None)) -> schemas.TokenUser:
+    """从Authorization: Bearer <token>中校验会话令牌，只校验签名、有效期和吊销列表，不查询数据库"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="需要用户认证")
+    verified = token_service.verify(token.strip())
+    if not verified:
+        raise HTTPException(status_code=401, detail="登录已失效，请重新登录")
+    user_id, jti, expires_at = verified
+    return schemas.TokenUser(id=user_id, jti=jti, expires_at=expires_at)
 
 def generate_verification_code() -> str:
     """生成6位数字验证码"""
     return ''.join(random.choices(string.digits, k=6))
 
 @router.post("/send-code", response_model=schemas.SendCodeResponse)
-def send_verification_code(request: schemas.SendCodeRequest, db: Session = Depends(get_db)):
+async def send_verification_code(request: schemas.SendCodeRequest, db: DbSession):
     """
     发送验证码
     """
@@ -37,22 +46,22 @@ def send_verification_code(request: schemas.SendCodeRequest, db: Session = Depen
         raise HTTPException(status_code=400, detail="手机号格式不正确")
     
     # 检查5分钟内是否已发送过验证码
-    if not crud.can_send_verification_code(db, request.phone):
+    if not await crud.can_send_verification_code(db, request.phone):
         raise HTTPException(status_code=429, detail="请等待5分钟后再次发送验证码")
     
     # 生成验证码
     code = generate_verification_code()
     expires_at = datetime.utcnow() + timedelta(minutes=5)  # 5分钟过期
     
-    # 发送短信
-    sms_result = sms_service.send_verification_code(request.phone, code)
+    # 发送短信（短信网关为阻塞调用，放到线程池执行以免阻塞事件循环）
+    sms_result = await run_in_threadpool(sms_service.send_verification_code, request.phone, code)
     
     if not sms_result['success']:
         logger.error(f"短信发送失败: {sms_result['message']}")
         raise HTTPException(status_code=500, detail="短信发送失败，请稍后重试")
     
     # 保存验证码到数据库
-    crud.create_verification_code(db, request.phone, code, expires_at)
+    await crud.create_verification_code(db, request.phone, code, expires_at)
     
     # 根据是否为模拟模式返回不同的消息
     if sms_service.is_configured():
@@ -67,20 +76,20 @@ def send_verification_code(request: schemas.SendCodeRequest, db: Session = Depen
     )
 
 @router.post("/login", response_model=schemas.LoginResponse)
-def login_with_code(request: schemas.VerifyCodeRequest, db: Session = Depends(get_db)):
+async def login_with_code(request: schemas.VerifyCodeRequest, db: DbSession):
     """
     验证码登录
     """
     # 验证验证码
-    verification_code = crud.get_valid_verification_code(db, request.phone, request.code)
+    verification_code = await crud.get_valid_verification_code(db, request.phone, request.code)
     if not verification_code:
         raise HTTPException(status_code=400, detail="验证码无效或已过期")
     
     # 标记验证码为已使用
-    crud.use_verification_code(db, verification_code.id)
+    await crud.use_verification_code(db, verification_code.id)
     
     # 查找或创建用户
-    user = crud.get_user_by_phone(db, request.phone)
+    user = await crud.get_user_by_phone(db, request.phone)
     if not user:
         # 如果用户不存在，自动创建新用户
         username = f"用户{request.phone[-4:]}"  # 使用手机号后4位生成用户名
@@ -88,23 +97,24 @@ def login_with_code(request: schemas.VerifyCodeRequest, db: Session = Depends(ge
             username=username,
             phone=request.phone
         )
-        user = crud.create_user_by_phone(db, user_create)
+        user = await crud.create_user_by_phone(db, user_create)
         
         # 为新用户创建统计记录
-        crud.create_user_stat(db, user.id)
+        await crud.create_user_stat(db, user.id)
     
     return schemas.LoginResponse(
         user=user,
+        token=token_service.issue(user.id),
         message="登录成功"
     )
 
 @router.post("/apple-login", response_model=schemas.AppleLoginResponse)
-def apple_login(request: schemas.AppleLoginRequest, db: Session = Depends(get_db)):
+async def apple_login(request: schemas.AppleLoginRequest, db: DbSession):
     """
     Apple Sign In 登录
     """
     # 验证Apple身份令牌
-    payload = apple_auth_service.verify_identity_token(request.identity_token)
+    payload = await run_in_threadpool(apple_auth_service.verify_identity_token, request.identity_token)
     if not payload:
         raise HTTPException(status_code=400, detail="Apple身份令牌验证失败")
     
@@ -114,16 +124,12 @@ def apple_login(request: schemas.AppleLoginRequest, db: Session = Depends(get_db
     if not apple_user_id:
         raise HTTPException(status_code=400, detail="无法获取Apple用户标识")
     
-    # 查找现有用户
-    existing_user = crud.get_user_by_third_party(db, 'apple', apple_user_id)
+    # 查找现有用户（身份缓存命中时为一次主键查询，否则为一次联表查询；老用户登录不写库）
+    existing_user = await crud.get_user_by_third_party(db, 'apple', apple_user_id)
     is_new_user = False
     
     if existing_user:
         user = existing_user
-        # 更新第三方认证信息
-        auth = crud.get_third_party_auth(db, 'apple', apple_user_id)
-        if auth:
-            crud.update_third_party_auth(db, auth.id, {})
     else:
         # 创建新用户
         is_new_user = True
@@ -136,7 +142,7 @@ def apple_login(request: schemas.AppleLoginRequest, db: Session = Depends(get_db
         # 检查用户名是否已存在
         counter = 1
         original_username = username
-        while crud.get_user_by_username(db, username):
+        while await crud.get_user_by_username(db, username):
             username = f"{original_username}{counter}"
             counter += 1
         
@@ -148,29 +154,44 @@ def apple_login(request: schemas.AppleLoginRequest, db: Session = Depends(get_db
             icon=None
         )
         
-        user = crud.create_user_by_third_party(db, user_info)
+        user = await crud.create_user_by_third_party(db, user_info)
         
         # 创建第三方认证记录
-        crud.create_third_party_auth(db, user.id, 'apple', apple_user_id)
+        await crud.create_third_party_auth(db, user.id, 'apple', apple_user_id)
         
         # 为新用户创建统计记录
-        crud.create_user_stat(db, user.id)
+        await crud.create_user_stat(db, user.id)
     
     return schemas.AppleLoginResponse(
         user=user,
+        token=token_service.issue(user.id),
         message="Apple登录成功",
         is_new_user=is_new_user
     )
 
 @router.post("/wechat-login", response_model=schemas.UserOut)
-def wechat_login(user_info: schemas.ThirdPartyUserInfo, db: Session = Depends(get_db)):
-    """微信登录"""
+async def wechat_login(user_info: schemas.ThirdPartyUserInfo, db: DbSession, response: Response):
+    """微信登录（响应体保持为用户信息，会话令牌通过X-Session-Token响应头返回）"""
     try:
         # 验证微信授权码
-        wechat_user_info = wechat_auth_service.verify_wechat_auth(user_info.platform_user_id)
+        wechat_user_info = await run_in_threadpool(wechat_auth_service.verify_wechat_auth, user_info.platform_user_id)
         
+        openid = wechat_user_info['openid']
+        tokens = {
+            'access_token': wechat_user_info.get('access_token'),
+            'refresh_token': wechat_user_info.get('refresh_token')
+        }
+
+        # 老用户：一次联表查询取得用户及认证记录，令牌未变化时不写库
+        resolved = await crud.resolve_third_party(db, "wechat", openid)
+        if resolved:
+            user, auth = resolved
+            await crud.update_third_party_auth(db, auth.id, tokens)
+            response.headers["X-Session-Token"] = token_service.issue(user.id)
+            return user
+
         # 查找或创建用户
-        user = crud.get_user_by_email(db, wechat_user_info['email']) if wechat_user_info.get('email') else None
+        user = await crud.get_user_by_email(db, wechat_user_info['email']) if wechat_user_info.get('email') else None
         if not user:
             # 创建新用户
             user_create_info = schemas.ThirdPartyUserInfo(
@@ -178,28 +199,19 @@ def wechat_login(user_info: schemas.ThirdPartyUserInfo, db: Session = Depends(ge
                 email=wechat_user_info.get('email'),
                 avatar=wechat_user_info.get('avatar'),
                 platform="wechat",
-                platform_user_id=wechat_user_info['openid'],
+                platform_user_id=openid,
                 # 移除 auth_code 字段，因为 ThirdPartyUserInfo 模型中未定义该字段
                 icon=user_info.icon
             )
-            user = crud.create_user_by_third_party(db, user_create_info)
-        
-        # 更新或创建第三方认证信息
-        auth = crud.get_third_party_auth(db, "wechat", wechat_user_info['openid'])
-        if auth:
-            crud.update_third_party_auth(db, auth.id, {
-                'access_token': wechat_user_info.get('access_token'),
-                'refresh_token': wechat_user_info.get('refresh_token'),
-                'updated_at': datetime.utcnow()
-            })
-        else:
-            crud.create_third_party_auth(db, user.id, "wechat", wechat_user_info['openid'], 
-                                       wechat_user_info.get('access_token'), 
-                                       wechat_user_info.get('refresh_token'))
+            user = await crud.create_user_by_third_party(db, user_create_info)
+            # 创建用户统计记录
+            await crud.create_user_stat(db, user.id)
         
-        # 创建用户统计记录
-        crud.create_user_stat(db, user.id)
+        # 创建第三方认证记录
+        await crud.create_third_party_auth(db, user.id, "wechat", openid,
+                                           tokens['access_token'], tokens['refresh_token'])
         
+        response.headers["X-Session-Token"] = token_service.issue(user.id)
         return user
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"微信登录失败: {str(e)}")
@@ -207,8 +219,8 @@ def wechat_login(user_info: schemas.ThirdPartyUserInfo, db: Session = Depends(ge
 @router.post("/bind-backup-phone")
 async def bind_backup_phone(
     phone_data: dict,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession,
+    current_user: schemas.TokenUser = Depends(get_current_user)
 ):
     """绑定备份手机号"""
     phone = phone_data.get("phone")
@@ -220,12 +232,12 @@ async def bind_backup_phone(
         raise HTTPException(status_code=400, detail="手机号格式不正确")
     
     # 检查手机号是否已被其他用户使用
-    existing_user = crud.get_user_by_phone(db, phone)
+    existing_user = await crud.get_user_by_phone(db, phone)
     if existing_user and existing_user.id != getattr(current_user, 'id'):
         raise HTTPException(status_code=400, detail="该手机号已被其他用户使用")
     
     # 更新备份手机号
-    updated_user = crud.update_user_backup_phone(db, getattr(current_user, 'id'), phone)
+    updated_user = await crud.update_user_backup_phone(db, getattr(current_user, 'id'), phone)
     if not updated_user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -234,8 +246,8 @@ async def bind_backup_phone(
 @router.post("/update-backup-phone")
 async def update_backup_phone(
     phone_data: dict,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession,
+    current_user: schemas.TokenUser = Depends(get_current_user)
 ):
     """更新备份手机号"""
     phone = phone_data.get("phone")
@@ -247,29 +259,37 @@ async def update_backup_phone(
         raise HTTPException(status_code=400, detail="手机号格式不正确")
     
     # 检查手机号是否已被其他用户使用
-    existing_user = crud.get_user_by_phone(db, phone)
+    existing_user = await crud.get_user_by_phone(db, phone)
     if existing_user and existing_user.id != getattr(current_user, 'id'):
         raise HTTPException(status_code=400, detail="该手机号已被其他用户使用")
     
     # 更新备份手机号
-    updated_user = crud.update_user_backup_phone(db, getattr(current_user, 'id'), phone)
+    updated_user = await crud.update_user_backup_phone(db, getattr(current_user, 'id'), phone)
     if not updated_user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
     return {"message": "备份手机号更新成功", "backup_phone": phone}
 
+@router.post("/logout")
+async def logout(db: DbSession, current_user: schemas.TokenUser = Depends(get_current_user)):
+    """退出登录：吊销当前会话令牌"""
+    token_service.revoke(current_user.jti, current_user.expires_at)
+    await crud.revoke_session_token(db, current_user.jti, current_user.id,
+                                    datetime.utcfromtimestamp(current_user.expires_at))
+    return {"message": "已退出登录"}
+
 @router.get("/users-by-login-type")
 async def get_users_by_login_type(
     login_type: str,
+    db: ReadOnlyDbSession,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = 100
 ):
     """根据登录类型获取用户列表"""
     if login_type not in ['phone', 'apple', 'wechat']:
         raise HTTPException(status_code=400, detail="无效的登录类型")
     
-    users = crud.get_users_by_login_type(db, login_type, skip, limit)
+    users = await crud.get_users_by_login_type(db, login_type, skip, limit)
     return {
         "login_type": login_type,
         "count": len(users),
@@ -285,21 +305,21 @@ async def get_users_by_login_type(
     }
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: DbSession):
     """
     传统注册方式（保留兼容性）
     """
-    db_user = crud.get_user_by_username(db, user.username)
+    db_user = await crud.get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="用户名已存在")
     
     if user.email:
-        db_user = crud.get_user_by_email(db, user.email)
+        db_user = await crud.get_user_by_email(db, user.email)
         if db_user:
             raise HTTPException(status_code=400, detail="邮箱已注册")
     
     if user.phone:
-        db_user = crud.get_user_by_phone(db, user.phone)
+        db_user = await crud.get_user_by_phone(db, user.phone)
         if db_user:
             raise HTTPException(status_code=400, detail="手机号已注册")
     
@@ -308,14 +328,61 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="密码不能为空")
     hashed_password = user.password + "notreallyhashed"
     
-    return crud.create_user(db, user, hashed_password)
+    return await crud.create_user(db, user, hashed_password)
+
+USER_OUT = TypeAdapter(schemas.UserOut)
 
 @router.get("/{user_id}", response_model=schemas.UserOut)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: ReadOnlyDbSession):
+    """
+    获取用户信息：序列化结果经资料缓存返回，命中时不查询数据库
+    """
+    async def load():
+        user = await crud.get_user(db, user_id)
+        return USER_OUT.dump_json(USER_OUT.validate_python(user, from_attributes=True)) if user else None
+
+    body = await profile_cache.get_or_load(user_id, load)
+    if body is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return Response(content=body, media_type="application/json")
+
+@router.put("/{user_id}/region", response_model=schemas.UserOut)
+async def update_region(user_id: int, region: schemas.RegionUpdate, db: DbSession):
     """
-    获取用户信息
+    更新用户所在地区，排行榜中的分数随之移至新地区
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if region.city and not region.province:
+        raise HTTPException(status_code=400, detail="设置城市时必须提供省份")
+    user = await crud.update_user_region(db, user_id, region.province, region.city)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
+    leaderboard_engine.move_user(user_id, region.province, region.city)
     return user
+
+@router.get("/{user_id}/friends", response_model=List[int])
+async def get_friends(user_id: int, db: ReadOnlyDbSession):
+    """
+    获取好友ID列表
+    """
+    return [int(friend_id) for friend_id in await crud.get_friend_ids(db, user_id)]
+
+@router.post("/{user_id}/friends")
+async def add_friend(user_id: int, friend: schemas.FriendCreate, db: DbSession):
+    """
+    添加好友（双向）
+    """
+    if friend.friend_id == user_id:
+        raise HTTPException(status_code=400, detail="不能添加自己为好友")
+    for target in (user_id, friend.friend_id):
+        if not await crud.get_user(db, target):
+            raise HTTPException(status_code=404, detail="用户不存在")
+    await crud.add_friend(db, user_id, friend.friend_id)
+    return {"message": "好友添加成功", "friend_id": friend.friend_id}
+
+@router.delete("/{user_id}/friends/{friend_id}")
+async def remove_friend(user_id: int, friend_id: int, db: DbSession):
+    """
+    删除好友
+    """
+    await crud.remove_friend(db, user_id, friend_id)
+    return {"message": "好友已删除", "friend_id": friend_id}
@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+class BatchDeduper:
+    """上传批次去重
+
+    每个客户端只保存最大批次序号（高水位）和其下方固定窗口的位图，
+    判重为O(1)，单个客户端占用常数内存；客户端总数按LRU淘汰以限制总内存。
+    比窗口更旧的序号一律视为重复。
+    """
+
+    def __init__(self, window: int = 64, max_clients: int = 1000000):
+        self.window = window
+        self.max_clients = max_clients
+        self._mask = (1 << window) - 1
+        self._lock = threading.Lock()
+        # key -> (高水位 << window) | 位图；位图第i位表示序号 高水位-i 已出现
+        self._state: "OrderedDict[Hashable, int]" = OrderedDict()
+
+    def check_and_record(self, key: Hashable, seq: int) -> bool:
+        """记录批次序号，首次出现返回True，重复返回False"""
+        with self._lock:
+            packed = self._state.get(key)
+            if packed is None:
+                self._store(key, (seq << self.window) | 1)
+                return True
+
+            high = packed >> self.window
+            bitmap = packed & self._mask
+            if seq > high:
+                shift = seq - high
+                bitmap = ((bitmap << shift) | 1) & self._mask if shift < self.window else 1
+                self._store(key, (seq << self.window) | bitmap)
+                return True
+
+            offset = high - seq
+            if offset >= self.window or bitmap & (1 << offset):
+                self._state.move_to_end(key)
+                return False
+            self._store(key, (high << self.window) | bitmap | (1 << offset))
+            return True
+
+    def discard(self, key: Hashable, seq: int):
+        """撤销已记录的批次序号，批次处理失败时调用，客户端重试时不会被当作重复"""
+        with self._lock:
+            packed = self._state.get(key)
+            if packed is None:
+                return
+            offset = (packed >> self.window) - seq
+            if 0 <= offset < self.window:
+                self._state[key] = packed & ~(1 << offset)
+
+    def _store(self, key: Hashable, packed: int):
+        self._state[key] = packed
+        self._state.move_to_end(key)
+        if len(self._state) > self.max_clients:
+            self._state.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+# 全局去重实例
+batch_deduper = BatchDeduper(
+    window=int(os.getenv('BATCH_DEDUPE_WINDOW', '64')),
+    max_clients=int(os.getenv('BATCH_DEDUPE_MAX_CLIENTS', '1000000'))
+)
+
+def is_duplicate_batch(kind: str, user_id, client_id: Optional[str], batch_seq: Optional[int]) -> bool:
+    """判断上传批次是否重复并记录；未携带批次标识的旧客户端不做去重
+
+    批次在写入前即被记录，并发的重试不会同时通过；写入失败时须调用release_batch撤销记录。
+    """
+    if client_id is None or batch_seq is None:
+        return False
+    return not batch_deduper.check_and_record((kind, str(user_id), client_id), batch_seq)
+
+def release_batch(kind: str, user_id, client_id: Optional[str], batch_seq: Optional[int]):
+    """撤销is_duplicate_batch的记录，用于批次写入失败后允许客户端重试"""
+    if client_id is None or batch_seq is None:
+        return
+    batch_deduper.discard((kind, str(user_id), client_id), batch_seq)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+基准测试：字符串计数字段与整数计数字段的聚合、排序耗时对比
+
+分别以VARCHAR和INTEGER类型建立user_stats表并写入相同数据，比较：
+- 求和：SUM(CAST(total_taps AS INTEGER)) 与 SUM(total_taps)
+- 取前100名：ORDER BY CAST(total_taps AS INTEGER) 与 ORDER BY total_taps（均无索引，全表排序）
+- 取前100名（有索引）：字符串列需表达式索引，整数列可直接使用普通索引
+
+用法: python bench_integer_columns.py [--rows N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+QUERIES = {
+    "sum": (
+        "SELECT SUM(CAST(total_taps AS INTEGER)) FROM user_stats",
+        "SELECT SUM(total_taps) FROM user_stats",
+    ),
+    "top100": (
+        "SELECT user_id FROM user_stats ORDER BY CAST(total_taps AS INTEGER) DESC LIMIT 100",
+        "SELECT user_id FROM user_stats ORDER BY total_taps DESC LIMIT 100",
+    ),
+    "consecutive+1": (
+        "SELECT MAX(CAST(consecutive_days AS INTEGER) + 1) FROM user_stats",
+        "SELECT MAX(consecutive_days + 1) FROM user_stats",
+    ),
+}
+
+def build(path: str, column_type: str, rows: list):
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+        CREATE TABLE user_stats (
+            id VARCHAR PRIMARY KEY,
+            user_id VARCHAR,
+            total_taps {column_type},
+            today_taps {column_type},
+            consecutive_days {column_type}
+        )
+    """)
+    conn.executemany("INSERT INTO user_stats VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return conn
+
+def timed(conn, sql: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="字符串与整数计数字段基准测试")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    rows = [
+        (str(i), str(i), rng.randint(0, 5000000), rng.randint(0, 20000), rng.randint(0, 365))
+        for i in range(args.rows)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_conn = build(os.path.join(directory, "text.db"), "VARCHAR", rows)
+        int_conn = build(os.path.join(directory, "int.db"), "INTEGER", rows)
+
+        print(f"行数: {args.rows}，每项取{args.repeat}次中的最快值")
+        print(f"{'查询':<24}{'字符串(ms)':>12}{'整数(ms)':>12}{'加速':>8}")
+        for name, (text_sql, int_sql) in QUERIES.items():
+            text_ms = timed(text_conn, text_sql, args.repeat) * 1000
+            int_ms = timed(int_conn, int_sql, args.repeat) * 1000
+            print(f"{name:<24}{text_ms:>12.2f}{int_ms:>12.2f}{text_ms / int_ms:>7.1f}x")
+
+        # 建索引后取前100名
+        text_conn.execute("CREATE INDEX ix_text ON user_stats (CAST(total_taps AS INTEGER))")
+        int_conn.execute("CREATE INDEX ix_int ON user_stats (total_taps)")
+        text_ms = timed(text_conn, QUERIES["top100"][0], args.repeat) * 1000
+        int_ms = timed(int_conn, QUERIES["top100"][1], args.repeat) * 1000
+        print(f"{'top100(indexed)':<24}{text_ms:>12.2f}{int_ms:>12.2f}{text_ms / int_ms:>7.1f}x")
+
+        text_conn.close()
+        int_conn.close()
+        text_size = os.path.getsize(os.path.join(directory, "text.db"))
+        int_size = os.path.getsize(os.path.join(directory, "int.db"))
+        print(f"数据库大小（含索引）: 字符串 {text_size // 1024} KB，整数 {int_size // 1024} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+基准测试：时间有序主键与随机主键的插入吞吐及索引大小对比
+
+以与模型一致的字符串主键建表（主键自带索引外另有user_id二级索引），分批插入相同行数，比较：
+- 时间有序ID（id_generator，19位十进制字符串）
+- 随机ID（uuid4十六进制字符串）
+- 随机ID（19位随机十进制字符串，与有序ID等长，排除键长差异）
+
+随机主键插入到B树任意位置，索引超出页缓存后每批插入都要读入并改写大量分散的页；
+有序主键总是写入最右侧叶子页，每批只改写少数几页。
+
+用法: python bench_primary_keys.py [--rows N] [--batch N] [--cache-kb N]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from id_generator import IdGenerator
+
+def ordered_ids():
+    generator = IdGenerator(node_id=1)
+    while True:
+        yield str(generator.next_id())
+
+def uuid_ids():
+    while True:
+        yield uuid.uuid4().hex
+
+def random_numeric_ids():
+    rng = random.Random(1)
+    while True:
+        yield str(rng.randrange(10 ** 18, 10 ** 19))
+
+ID_SOURCES = {
+    "ordered": ordered_ids,
+    "uuid4": uuid_ids,
+    "random19": random_numeric_ids,
+}
+
+def run(name: str, directory: str, rows: int, batch: int, cache_kb: int) -> dict:
+    path = os.path.join(directory, f"{name}.db")
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA cache_size = -{cache_kb}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("""
+        CREATE TABLE meditation_sessions (
+            id VARCHAR NOT NULL PRIMARY KEY,
+            user_id VARCHAR,
+            duration INTEGER,
+            tap_count INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX ix_user ON meditation_sessions (user_id)")
+
+    ids = ID_SOURCES[name]()
+    rng = random.Random(2)
+    started = time.perf_counter()
+    for _ in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO meditation_sessions VALUES (?, ?, ?, ?)",
+            [(next(ids), str(rng.randrange(100000)), rng.randrange(3600), rng.randrange(5000)) for _ in range(batch)]
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    # dbstat需SQLite编译时启用SQLITE_ENABLE_DBSTAT_VTAB，不可用时只报告文件大小
+    try:
+        pk_bytes, pk_used = conn.execute(
+            "SELECT SUM(pgsize), SUM(pgsize - unused) FROM dbstat "
+            "WHERE name = 'sqlite_autoindex_meditation_sessions_1'"
+        ).fetchone()
+        fill = pk_used / pk_bytes
+    except sqlite3.OperationalError:
+        pk_bytes, fill = None, None
+    conn.close()
+    return {
+        "name": name,
+        "rows_per_sec": rows / elapsed,
+        "elapsed": elapsed,
+        "pk_index_kb": pk_bytes // 1024 if pk_bytes else None,
+        "pk_fill": fill,
+        "file_kb": os.path.getsize(path) // 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="时间有序主键与随机主键基准测试")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=1000, help="每个事务插入的行数")
+    parser.add_argument("--cache-kb", type=int, default=8192, help="页缓存大小（KB），小于索引大小时差异更明显")
+    args = parser.parse_args()
+
+    print(f"行数: {args.rows}，每事务 {args.batch} 行，页缓存 {args.cache_kb} KB")
+    print(f"{'主键':<10}{'行/秒':>10}{'耗时(s)':>10}{'主键索引(KB)':>14}{'页填充率':>10}{'文件(KB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ID_SOURCES:
+            result = run(name, directory, args.rows, args.batch, args.cache_kb)
+            index_kb = result["pk_index_kb"] if result["pk_index_kb"] is not None else "-"
+            fill = f"{result['pk_fill']:.0%}" if result["pk_fill"] is not None else "-"
+            print(f"{result['name']:<10}{result['rows_per_sec']:>10.0f}{result['elapsed']:>10.2f}"
+                  f"{index_kb:>14}{fill:>10}{result['file_kb']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+成就及分享任务目录缓存
+
+目录只在运营修改时变化，每个目录维护一个进程内版本号，写入目录后递增版本号，
+已缓存的序列化响应随即失效。命中时直接返回缓存的JSON字节，不打开数据库会话；
+未命中时才打开只读会话查询并序列化。
+
+版本号仅在本进程内有效：直接修改数据库或多进程部署时，需对每个进程调用
+POST /admin/catalog/invalidate。
+"""
+
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Response
+
+from response_cache import CachedResponse, ResponseCache
+
+ACHIEVEMENTS = "achievements"
+SHARE_TASKS = "share_tasks"
+CATALOGS = (ACHIEVEMENTS, SHARE_TASKS)
+
+class CatalogCache:
+    """按版本号失效的目录缓存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {name: 0 for name in CATALOGS}
+        self._responses = ResponseCache(max_entries=len(CATALOGS))
+
+    def version(self, name: str) -> int:
+        return self._versions[name]
+
+    def invalidate(self, name: str = None) -> Dict[str, int]:
+        """递增目录版本号（不指定时递增全部目录），返回当前各目录版本号"""
+        names = CATALOGS if name is None else (name,)
+        with self._lock:
+            for catalog in names:
+                if catalog not in self._versions:
+                    raise KeyError(catalog)
+                self._versions[catalog] += 1
+            return dict(self._versions)
+
+    async def get(self, name: str, render: Callable[[], Awaitable[bytes]]) -> CachedResponse:
+        """返回目录的序列化响应，版本变化后调用render重新生成"""
+        return await self._responses.get_or_compute_async(name, self.version(name), render)
+
+    @property
+    def hits(self) -> int:
+        return self._responses.hits
+
+    @property
+    def misses(self) -> int:
+        return self._responses.misses
+
+    def snapshot(self) -> dict:
+        return {"versions": dict(self._versions), "hits": self.hits, "misses": self.misses}
+
+# 全局目录缓存
+catalog_cache = CatalogCache()
+
+async def catalog_response(name: str, render: Callable[[], Awaitable[bytes]],
+                           if_none_match: Optional[str]) -> Response:
+    """经目录缓存返回序列化的目录，客户端携带相同ETag时返回304"""
+    cached = await catalog_cache.get(name, render)
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if cached.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
@@ -11,8 +11,11 @@ from httpx import AsyncClient
 from faker import Faker
 import asyncio
 
+# 敲击事件日志写入临时目录
+os.environ.setdefault("TAP_LOG_DIR", tempfile.mkdtemp(prefix="tap_log_"))
+
 from main import app
-from database import Base, engine, SessionLocal, get_db
+from database import Base, engine, SessionLocal
 from models import User, MeditationSession, Achievement, UserAchievement
 import crud
 import schemas
@@ -130,14 +133,7 @@ def meditation_sessions(client, created_user):
 
 @pytest.fixture(autouse=True)
 def enable_db_access_for_all_tests(db):
-    """为所有测试启用数据库访问"""
-    def override_get_db():
-        try:
-            yield db
-        finally:
-            pass
-    
-    app.dependency_overrides[get_db] = override_get_db
+    """为所有测试启用数据库访问，测试结束后清除数据及依赖替换"""
     yield
     app.dependency_overrides.clear()
 
@@ -1,22 +1,43 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 import models, schemas
-from typing import Optional, List
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy import Column, desc
+from sqlalchemy import Column, and_, desc, select, update, delete, bindparam, func, text, tuple_, literal, Integer, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from periods import UTC_OFFSET_HOURS
+from profile_cache import profile_cache
+from identity_cache import identity_cache
+
+# 批量写入时IN查询的分块大小（低于SQLite变量数上限）
+BULK_CHUNK_SIZE = 500
+
+# 同一手机号两次发送验证码的最小间隔
+SEND_CODE_INTERVAL = timedelta(minutes=5)
+
+# 修改users表的函数在提交后使profile_cache中该用户的资料失效，新增写入路径时需一并处理。
+
+# 请求路径上的函数均为异步，接收AsyncSession；后台线程（敲击落库、榜单快照、日切）
+# 使用的函数保持同步，接收Session。迁移期间同步函数可在异步会话中通过
+# await db.run_sync(lambda session: crud.xxx(session, ...)) 调用。
 
 # 用户相关
 
-def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.username == username).first()
+async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await db.get(models.User, user_id)
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.username == username).limit(1))
 
-def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.email == email).limit(1))
 
-def get_user_by_phone(db: Session, phone: str) -> Optional[models.User]:
+async def get_user_by_phone(db: AsyncSession, phone: str) -> Optional[models.User]:
     """根据手机号查询用户"""
-    return db.query(models.User).filter(models.User.phone == phone).first()
+    return await db.scalar(select(models.User).where(models.User.phone == phone).limit(1))
 
-def create_user(db: Session, user: schemas.UserCreate, hashed_password: str) -> models.User:
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str) -> models.User:
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -25,11 +46,12 @@ def create_user(db: Session, user: schemas.UserCreate, hashed_password: str) ->
         avatar=user.avatar
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    profile_cache.invalidate(db_user.id)
     return db_user
 
-def create_user_by_phone(db: Session, user: schemas.UserCreateByPhone) -> models.User:
+async def create_user_by_phone(db: AsyncSession, user: schemas.UserCreateByPhone) -> models.User:
     """通过手机号创建用户（无密码）"""
     db_user = models.User(
         username=user.username,
@@ -37,29 +59,93 @@ def create_user_by_phone(db: Session, user: schemas.UserCreateByPhone) -> models
         avatar=user.avatar
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    profile_cache.invalidate(db_user.id)
     return db_user
 
+async def update_user_region(db: AsyncSession, user_id: int, province: Optional[str], city: Optional[str]):
+    """更新用户地区"""
+    user = await db.get(models.User, user_id)
+    if user:
+        setattr(user, 'province', province)
+        setattr(user, 'city', city)
+        await db.commit()
+        await db.refresh(user)
+        profile_cache.invalidate(user_id)
+    return user
+
+async def add_friend(db: AsyncSession, user_id: int, friend_id: int):
+    """添加双向好友关系，已存在时忽略"""
+    pairs = {(str(user_id), str(friend_id)), (str(friend_id), str(user_id))}
+    result = await db.execute(select(models.Friendship.user_id, models.Friendship.friend_id).where(
+        ((models.Friendship.user_id == str(user_id)) & (models.Friendship.friend_id == str(friend_id))) |
+        ((models.Friendship.user_id == str(friend_id)) & (models.Friendship.friend_id == str(user_id)))
+    ))
+    missing = pairs - {tuple(row) for row in result}
+    if not missing:
+        return
+    now = datetime.utcnow()
+    db.add_all([models.Friendship(user_id=a, friend_id=b, created_at=now) for a, b in missing])
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 并发添加时对方已写入
+        await db.rollback()
+
+async def remove_friend(db: AsyncSession, user_id: int, friend_id: int):
+    """删除双向好友关系"""
+    await db.execute(delete(models.Friendship).where(
+        ((models.Friendship.user_id == str(user_id)) & (models.Friendship.friend_id == str(friend_id))) |
+        ((models.Friendship.user_id == str(friend_id)) & (models.Friendship.friend_id == str(user_id)))
+    ))
+    await db.commit()
+
+async def get_friend_ids(db: AsyncSession, user_id: int) -> List[str]:
+    """获取用户的好友ID"""
+    result = await db.scalars(select(models.Friendship.friend_id).where(models.Friendship.user_id == str(user_id)))
+    return list(result)
+
 # 第三方认证相关
 
-def get_third_party_auth(db: Session, platform: str, platform_user_id: str) -> Optional[models.ThirdPartyAuth]:
+async def get_third_party_auth(db: AsyncSession, platform: str, platform_user_id: str) -> Optional[models.ThirdPartyAuth]:
     """根据平台和平台用户ID查询第三方认证信息"""
-    return db.query(models.ThirdPartyAuth).filter(
+    return await db.scalar(select(models.ThirdPartyAuth).where(
         models.ThirdPartyAuth.platform == platform,
         models.ThirdPartyAuth.platform_user_id == platform_user_id
-    ).first()
-
-def get_user_by_third_party(db: Session, platform: str, platform_user_id: str) -> Optional[models.User]:
-    """根据第三方平台信息查询用户"""
-    auth = get_third_party_auth(db, platform, platform_user_id)
-    if auth:
-        return db.query(models.User).filter(models.User.id == auth.user_id).first()
-    return None
-
-def create_third_party_auth(db: Session, user_id: Column, platform: str, platform_user_id: str, 
-                           access_token: Optional[str] = None, refresh_token: Optional[str] = None,
-                           expires_at: Optional[datetime] = None) -> models.ThirdPartyAuth:
+    ).limit(1))
+
+async def resolve_third_party(db: AsyncSession, platform: str,
+                              platform_user_id: str) -> Optional[Tuple[models.User, models.ThirdPartyAuth]]:
+    """认证记录与用户一次联表查询，返回(用户, 认证记录)，结果写入身份缓存"""
+    row = (await db.execute(
+        select(models.User, models.ThirdPartyAuth)
+        .join(models.ThirdPartyAuth, models.ThirdPartyAuth.user_id == models.User.id)
+        .where(
+            models.ThirdPartyAuth.platform == platform,
+            models.ThirdPartyAuth.platform_user_id == platform_user_id
+        ).limit(1)
+    )).first()
+    if row is None:
+        return None
+    identity_cache.put(platform, platform_user_id, row[0].id)
+    return row[0], row[1]
+
+async def get_user_by_third_party(db: AsyncSession, platform: str, platform_user_id: str) -> Optional[models.User]:
+    """根据第三方平台信息查询用户：身份已缓存时按主键读取用户，否则联表查询"""
+    user_id = identity_cache.get(platform, platform_user_id)
+    if user_id is not None:
+        user = await db.get(models.User, user_id)
+        if user:
+            return user
+        identity_cache.invalidate(platform, platform_user_id)
+
+    resolved = await resolve_third_party(db, platform, platform_user_id)
+    return resolved[0] if resolved else None
+
+async def create_third_party_auth(db: AsyncSession, user_id: Column, platform: str, platform_user_id: str,
+                                  access_token: Optional[str] = None, refresh_token: Optional[str] = None,
+                                  expires_at: Optional[datetime] = None) -> models.ThirdPartyAuth:
     """创建第三方认证记录"""
     auth = models.ThirdPartyAuth(
         user_id=user_id,
@@ -70,46 +156,55 @@ def create_third_party_auth(db: Session, user_id: Column, platform: str, platfor
         expires_at=expires_at
     )
     db.add(auth)
-    db.commit()
-    db.refresh(auth)
+    await db.commit()
+    await db.refresh(auth)
+    identity_cache.put(platform, platform_user_id, user_id)
     return auth
 
-def update_third_party_auth(db: Session, auth_id: Column, update_data: dict):
-    """更新第三方认证信息"""
-    db_auth = db.query(models.ThirdPartyAuth).filter(models.ThirdPartyAuth.id == auth_id).first()
+async def update_third_party_auth(db: AsyncSession, auth_id: Column, update_data: dict):
+    """更新第三方认证信息，没有字段变化时不写入"""
+    db_auth = await db.get(models.ThirdPartyAuth, auth_id)
     if db_auth:
+        changed = False
         for key, value in update_data.items():
-            if hasattr(db_auth, key):
+            if hasattr(db_auth, key) and getattr(db_auth, key) != value:
                 setattr(db_auth, key, value)
-        db.commit()
-        db.refresh(db_auth)
+                changed = True
+        if changed:
+            await db.commit()
+            await db.refresh(db_auth)
     return db_auth
 
-def update_user_backup_phone(db: Session, user_id: int, backup_phone: str):
+async def update_user_backup_phone(db: AsyncSession, user_id: int, backup_phone: str):
     """更新用户备份手机号"""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user:
         setattr(db_user, 'backup_phone', backup_phone)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        profile_cache.invalidate(user_id)
     return db_user
 
-def verify_user_phone(db: Session, user_id: int):
+async def verify_user_phone(db: AsyncSession, user_id: int):
     """验证用户手机号"""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user:
         setattr(db_user, 'is_phone_verified', True)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        profile_cache.invalidate(user_id)
     return db_user
 
-def get_users_by_login_type(db: Session, login_type: str, skip: int = 0, limit: int = 100):
+async def get_users_by_login_type(db: AsyncSession, login_type: str, skip: int = 0, limit: int = 100):
     """根据登录类型获取用户列表"""
-    return db.query(models.User).filter(models.User.login_type == login_type).offset(skip).limit(limit).all()
+    result = await db.scalars(
+        select(models.User).where(models.User.login_type == login_type).offset(skip).limit(limit)
+    )
+    return result.all()
 
-def bind_phone_to_third_party_user(db: Session, user_id: int, phone: str):
+async def bind_phone_to_third_party_user(db: AsyncSession, user_id: int, phone: str):
     """为第三方登录用户绑定手机号"""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if db_user and getattr(db_user, 'login_type') in ['apple', 'wechat']:
         # 如果用户已有手机号，将其设为备份手机号
         current_phone = getattr(db_user, 'phone', None)
@@ -117,11 +212,12 @@ def bind_phone_to_third_party_user(db: Session, user_id: int, phone: str):
             setattr(db_user, 'backup_phone', current_phone)
         setattr(db_user, 'phone', phone)
         setattr(db_user, 'is_phone_verified', True)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        profile_cache.invalidate(user_id)
     return db_user
 
-def create_user_by_third_party(db: Session, user_info: schemas.ThirdPartyUserInfo) -> models.User:
+async def create_user_by_third_party(db: AsyncSession, user_info: schemas.ThirdPartyUserInfo) -> models.User:
     """通过第三方信息创建用户"""
     db_user = models.User(
         username=user_info.username,
@@ -131,119 +227,354 @@ def create_user_by_third_party(db: Session, user_info: schemas.ThirdPartyUserInf
         is_phone_verified=False
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    profile_cache.invalidate(db_user.id)
     return db_user
 
+async def revoke_session_token(db: AsyncSession, jti: str, user_id: str, expires_at: datetime):
+    """记录已吊销的会话令牌，重复吊销时忽略"""
+    if await db.get(models.RevokedToken, jti) is not None:
+        return
+    db.add(models.RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at, revoked_at=datetime.utcnow()))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+
 # 用户统计
 
-def get_user_stat(db: Session, user_id: int) -> Optional[models.UserStat]:
-    return db.query(models.UserStat).filter(models.UserStat.user_id == user_id).first()
+async def get_user_stat(db: AsyncSession, user_id: int) -> Optional[models.UserStat]:
+    return await db.scalar(select(models.UserStat).where(models.UserStat.user_id == user_id).limit(1))
 
-def create_user_stat(db: Session, user_id: Column) -> models.UserStat:
+async def create_user_stat(db: AsyncSession, user_id: Column) -> models.UserStat:
     stat = models.UserStat(user_id=user_id)
     db.add(stat)
-    db.commit()
-    db.refresh(stat)
+    await db.commit()
+    await db.refresh(stat)
     return stat
 
+def bulk_increment_user_taps(db: Session, increments: Dict[str, int], last_tap_dates: Dict[str, datetime]):
+    """批量累加用户敲击数（单个事务内完成）"""
+    table = models.UserStat.__table__
+    user_ids = list(increments)
+
+    # 补齐尚无统计记录的用户（user_id唯一，每个用户一行；与注册时创建记录并发时以先写入者为准）
+    existing = set()
+    for i in range(0, len(user_ids), BULK_CHUNK_SIZE):
+        chunk = user_ids[i:i + BULK_CHUNK_SIZE]
+        existing.update(row[0] for row in db.execute(select(table.c.user_id).where(table.c.user_id.in_(chunk))))
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        db.execute(sqlite_insert(table).on_conflict_do_nothing(index_elements=[table.c.user_id]), [
+            {"user_id": user_id, "total_taps": 0, "today_taps": 0, "consecutive_days": 0}
+            for user_id in missing
+        ])
+
+    stmt = table.update().where(table.c.user_id == bindparam("uid")).values(
+        total_taps=table.c.total_taps + bindparam("n", type_=Integer),
+        today_taps=table.c.today_taps + bindparam("n", type_=Integer),
+        last_tap_date=func.max(func.coalesce(table.c.last_tap_date, bindparam("t", type_=DateTime)), bindparam("t", type_=DateTime)),
+    )
+    db.execute(stmt, [
+        {"uid": user_id, "n": count, "t": last_tap_dates.get(user_id) or datetime.utcnow()}
+        for user_id, count in increments.items()
+    ])
+    db.commit()
+
+# 敲击分桶统计
+
+def bulk_increment_tap_histogram(db: Session, buckets: Dict[tuple, int]):
+    """批量累加小时分桶敲击数，buckets为{(user_id, 小时起始时间): 敲击数}（由调用方提交事务）"""
+    table = models.TapHistogram.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.granularity, table.c.bucket_start],
+        set_={"taps": table.c.taps + stmt.excluded.taps}
+    )
+    db.execute(stmt, [
+        {"user_id": user_id, "granularity": "hour", "bucket_start": hour, "taps": taps}
+        for (user_id, hour), taps in buckets.items()
+    ])
+
+async def get_tap_histogram(db: AsyncSession, user_id: int, since: datetime) -> List[models.TapHistogram]:
+    """获取用户某时间之后的全部分桶"""
+    result = await db.scalars(select(models.TapHistogram).where(
+        models.TapHistogram.user_id == user_id,
+        models.TapHistogram.bucket_start >= since
+    ).order_by(models.TapHistogram.bucket_start))
+    return result.all()
+
+def compact_tap_histogram(db: Session, before: datetime) -> int:
+    """将早于before的小时分桶按日切时区合并为按天分桶，返回合并的小时桶数"""
+    params = {
+        "before": before,
+        "shift": f"{UTC_OFFSET_HOURS:+d} hours",
+        "unshift": f"{-UTC_OFFSET_HOURS:+d} hours"
+    }
+    # 日桶起始时间需与DateTime列的存储格式一致，否则主键冲突判断会失效
+    db.execute(text("""
+        INSERT INTO tap_histograms (user_id, granularity, bucket_start, taps)
+        SELECT user_id, 'day',
+               strftime('%Y-%m-%d %H:%M:%S', bucket_start, :shift, 'start of day', :unshift) || '.000000',
+               SUM(taps)
+        FROM tap_histograms
+        WHERE granularity = 'hour' AND bucket_start < :before
+        GROUP BY 1, 3
+        ON CONFLICT (user_id, granularity, bucket_start) DO UPDATE SET taps = taps + excluded.taps
+    """).bindparams(bindparam("before", type_=DateTime)), params)
+    result = db.query(models.TapHistogram).filter(
+        models.TapHistogram.granularity == "hour",
+        models.TapHistogram.bucket_start < before
+    ).delete(synchronize_session=False)
+    db.commit()
+    return result
+
 # 冥想会话
 
-def create_meditation_session(db: Session, user_id: int, session: schemas.MeditationSessionCreate) -> models.MeditationSession:
+async def create_meditation_session(db: AsyncSession, user_id: int, session: schemas.MeditationSessionCreate) -> models.MeditationSession:
+    """写入冥想记录；同一客户端批次已写入时返回已有记录"""
     db_session = models.MeditationSession(
         user_id=user_id,
         duration=session.duration,
-        tap_count=session.tap_count
+        tap_count=session.tap_count,
+        client_id=session.client_id,
+        batch_seq=session.batch_seq
     )
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 并发的重试已先写入同一批次
+        await db.rollback()
+        existing = await get_meditation_session_by_batch(db, user_id, session.client_id, session.batch_seq)
+        if existing is None:
+            raise
+        return existing
+    await db.refresh(db_session)
     return db_session
 
-def get_meditation_sessions(db: Session, user_id: int, limit: int = 10) -> List[models.MeditationSession]:
-    return db.query(models.MeditationSession).filter(models.MeditationSession.user_id == user_id).order_by(desc(models.MeditationSession.created_at)).limit(limit).all()
+async def get_meditation_session_by_batch(db: AsyncSession, user_id: int, client_id: Optional[str],
+                                          batch_seq: Optional[int]) -> Optional[models.MeditationSession]:
+    """按客户端批次查找已写入的冥想记录"""
+    if client_id is None or batch_seq is None:
+        return None
+    return await db.scalar(select(models.MeditationSession).where(
+        models.MeditationSession.user_id == str(user_id),
+        models.MeditationSession.client_id == client_id,
+        models.MeditationSession.batch_seq == batch_seq
+    ))
+
+async def get_meditation_sessions(db: AsyncSession, user_id: int, limit: int = 10) -> List[models.MeditationSession]:
+    result = await db.scalars(
+        select(models.MeditationSession).where(models.MeditationSession.user_id == user_id)
+        .order_by(desc(models.MeditationSession.created_at)).limit(limit)
+    )
+    return result.all()
 
 # 成就
 
-def get_achievements(db: Session) -> List[models.Achievement]:
-    return db.query(models.Achievement).all()
+async def get_achievements(db: AsyncSession) -> List[models.Achievement]:
+    result = await db.scalars(select(models.Achievement))
+    return result.all()
 
-def unlock_achievement(db: Session, user_id: int, achievement_id: int) -> models.UserAchievement:
+async def create_achievement(db: AsyncSession, achievement: schemas.AchievementCreate) -> models.Achievement:
+    db_achievement = models.Achievement(**achievement.model_dump())
+    db.add(db_achievement)
+    await db.commit()
+    return db_achievement
+
+async def unlock_achievement(db: AsyncSession, user_id: int, achievement_id: int) -> models.UserAchievement:
     ua = models.UserAchievement(user_id=user_id, achievement_id=achievement_id)
     db.add(ua)
-    db.commit()
-    db.refresh(ua)
+    await db.commit()
+    # 异步会话不能延迟加载关系，响应需要的成就信息在此一并加载
+    await db.refresh(ua, ["unlocked_at", "achievement"])
     return ua
 
-def get_user_achievements(db: Session, user_id: int) -> List[models.UserAchievement]:
-    return db.query(models.UserAchievement).filter(models.UserAchievement.user_id == user_id).all()
+async def get_user_achievements(db: AsyncSession, user_id: int) -> List[models.UserAchievement]:
+    result = await db.scalars(
+        select(models.UserAchievement).where(models.UserAchievement.user_id == user_id)
+        .options(selectinload(models.UserAchievement.achievement))
+    )
+    return result.all()
 
 # 排行榜
 
-def get_leaderboard(db: Session, period: str, limit: int = 10) -> List[models.Leaderboard]:
-    # 使用 join 连接 User 表，以便获取用户名
-    return db.query(models.Leaderboard).join(models.User, models.Leaderboard.user_id == models.User.id).filter(models.Leaderboard.period == period).order_by(models.Leaderboard.rank).limit(limit).all()
+# 榜单读取列，均包含在(period, rank)覆盖索引中
+LEADERBOARD_COLUMNS = (
+    models.Leaderboard.user_id,
+    models.Leaderboard.period,
+    models.Leaderboard.rank,
+    models.Leaderboard.tap_count,
+    models.Leaderboard.created_at,
+    func.coalesce(models.Leaderboard.username, "").label("username"),
+    models.Leaderboard.avatar,
+)
+
+def current_board(period: str):
+    """周期当前生效代次的榜单行条件；代次取自leaderboard_generations的单行主键查询，作为常量参与索引匹配"""
+    generation = select(models.LeaderboardGeneration.generation).where(
+        models.LeaderboardGeneration.period == period
+    ).scalar_subquery()
+    return and_(models.Leaderboard.period == period, models.Leaderboard.generation == func.coalesce(generation, 0))
+
+def get_leaderboard_generation(db: Session, period: str) -> int:
+    """周期当前生效的榜单代次，尚未切换过的周期为0"""
+    pointer = db.get(models.LeaderboardGeneration, period)
+    return pointer.generation if pointer else 0
+
+async def get_leaderboard(db: AsyncSession, period: str, limit: int = 10) -> list:
+    # 用户名取自榜单行中的快照，无需关联users表
+    result = await db.execute(select(*LEADERBOARD_COLUMNS).where(
+        current_board(period)
+    ).order_by(models.Leaderboard.rank).limit(limit))
+    return result.all()
+
+async def get_leaderboard_entry(db: AsyncSession, period: str, user_id: int) -> Optional[models.Leaderboard]:
+    """获取用户在某周期榜单中的记录"""
+    return await db.scalar(select(models.Leaderboard).where(
+        current_board(period),
+        models.Leaderboard.user_id == user_id
+    ).limit(1))
+
+async def get_leaderboard_neighbours(db: AsyncSession, period: str, rank: int, user_id, k: int) -> list:
+    """按(名次, 用户ID)的行位置获取用户所在行及前后各k行
+
+    并列名次的整段同分用户不会全部返回，结果至多2k+1行。
+    """
+    position = tuple_(models.Leaderboard.rank, models.Leaderboard.user_id)
+    own = tuple_(literal(rank), literal(str(user_id)))
+    above = await db.execute(select(*LEADERBOARD_COLUMNS).where(
+        current_board(period),
+        position < own
+    ).order_by(models.Leaderboard.rank.desc(), models.Leaderboard.user_id.desc()).limit(k))
+    below = await db.execute(select(*LEADERBOARD_COLUMNS).where(
+        current_board(period),
+        position >= own
+    ).order_by(models.Leaderboard.rank, models.Leaderboard.user_id).limit(k + 1))
+    return list(reversed(above.all())) + below.all()
+
+async def get_regional_leaderboard(db: AsyncSession, period: str, province: str, city: Optional[str], limit: int) -> list:
+    """按全国名次顺序读取省份或城市的前N名"""
+    statement = select(*LEADERBOARD_COLUMNS).where(
+        current_board(period),
+        models.Leaderboard.province == province
+    )
+    if city is not None:
+        statement = statement.where(models.Leaderboard.city == city)
+    result = await db.execute(statement.order_by(models.Leaderboard.rank).limit(limit))
+    return result.all()
+
+async def get_friend_leaderboard(db: AsyncSession, period: str, user_ids: List[str]) -> list:
+    """按全国名次顺序读取给定用户的榜单记录"""
+    if not user_ids:
+        return []
+    result = await db.execute(select(*LEADERBOARD_COLUMNS).where(
+        current_board(period),
+        models.Leaderboard.user_id.in_(user_ids)
+    ).order_by(models.Leaderboard.rank))
+    return result.all()
+
+def fill_leaderboard_display(db: Session, period: str):
+    """从users表写入榜单行的用户展示信息及地区快照（由调用方提交事务）"""
+    db.execute(text("""
+        UPDATE leaderboard
+        SET (username, avatar, province, city) = (
+            SELECT username, avatar, province, city FROM users WHERE users.id = leaderboard.user_id
+        )
+        WHERE period = :period
+    """), {"period": period})
+
+async def get_usernames(db: AsyncSession, user_ids: List[str]) -> Dict[str, str]:
+    """批量获取用户名"""
+    if not user_ids:
+        return {}
+    result = await db.execute(select(models.User.id, models.User.username).where(models.User.id.in_(user_ids)))
+    return {str(user_id): username for user_id, username in result}
+
+def get_user_display(db: Session, user_ids: List[str]) -> Dict[str, tuple]:
+    """批量查询用户地区及展示信息，返回{用户ID: ((省份, 城市), (用户名, 头像))}"""
+    if not user_ids:
+        return {}
+    rows = db.query(
+        models.User.id, models.User.province, models.User.city, models.User.username, models.User.avatar
+    ).filter(models.User.id.in_(user_ids)).all()
+    return {
+        str(user_id): ((province or "", city or ""), (username or "", avatar))
+        for user_id, province, city, username, avatar in rows
+    }
 
 # 分享任务
 
-def get_share_tasks(db: Session) -> List[models.ShareTask]:
-    return db.query(models.ShareTask).all()
+async def get_share_tasks(db: AsyncSession) -> List[models.ShareTask]:
+    result = await db.scalars(select(models.ShareTask))
+    return result.all()
 
-def complete_share_task(db: Session, user_id: int, task_id: int) -> models.UserShareTask:
+async def create_share_task(db: AsyncSession, task: schemas.ShareTaskCreate) -> models.ShareTask:
+    db_task = models.ShareTask(**task.model_dump())
+    db.add(db_task)
+    await db.commit()
+    return db_task
+
+async def complete_share_task(db: AsyncSession, user_id: int, task_id: int) -> models.UserShareTask:
     ust = models.UserShareTask(user_id=user_id, task_id=task_id, completed=True, completed_at=datetime.utcnow())
     db.add(ust)
-    db.commit()
-    db.refresh(ust)
+    await db.commit()
+    await db.refresh(ust, ["completed", "completed_at", "task"])
     return ust
 
-def get_user_share_tasks(db: Session, user_id: int) -> List[models.UserShareTask]:
-    return db.query(models.UserShareTask).filter(models.UserShareTask.user_id == user_id).all()
+async def get_user_share_tasks(db: AsyncSession, user_id: int) -> List[models.UserShareTask]:
+    result = await db.scalars(
+        select(models.UserShareTask).where(models.UserShareTask.user_id == user_id)
+        .options(selectinload(models.UserShareTask.task))
+    )
+    return result.all()
 
 # 验证码相关
 
-def can_send_verification_code(db: Session, phone: str) -> bool:
+async def can_send_verification_code(db: AsyncSession, phone: str) -> bool:
     """检查是否可以发送验证码（5分钟内只能发送一次）"""
-    from datetime import datetime, timedelta
-    
     # 检查5分钟内是否已发送过验证码
-    five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
-    recent_code = db.query(models.VerificationCode).filter(
+    five_minutes_ago = datetime.utcnow() - SEND_CODE_INTERVAL
+    recent_code = await db.scalar(select(models.VerificationCode.id).where(
         models.VerificationCode.phone == phone,
         models.VerificationCode.created_at > five_minutes_ago
-    ).first()
-    
+    ).limit(1))
+
     return recent_code is None
 
-def create_verification_code(db: Session, phone: str, code: str, expires_at: datetime) -> models.VerificationCode:
+async def create_verification_code(db: AsyncSession, phone: str, code: str, expires_at: datetime) -> models.VerificationCode:
     """创建验证码记录"""
-    # 先将该手机号之前的验证码标记为已使用
-    db.query(models.VerificationCode).filter(
+    # 先将该手机号之前仍有效的验证码标记为已使用（过期记录由后台清理，表中每个手机号只有少量记录）
+    await db.execute(update(models.VerificationCode).where(
         models.VerificationCode.phone == phone,
-        models.VerificationCode.used == False
-    ).update({models.VerificationCode.used: True})
-    
+        models.VerificationCode.used == False,
+        models.VerificationCode.expires_at > datetime.utcnow()
+    ).values(used=True))
+
     db_code = models.VerificationCode(
         phone=phone,
         code=code,
         expires_at=expires_at
     )
     db.add(db_code)
-    db.commit()
-    db.refresh(db_code)
+    await db.commit()
+    await db.refresh(db_code)
     return db_code
 
-def get_valid_verification_code(db: Session, phone: str, code: str) -> Optional[models.VerificationCode]:
+async def get_valid_verification_code(db: AsyncSession, phone: str, code: str) -> Optional[models.VerificationCode]:
     """获取有效的验证码"""
-    return db.query(models.VerificationCode).filter(
+    return await db.scalar(select(models.VerificationCode).where(
         models.VerificationCode.phone == phone,
         models.VerificationCode.code == code,
         models.VerificationCode.used == False,
         models.VerificationCode.expires_at > datetime.utcnow()
-    ).first()
+    ).limit(1))
 
-def use_verification_code(db: Session, code_id: Column):
+async def use_verification_code(db: AsyncSession, code_id: Column):
     """标记验证码为已使用"""
-    db.query(models.VerificationCode).filter(
+    await db.execute(update(models.VerificationCode).where(
         models.VerificationCode.id == code_id
-    ).update({models.VerificationCode.used: True})
-    db.commit()
\ No newline at end of file
+    ).values(used=True))
+    await db.commit()
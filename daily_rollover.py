@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import text, bindparam, DateTime
+
+from database import SessionLocal
+from periods import local_today, day_start_utc
+from tap_aggregator import tap_aggregator
+from tap_log import tap_event_log
+from leaderboard_archive import archive_closed_periods
+import models
+import crud
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "daily_rollover"
+# 进行中的日切已完成的分块，记录为"日期/已处理的最大rowid"，与分块更新在同一事务中写入
+PROGRESS_JOB_NAME = "daily_rollover_progress"
+
+# 每个分块更新的行数
+CHUNK_SIZE = int(os.getenv('ROLLOVER_CHUNK_SIZE', '50000'))
+# 执行失败后的重试间隔（秒）
+RETRY_INTERVAL = 60
+# 小时分桶的保留天数，之前的合并为日桶
+HISTOGRAM_HOURLY_RETENTION_DAYS = int(os.getenv('HISTOGRAM_HOURLY_RETENTION_DAYS', '7'))
+
+# 是否在日切当天敲击由当天的敲击分桶判断，不受零点之后敲击更新last_tap_date的影响；
+# 零点之后已有敲击的用户只扣除当天的敲击数，保留新一天的部分
+ROLLOVER_SQL = text("""
+    UPDATE user_stats
+    SET consecutive_days = CASE
+            WHEN EXISTS (
+                SELECT 1 FROM tap_histograms h
+                WHERE h.user_id = user_stats.user_id
+                  AND h.bucket_start >= :day_start AND h.bucket_start < :next_day_start
+            ) THEN consecutive_days + 1
+            ELSE 0
+        END,
+        today_taps = CASE
+            WHEN last_tap_date >= :next_day_start THEN MAX(today_taps - COALESCE((
+                SELECT SUM(h.taps) FROM tap_histograms h
+                WHERE h.user_id = user_stats.user_id
+                  AND h.bucket_start >= :day_start AND h.bucket_start < :next_day_start
+            ), 0), 0)
+            ELSE 0
+        END
+    WHERE rowid > :low AND rowid <= :high
+""").bindparams(bindparam("day_start", type_=DateTime), bindparam("next_day_start", type_=DateTime))
+
+def run_daily_rollover(closing_day: date, session_factory=SessionLocal, chunk_size: int = CHUNK_SIZE,
+                       progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """执行日切
+
+    对closing_day有敲击的用户连续天数加一，其余用户清零，并重置今日敲击数。
+    按rowid区间分块执行集合更新，每块单独提交，避免长事务锁表；每块与进度记录一同提交，
+    失败重试时从未完成的分块继续，已更新的行不会重复加一。
+
+    Returns:
+        dict: 运行指标
+    """
+    started = time.monotonic()
+    metrics = {
+        'day': closing_day.isoformat(),
+        'rows': 0,
+        'chunks': 0,
+        'elapsed': 0.0
+    }
+
+    db = session_factory()
+    try:
+        max_rowid = db.execute(text("SELECT MAX(rowid) FROM user_stats")).scalar() or 0
+        params = {'day_start': day_start_utc(closing_day), 'next_day_start': day_start_utc(closing_day + timedelta(days=1))}
+        day, _, done = (get_last_run_key(db, PROGRESS_JOB_NAME) or "").partition("/")
+        start = int(done) if day == closing_day.isoformat() else 0
+        for low in range(start, max_rowid, chunk_size):
+            result = db.execute(ROLLOVER_SQL, dict(params, low=low, high=low + chunk_size))
+            set_job_run(db, PROGRESS_JOB_NAME, f"{closing_day.isoformat()}/{low + chunk_size}")
+            db.commit()
+            metrics['rows'] += result.rowcount
+            metrics['chunks'] += 1
+            metrics['elapsed'] = time.monotonic() - started
+            logger.debug(f"日切进度: {min(low + chunk_size, max_rowid)}/{max_rowid}")
+            if progress:
+                progress(dict(metrics))
+
+        record_job_run(db, JOB_NAME, closing_day.isoformat())
+    finally:
+        db.close()
+
+    metrics['elapsed'] = time.monotonic() - started
+    logger.info(f"日切完成: {metrics['day']}，更新 {metrics['rows']} 行，"
+                f"{metrics['chunks']} 块，耗时 {metrics['elapsed']:.2f} 秒")
+    return metrics
+
+def get_last_run_key(db, name: str) -> Optional[str]:
+    """获取任务最近一次完成的批次标识"""
+    job = db.query(models.JobRun).filter(models.JobRun.name == name).first()
+    return job.last_run_key if job else None
+
+def set_job_run(db, name: str, run_key: str):
+    """更新任务运行记录（由调用方提交事务）"""
+    job = db.query(models.JobRun).filter(models.JobRun.name == name).first()
+    if not job:
+        job = models.JobRun(name=name)
+        db.add(job)
+    job.last_run_key = run_key
+    job.finished_at = datetime.utcnow()
+
+def record_job_run(db, name: str, run_key: str):
+    """记录任务完成"""
+    set_job_run(db, name, run_key)
+    db.commit()
+
+class DailyRolloverScheduler:
+    """日切调度器
+
+    在日切时区的零点先刷新敲击缓冲区，归档已结束周期的排行榜后执行日切，随后合并过期的小时分桶并压缩敲击日志；
+    启动时按上次完成的日期逐日补跑错过的日切。
+    """
+
+    def __init__(self, aggregator=None, session_factory=SessionLocal, event_log=None):
+        self.aggregator = aggregator
+        self.event_log = event_log
+        self.session_factory = session_factory
+        self.last_metrics: Optional[dict] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_pending(self):
+        """对上次日切之后至上一自然日的每一天依次执行日切，每天单独记录完成"""
+        yesterday = local_today() - timedelta(days=1)
+        db = self.session_factory()
+        try:
+            last_key = get_last_run_key(db, JOB_NAME)
+        finally:
+            db.close()
+        closing_day = yesterday if last_key is None else date.fromisoformat(last_key) + timedelta(days=1)
+        if closing_day > yesterday:
+            return None
+
+        if self.aggregator:
+            self.aggregator.flush()
+        while closing_day <= yesterday:
+            # 归档可重复执行，放在日切之前，失败时随日切一起重试
+            archive_closed_periods(closing_day, self.session_factory)
+            self.last_metrics = run_daily_rollover(closing_day, self.session_factory)
+            self.compact_histogram(closing_day)
+            closing_day += timedelta(days=1)
+
+        if self.event_log is not None:
+            # 封存前一日的分段并压缩为每日摘要
+            self.event_log.roll()
+            self.event_log.compact()
+        return self.last_metrics
+
+    def compact_histogram(self, closing_day: date) -> int:
+        """将超出保留期的小时分桶合并为日桶"""
+        before = day_start_utc(closing_day - timedelta(days=HISTOGRAM_HOURLY_RETENTION_DAYS - 1))
+        db = self.session_factory()
+        try:
+            return crud.compact_tap_histogram(db, before)
+        finally:
+            db.close()
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="daily-rollover", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止调度线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _seconds_until_next_day(self) -> float:
+        next_start = day_start_utc(local_today() + timedelta(days=1))
+        return max((next_start - datetime.utcnow()).total_seconds(), 0)
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+                # 零点后稍等片刻，确保跨过日界
+                timeout = self._seconds_until_next_day() + 1
+            except Exception as e:
+                logger.error(f"日切执行失败，稍后重试: {e}")
+                timeout = RETRY_INTERVAL
+            if self._stop_event.wait(timeout):
+                break
+
+# 全局日切调度器
+rollover_scheduler = DailyRolloverScheduler(aggregator=tap_aggregator, event_log=tap_event_log)
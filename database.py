@@ -1,19 +1,174 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Annotated
+
+from fastapi import Depends
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # SQLite数据库URL
 SQLALCHEMY_DATABASE_URL = "sqlite:///./woodenfis.db"
+# 异步引擎URL，默认通过aiosqlite访问同一数据库文件，可换成任意异步驱动（如postgresql+asyncpg://...）
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+
+# SQLite连接参数预设，每个新连接建立时通过PRAGMA设置
+SQLITE_PROFILES = {
+    # 不做任何设置，使用SQLite默认值（回滚日志、synchronous=FULL）
+    "default": {},
+    # 生产环境：WAL日志允许读写并发，NORMAL同步在WAL下只在检查点时fsync，
+    # 写锁冲突时等待而不是立即报“database is locked”
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,  # 毫秒
+        "cache_size": -65536,  # 负数单位为KB，即64MB
+        "mmap_size": 268435456,  # 256MB
+        "temp_store": "MEMORY",
+    },
+}
+
+def get_sqlite_pragmas(profile: str = None) -> dict:
+    """获取连接参数：预设由SQLITE_PROFILE指定，单项可用SQLITE_<参数名>环境变量覆盖"""
+    profile = profile or os.getenv('SQLITE_PROFILE', 'production')
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"未知的SQLite配置: {profile}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES["production"]:
+        value = os.getenv(f'SQLITE_{name.upper()}')
+        if value:
+            if not value.lstrip('-').isalnum():
+                raise ValueError(f"无效的SQLite参数: {name}={value}")
+            pragmas[name] = value
+    return pragmas
+
+def apply_sqlite_pragmas(db_engine, profile: str = None):
+    """为引擎的每个新连接按配置设置PRAGMA（异步引擎传入其sync_engine）"""
+    pragmas = get_sqlite_pragmas(profile)
+
+    @event.listens_for(db_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+class SessionMetrics:
+    """会话及连接池计数：打开的会话数、连接签出次数及签出等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sessions_opened = 0
+            self.readonly_sessions = 0
+            self.pool_checkouts = 0
+            self.pool_wait_seconds = 0.0
+            self.max_pool_wait_seconds = 0.0
+
+    def session_opened(self, read_only: bool = False):
+        with self._lock:
+            self.sessions_opened += 1
+            if read_only:
+                self.readonly_sessions += 1
+
+    def pool_checkout(self, wait: float):
+        with self._lock:
+            self.pool_checkouts += 1
+            self.pool_wait_seconds += wait
+            self.max_pool_wait_seconds = max(self.max_pool_wait_seconds, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "sessions_opened": self.sessions_opened,
+                "readonly_sessions": self.readonly_sessions,
+                "pool_checkouts": self.pool_checkouts,
+                "pool_wait_ms": round(self.pool_wait_seconds * 1000, 3),
+                "max_pool_wait_ms": round(self.max_pool_wait_seconds * 1000, 3),
+            }
+
+session_metrics = SessionMetrics()
+
+def timed_pool_class(url: str):
+    """在驱动默认连接池的基础上记录每次签出的等待时间（含新建连接）"""
+    url = make_url(url)
+    pool_class = url.get_dialect().get_pool_class(url)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            record = super()._do_get()
+            session_metrics.pool_checkout(time.perf_counter() - started)
+            return record
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def create_sqlite_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = None):
+    """创建SQLite引擎，每个新连接按配置设置PRAGMA"""
+    db_engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=timed_pool_class(url))
+    apply_sqlite_pragmas(db_engine, profile)
+    return db_engine
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, profile: str = None):
+    """创建异步引擎，SQLite驱动时同样按配置设置PRAGMA"""
+    db_engine = create_async_engine(url, poolclass=timed_pool_class(url))
+    if db_engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(db_engine.sync_engine, profile)
+    return db_engine
+
+engine = create_sqlite_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# 数据库依赖
+# 异步引擎：路由在事件循环中访问数据库，不占用线程池
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+@asynccontextmanager
+async def async_session_scope(read_only: bool = False, session_factory=None):
+    """异步会话作用域：正常结束时提交未完成的事务，只读会话不提交；出错时回滚
+
+    会话在第一次查询时才签出连接，未访问数据库的请求不占用连接。
+    """
+    session_metrics.session_opened(read_only)
+    async with (session_factory or AsyncSessionLocal)() as db:
+        try:
+            yield db
+            if not read_only and db.in_transaction():
+                await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+
+# 数据库依赖（同步），供尚未迁移到异步会话的调用方使用
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 数据库依赖（异步）
+def get_session_factory() -> async_sessionmaker:
+    """路由会话的唯一来源，测试中通过app.dependency_overrides替换为测试库的会话工厂"""
+    return AsyncSessionLocal
+
+async def get_async_db(session_factory: async_sessionmaker = Depends(get_session_factory)):
+    async with async_session_scope(session_factory=session_factory) as db:
+        yield db
+
+async def get_readonly_db(session_factory: async_sessionmaker = Depends(get_session_factory)):
+    async with async_session_scope(read_only=True, session_factory=session_factory) as db:
+        yield db
+
+# 路由统一使用以下类型声明会话参数：同一请求内共用一个会话，
+# 且在响应发送前结束会话（提交或回滚并归还连接）
+DbSession = Annotated[AsyncSession, Depends(get_async_db, scope="function")]
+ReadOnlyDbSession = Annotated[AsyncSession, Depends(get_readonly_db, scope="function")]
@@ -4,7 +4,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi.testclient import TestClient
 from main import app
-from database import get_db, engine
+from database import engine
 from models import Base, VerificationCode
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
@@ -13,15 +13,6 @@ import json
 # 创建测试数据库
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
 # 创建所有表
 Base.metadata.create_all(bind=engine)
 
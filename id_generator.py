@@ -0,0 +1,124 @@
+"""
+时间有序的主键生成器（雪花算法变体）
+
+生成63位正整数，从高到低依次为：
+- 1位  标志位（第62位）恒为1，使十进制表示恒为19位，字符串比较与数值比较顺序一致
+- 40位 自ID_EPOCH起的毫秒数（约可用34年）
+- 10位 节点号，同时生成ID的每个进程必须不同（见claim_node_id）
+- 12位 同一毫秒内的序号，单节点每毫秒4096个
+
+主键列为字符串类型，新主键总是大于已有主键，插入时追加在主键B树末尾，
+不会像随机ID那样插入到任意页中引起页分裂；同时仍可按int解析，与路由参数兼容。
+
+节点号：
+- 设置ID_NODE_ID时直接使用，多机部署必须为每个进程（如每个uvicorn worker）分配不同的值
+- 未设置时在ID_NODE_LOCK_DIR（默认系统临时目录下的woodenfis-id-nodes）中用文件锁占用一个空闲节点号，
+  同一台机器上的多个进程各自取得不同的节点号，进程退出后锁自动释放
+"""
+
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+# 起始时间（UTC）
+ID_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+TIMESTAMP_BITS = 40
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+MAX_TIMESTAMP = (1 << TIMESTAMP_BITS) - 1
+FLAG = 1 << (TIMESTAMP_BITS + NODE_BITS + SEQUENCE_BITS)
+# 每毫秒可用的ID数，及相邻毫秒同一序号的ID差值
+IDS_PER_MS = SEQUENCE_MASK + 1
+MS_STEP = 1 << (NODE_BITS + SEQUENCE_BITS)
+
+# 持有节点号文件锁的文件对象，进程存活期间不能关闭
+_node_lock_files = []
+
+def claim_node_id(lock_dir: str = None) -> int:
+    """在锁目录中占用一个空闲节点号，用于同一台机器上的多进程部署"""
+    import fcntl
+
+    lock_dir = lock_dir or os.getenv('ID_NODE_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'woodenfis-id-nodes'))
+    os.makedirs(lock_dir, exist_ok=True)
+    for node_id in range(MAX_NODE_ID + 1):
+        lock_file = open(os.path.join(lock_dir, f"{node_id}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            continue
+        _node_lock_files.append(lock_file)
+        return node_id
+    raise RuntimeError("没有空闲的ID节点号，请通过ID_NODE_ID指定")
+
+def default_node_id() -> int:
+    node_id = os.getenv('ID_NODE_ID')
+    if node_id is not None:
+        return int(node_id)
+    return claim_node_id()
+
+class IdGenerator:
+    """线程安全的时间有序ID生成器"""
+
+    def __init__(self, node_id: int = None, clock=time.time):
+        if node_id is None:
+            node_id = default_node_id()
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"节点号超出范围: {node_id}")
+        self.node_id = node_id
+        self._clock = clock
+        self._epoch_ms = int(ID_EPOCH.timestamp() * 1000)
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            # 时钟回拨时沿用上次的时间，保证单调递增
+            now = max(int(self._clock() * 1000) - self._epoch_ms, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # 本毫秒序号用尽时直接使用下一毫秒，不忙等；时钟随后会追上
+                    now += 1
+            else:
+                self._sequence = 0
+            if now > MAX_TIMESTAMP:
+                raise OverflowError("ID时间戳已超出可用范围")
+            self._last_ms = now
+            return FLAG | (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def reserve(self, count: int) -> int:
+        """预留count个ID供批量插入在SQL中生成，返回第一个ID
+
+        预留从下一个未使用的毫秒开始占满整毫秒，第n个（从0起）ID为
+        first + (n // IDS_PER_MS) * MS_STEP + n % IDS_PER_MS，之后生成的ID都大于预留的ID。
+        """
+        if count <= 0:
+            raise ValueError(f"预留数量无效: {count}")
+        with self._lock:
+            start = max(int(self._clock() * 1000) - self._epoch_ms, self._last_ms + 1)
+            last = start + (count - 1) // IDS_PER_MS
+            if last > MAX_TIMESTAMP:
+                raise OverflowError("ID时间戳已超出可用范围")
+            self._last_ms = last
+            self._sequence = SEQUENCE_MASK
+            return FLAG | (start << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS)
+
+def id_timestamp(value) -> datetime:
+    """从ID中解析生成时间（UTC）"""
+    millis = (int(value) >> (NODE_BITS + SEQUENCE_BITS)) & MAX_TIMESTAMP
+    return datetime.fromtimestamp((int(ID_EPOCH.timestamp() * 1000) + millis) / 1000, tz=timezone.utc)
+
+# 全局ID生成器
+id_generator = IdGenerator()
+
+def new_id() -> str:
+    """生成字符串主键，作为各模型id列的默认值"""
+    return str(id_generator.next_id())
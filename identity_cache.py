@@ -0,0 +1,61 @@
+"""
+第三方身份缓存
+
+第三方认证记录创建后(platform, platform_user_id)对应的用户不再变化，按身份缓存用户ID，
+老用户再次登录时直接按主键读取用户，不再联表查询认证记录。容量有上限，按最近使用淘汰。
+只缓存已存在的身份；缓存的用户已不存在时由调用方移除条目并回退到联表查询。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class IdentityCache:
+    """(platform, platform_user_id) -> user_id 的LRU缓存"""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, platform: str, platform_user_id: str) -> Optional[str]:
+        key = (platform, platform_user_id)
+        with self._lock:
+            user_id = self._entries.get(key)
+            if user_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return user_id
+
+    def put(self, platform: str, platform_user_id: str, user_id):
+        with self._lock:
+            self._entries[(platform, platform_user_id)] = str(user_id)
+            self._entries.move_to_end((platform, platform_user_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, platform: str, platform_user_id: str):
+        with self._lock:
+            self._entries.pop((platform, platform_user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# 全局第三方身份缓存
+identity_cache = IdentityCache(max_entries=int(os.getenv('IDENTITY_CACHE_MAX_ENTRIES', '100000')))
@@ -0,0 +1,133 @@
+"""
+JWKS公钥缓存
+
+按kid索引缓存解析好的公钥（PyJWK），校验令牌时直接按kid取用，不再每次请求公钥地址。
+- 首次使用时同步拉取一次；拉取失败后在最小间隔内直接返回None，不再每次请求都同步拉取
+- 后台线程按间隔刷新；缓存超过刷新间隔仍未更新时，先返回旧公钥，同时在后台刷新
+- 遇到未知kid（公钥轮换）时同步刷新一次，刷新有最小间隔，伪造的kid不会造成大量请求
+- 刷新失败时保留旧公钥
+"""
+
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+import jwt
+import requests
+
+logger = logging.getLogger(__name__)
+
+def fetch_jwks(url: str, timeout: float) -> dict:
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+class JWKSCache:
+    """kid索引的公钥缓存，支持后台刷新"""
+
+    def __init__(self, url: str, refresh_interval: float = 3600, min_refresh_interval: float = 60,
+                 timeout: float = 5, fetch: Callable[[str, float], dict] = fetch_jwks, clock=time.monotonic):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._fetch = fetch
+        self._clock = clock
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.fetches = 0
+        self.failures = 0
+
+    def get_key(self, kid: str) -> Optional[jwt.PyJWK]:
+        """返回kid对应的公钥，找不到时返回None"""
+        if self._fetched_at is None:
+            if not self._may_refresh():
+                # 尚无可用公钥且刚拉取失败，最小间隔内快速失败
+                return None
+            self.refresh()
+        elif self._clock() - self._fetched_at >= self.refresh_interval:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._may_refresh():
+            # 未知kid：可能是公钥已轮换，同步刷新一次
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self) -> bool:
+        """拉取并替换公钥，并发调用时只拉取一次；返回是否成功"""
+        attempted_at = self._attempted_at
+        with self._refresh_lock:
+            if self._attempted_at != attempted_at:
+                # 等待期间其他线程已完成刷新
+                return self._fetched_at is not None
+            self._attempted_at = self._clock()
+            self.fetches += 1
+            try:
+                data = self._fetch(self.url, self.timeout)
+                keys = {}
+                for jwk in data.get('keys', []):
+                    try:
+                        keys[jwk['kid']] = jwt.PyJWK(jwk)
+                    except (KeyError, jwt.PyJWKError) as e:
+                        logger.warning(f"忽略无法解析的公钥: {e}")
+                if not keys:
+                    raise ValueError("公钥列表为空")
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"获取公钥失败，继续使用已缓存的公钥: {e}")
+                return False
+            self._keys = keys
+            self._fetched_at = self._clock()
+            return True
+
+    def _may_refresh(self) -> bool:
+        return self._attempted_at is None or self._clock() - self._attempted_at >= self.min_refresh_interval
+
+    def _refresh_in_background(self):
+        if not self._may_refresh() or (self._background and self._background.is_alive()):
+            return
+        self._background = threading.Thread(target=self.refresh, name="jwks-refresh", daemon=True)
+        self._background.start()
+
+    def start(self):
+        """启动定时刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="jwks-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定时刷新线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # 启动时预先拉取，首个登录请求无需等待；失败时按最小间隔重试
+        while True:
+            ok = self.refresh()
+            if self._stop_event.wait(self.refresh_interval if ok else self.min_refresh_interval):
+                break
+
+    def snapshot(self) -> dict:
+        age = self._clock() - self._fetched_at if self._fetched_at is not None else None
+        return {"keys": sorted(self._keys), "age": age, "fetches": self.fetches, "failures": self.failures}
+
+# Apple登录公钥
+apple_jwks = JWKSCache(
+    os.getenv('APPLE_JWKS_URL', 'https://appleid.apple.com/auth/keys'),
+    refresh_interval=float(os.getenv('APPLE_JWKS_REFRESH_INTERVAL', '3600')),
+    min_refresh_interval=float(os.getenv('APPLE_JWKS_MIN_REFRESH_INTERVAL', '60')),
+    timeout=float(os.getenv('APPLE_JWKS_TIMEOUT', '5'))
+)
@@ -0,0 +1,216 @@
+"""
+排行榜历史归档
+
+日榜、周榜结束时由敲击分桶表计算该周期的最终榜单，按名次顺序编码为一个压缩数据块，
+每个周期一行写入leaderboard_archives表，并清除leaderboard表中已结束周期的行，
+使热表只保留当前周期。
+
+数据块格式（整体zlib压缩）：
+    魔数 b"LBA1" | 条目数 varint
+    | 敲击数列：首项varint，其后为与前一项的差值varint（按名次降序，差值非负）
+    | 用户ID列：以换行分隔的UTF-8字符串
+名次按RANK()规则（同分同名次）由敲击数列推出，不单独存储。
+
+归档写入后不再变化（只在重新归档同一周期时覆盖），查询历史榜单时解码结果按(周期, 起始日)缓存，
+翻页请求不再重复读取和解压数据块。
+
+用法: python leaderboard_archive.py daily|weekly YYYY-MM-DD
+"""
+
+import os
+import sys
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text, bindparam, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal
+from periods import period_range, week_start
+import models
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LBA1"
+
+FINAL_BOARD_SQL = text("""
+    SELECT user_id, SUM(taps) AS total
+    FROM tap_histograms
+    WHERE bucket_start >= :start AND bucket_start < :end
+    GROUP BY user_id
+    HAVING total > 0
+    ORDER BY total DESC, user_id
+""").bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime))
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def encode_board(entries: List[Tuple[str, int]]) -> bytes:
+    """编码按名次排列的[(用户ID, 敲击数)]"""
+    out = bytearray(MAGIC)
+    _write_varint(out, len(entries))
+    previous = None
+    for _, taps in entries:
+        if previous is None:
+            _write_varint(out, taps)
+        else:
+            if taps > previous:
+                raise ValueError("榜单未按敲击数降序排列")
+            _write_varint(out, previous - taps)
+        previous = taps
+    out += "\n".join(str(user_id) for user_id, _ in entries).encode("utf-8")
+    return zlib.compress(bytes(out))
+
+def decode_board(blob: bytes) -> List[Tuple[str, int]]:
+    """解码为按名次排列的[(用户ID, 敲击数)]"""
+    data = zlib.decompress(blob)
+    if not data.startswith(MAGIC):
+        raise ValueError("无效的排行榜归档")
+    count, pos = _read_varint(data, len(MAGIC))
+    taps = []
+    for i in range(count):
+        value, pos = _read_varint(data, pos)
+        taps.append(value if i == 0 else taps[-1] - value)
+    user_ids = data[pos:].decode("utf-8").split("\n") if count else []
+    return list(zip(user_ids, taps))
+
+def with_ranks(entries: List[Tuple[str, int]]) -> List[Tuple[int, str, int]]:
+    """按RANK()规则附加名次，返回[(名次, 用户ID, 敲击数)]"""
+    ranked = []
+    for position, (user_id, taps) in enumerate(entries, start=1):
+        rank = ranked[-1][0] if ranked and ranked[-1][2] == taps else position
+        ranked.append((rank, user_id, taps))
+    return ranked
+
+class ArchiveCache:
+    """(周期, 起始日) -> (归档时间, 带名次的榜单) 的LRU缓存"""
+
+    def __init__(self, max_boards: int = 16):
+        self.max_boards = max_boards
+        self._lock = threading.Lock()
+        self._boards: "OrderedDict[Tuple[str, str], Tuple[datetime, List[Tuple[int, str, int]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, period: str, period_start: str):
+        key = (period, period_start)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is None:
+                self.misses += 1
+                return None
+            self._boards.move_to_end(key)
+            self.hits += 1
+            return board
+
+    def put(self, period: str, period_start: str, created_at: datetime, ranked: List[Tuple[int, str, int]]):
+        with self._lock:
+            self._boards[(period, period_start)] = (created_at, ranked)
+            self._boards.move_to_end((period, period_start))
+            while len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
+
+    def invalidate(self, period: str, period_start: str):
+        with self._lock:
+            self._boards.pop((period, period_start), None)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+# 全局历史榜单缓存
+archive_cache = ArchiveCache(max_boards=int(os.getenv('ARCHIVE_CACHE_MAX_BOARDS', '16')))
+
+def period_start_day(period: str, day: date) -> date:
+    """某日所属周期的起始日"""
+    return week_start(day) if period == "weekly" else day
+
+def archive_period(period: str, day: date, session_factory=SessionLocal) -> dict:
+    """归档day所属周期的最终榜单，并清除leaderboard表中该周期的行；重复执行覆盖原归档"""
+    started = time.monotonic()
+    start_day = period_start_day(period, day)
+    start, end = period_range(period, start_day)
+
+    db = session_factory()
+    try:
+        entries = [(str(user_id), int(total)) for user_id, total in
+                   db.execute(FINAL_BOARD_SQL, {"start": start, "end": end})]
+        blob = encode_board(entries)
+        values = {
+            "period": period,
+            "period_start": start_day.isoformat(),
+            "entry_count": len(entries),
+            "data": blob,
+            "created_at": datetime.utcnow()
+        }
+        statement = sqlite_insert(models.LeaderboardArchive).values(**values)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["period", "period_start"],
+            set_={key: statement.excluded[key] for key in ("entry_count", "data", "created_at")}
+        ))
+        # 当前周期的行在周期开始后写入，早于周期结束时间的均属于已归档周期
+        removed = db.query(models.Leaderboard).filter(
+            models.Leaderboard.period == period,
+            models.Leaderboard.created_at < end
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    archive_cache.invalidate(period, start_day.isoformat())
+
+    metrics = {
+        "period": period,
+        "period_start": start_day.isoformat(),
+        "entries": len(entries),
+        "bytes": len(blob),
+        "removed": removed,
+        "elapsed": time.monotonic() - started
+    }
+    logger.info(f"排行榜归档完成: {metrics}")
+    return metrics
+
+def archive_closed_periods(closing_day: date, session_factory=SessionLocal) -> List[dict]:
+    """日切时归档当日日榜，周末最后一天同时归档周榜"""
+    results = [archive_period("daily", closing_day, session_factory)]
+    if week_start(closing_day + timedelta(days=1)) != week_start(closing_day):
+        results.append(archive_period("weekly", closing_day, session_factory))
+    return results
+
+async def get_ranked_archive(db, period: str, day: date) -> Optional[Tuple[datetime, List[Tuple[int, str, int]]]]:
+    """获取day所属周期的归档时间及带名次的榜单（db为异步会话），优先读取缓存；没有归档时返回None"""
+    period_start = period_start_day(period, day).isoformat()
+    board = archive_cache.get(period, period_start)
+    if board is None:
+        archive = await db.get(models.LeaderboardArchive, (period, period_start))
+        if not archive:
+            return None
+        board = (archive.created_at, with_ranks(decode_board(archive.data)))
+        archive_cache.put(period, period_start, *board)
+    return board
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("daily", "weekly"):
+        print(__doc__)
+        sys.exit(1)
+    print(archive_period(sys.argv[1], date.fromisoformat(sys.argv[2])))
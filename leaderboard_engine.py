@@ -0,0 +1,579 @@
+"""
+内存排行榜引擎
+
+每个周期（daily、weekly）维护一个全国跳表，并按用户所在地区（省份、城市）分片，每个分片同为带跨度的跳表，
+随敲击缓冲区落库增量更新，单次更新涉及全国跳表及一个分片。全国榜、名次及上下相邻用户直接由全国跳表得到，
+地区榜合并对应分片的前N名。
+好友榜只读取好友各自的分数，不遍历榜单。定期将上次快照以来分数变化的成员分块写入leaderboard表，
+重启时从快照恢复，并按敲击分桶重算快照之后仍有敲击的用户，进程异常退出时不丢失未写入快照的增量。
+"""
+
+import os
+import heapq
+import random
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func
+
+from database import SessionLocal
+from periods import local_day, local_today, week_start, period_range
+from daily_rollover import record_job_run, get_last_run_key
+import models
+import crud
+
+logger = logging.getLogger(__name__)
+
+MAX_LEVEL = 32
+LEVEL_PROBABILITY = 0.25
+
+PERIODS = ("daily", "weekly")
+
+# 未设置地区的用户所在分片
+UNKNOWN_REGION = ("", "")
+# 用户记录不存在时的展示信息（用户名, 头像）
+UNKNOWN_PROFILE = ("", None)
+
+# 快照每个事务写入的行数，单次持有写锁的时间与榜单规模无关
+SNAPSHOT_CHUNK_SIZE = int(os.getenv('LEADERBOARD_SNAPSHOT_CHUNK_SIZE', '500'))
+# 恢复时从快照时间再向前重算的时长，覆盖快照后才落库、但敲击时间较早的分桶
+REPLAY_MARGIN = timedelta(hours=1)
+
+def order_key(entry: Tuple[str, int]):
+    """榜单排序键：分数降序，同分按成员ID"""
+    return -entry[1], entry[0]
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.forward: List[Optional["_Node"]] = [None] * level
+        self.span: List[int] = [0] * level
+
+class RankedSet:
+    """按分数降序排列的有序集合（带跨度的跳表）
+
+    排序键为(-分数, 成员)，同分按成员ID排序，名次从1开始。
+    """
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._scores: Dict[str, int] = {}
+        # 每次修改加一；snapshot_items在集合未变化时复用上次的列表
+        self._version = 0
+        self._snapshot: Optional[Tuple[int, List[Tuple[str, int]]]] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, member) -> bool:
+        return member in self._scores
+
+    def score(self, member) -> Optional[int]:
+        return self._scores.get(member)
+
+    def items(self):
+        """按名次遍历(成员, 分数)"""
+        node = self._head.forward[0]
+        while node:
+            yield node.key[1], -node.key[0]
+            node = node.forward[0]
+
+    def snapshot_items(self) -> List[Tuple[str, int]]:
+        """按名次排列的(成员, 分数)列表；返回的列表之后不会被修改，可在锁外读取"""
+        if self._snapshot is None or self._snapshot[0] != self._version:
+            self._snapshot = (self._version, list(self.items()))
+        return self._snapshot[1]
+
+    def set(self, member, score: int):
+        """设置成员分数"""
+        old = self._scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._delete((-old, member))
+        self._insert((-score, member))
+        self._scores[member] = score
+        self._version += 1
+
+    def increment(self, member, delta: int) -> int:
+        """累加成员分数，返回新分数"""
+        score = self._scores.get(member, 0) + delta
+        self.set(member, score)
+        return score
+
+    def remove(self, member):
+        old = self._scores.pop(member, None)
+        if old is not None:
+            self._delete((-old, member))
+            self._version += 1
+
+    def rank(self, member) -> Optional[int]:
+        """成员名次（从1开始），不存在返回None"""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        key = (-score, member)
+        rank = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+            if node.key == key:
+                return rank
+        return None
+
+    def count_ahead(self, member, score: int) -> int:
+        """排在(成员, 分数)之前的成员数，成员本身不必在集合中"""
+        key = (-score, member)
+        count = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] and node.forward[i].key < key:
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def range(self, start: int, count: int) -> List[Tuple[str, int]]:
+        """从名次start（从1开始）起取count个(成员, 分数)"""
+        if start < 1 or start > self._size or count <= 0:
+            return []
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] and traversed + node.span[i] <= start:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == start:
+                break
+        result = []
+        while node and len(result) < count:
+            result.append((node.key[1], -node.key[0]))
+            node = node.forward[0]
+        return result
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        return self.range(1, n)
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < LEVEL_PROBABILITY:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        update = [None] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._size
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._size += 1
+
+    def _delete(self, key):
+        update = [None] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return
+        for i in range(self._level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+class LeaderboardEngine:
+    """内存排行榜引擎"""
+
+    def __init__(self, session_factory=SessionLocal, snapshot_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        if snapshot_interval is None:
+            snapshot_interval = float(os.getenv('LEADERBOARD_SNAPSHOT_INTERVAL', '60'))
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        # 周期 -> (省份, 城市) -> 分片
+        self._shards: Dict[str, Dict[Tuple[str, str], RankedSet]] = {period: {} for period in PERIODS}
+        # 周期 -> 全国榜，与分片同步更新
+        self._national: Dict[str, RankedSet] = {period: RankedSet() for period in PERIODS}
+        # 用户 -> (省份, 城市)，各周期共用
+        self._regions: Dict[str, Tuple[str, str]] = {}
+        # 用户 -> (用户名, 头像)，与地区同时加载，输出榜单时不再查询users表
+        self._profiles: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._period_keys: Dict[str, date] = {}
+        # 各周期上次快照以来分数或地区变化的成员
+        self._changed: Dict[str, set] = {period: set() for period in PERIODS}
+        # 跨周期后需删除上一周期快照行的周期
+        self._stale = set()
+        # 各周期榜单版本号，榜单每次变化加一，用于响应缓存失效
+        self._versions: Dict[str, int] = {period: 0 for period in PERIODS}
+        self._ready = False
+        self.updated_at = datetime.utcnow()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def period_key(period: str, day: date) -> date:
+        """某日所属周期的起始日"""
+        return week_start(day) if period == "weekly" else day
+
+    def is_ready(self, period: str) -> bool:
+        return self._ready and period in self._shards
+
+    def version(self, period: str) -> int:
+        """周期榜单当前版本号"""
+        with self._lock:
+            self._partition(period, local_today())
+            return self._versions[period]
+
+    def _partition(self, period: str, day: date) -> Dict[Tuple[str, str], RankedSet]:
+        """获取周期的全部分片，跨周期时重置"""
+        key = self.period_key(period, day)
+        if self._period_keys.get(period) != key:
+            self._shards[period] = {}
+            self._national[period] = RankedSet()
+            self._period_keys[period] = key
+            self._versions[period] += 1
+            self._changed[period] = set()
+            self._stale.add(period)
+        return self._shards[period]
+
+    def _shard(self, period: str, user_id: str) -> RankedSet:
+        """用户所在分片，不存在时创建"""
+        shards = self._partition(period, local_today())
+        region = self._regions.get(user_id, UNKNOWN_REGION)
+        shard = shards.get(region)
+        if shard is None:
+            shard = shards[region] = RankedSet()
+        return shard
+
+    def _nation(self, period: str) -> RankedSet:
+        """周期的全国榜"""
+        self._partition(period, local_today())
+        return self._national[period]
+
+    def _set(self, period: str, user_id: str, score: int):
+        """同时设置全国榜及所在分片中的分数"""
+        self._shard(period, user_id).set(user_id, score)
+        self._national[period].set(user_id, score)
+
+    def _matching(self, period: str, province: Optional[str] = None, city: Optional[str] = None) -> List[RankedSet]:
+        """地区范围内的分片，省份为空时为全部分片"""
+        shards = self._partition(period, local_today())
+        if province is None:
+            return list(shards.values())
+        return [
+            shard for (shard_province, shard_city), shard in shards.items()
+            if shard_province == province and (city is None or shard_city == city)
+        ]
+
+    def _load_users(self, user_ids: List[str]) -> Dict[str, Tuple[Tuple[str, str], Tuple[str, Optional[str]]]]:
+        """查询用户地区及展示信息，无记录的用户归入未知地区"""
+        db = self.session_factory()
+        try:
+            users = crud.get_user_display(db, user_ids)
+        finally:
+            db.close()
+        return {user_id: users.get(user_id, (UNKNOWN_REGION, UNKNOWN_PROFILE)) for user_id in user_ids}
+
+    def apply(self, increments: Dict[str, int], last_tap_at: Dict[str, datetime]):
+        """应用一次落库的增量，按各用户最后敲击时间归属周期，已结束周期的增量忽略"""
+        missing = [user_id for user_id in increments if user_id not in self._regions]
+        users = self._load_users(missing) if missing else {}
+        today = local_today()
+        with self._lock:
+            for user_id, (region, profile) in users.items():
+                self._regions[user_id] = region
+                self._profiles[user_id] = profile
+            for period in PERIODS:
+                self._partition(period, today)
+                current = self._period_keys[period]
+                for user_id, delta in increments.items():
+                    tapped_at = last_tap_at.get(user_id)
+                    if tapped_at and self.period_key(period, local_day(tapped_at)) < current:
+                        continue
+                    score = self._shard(period, user_id).increment(user_id, delta)
+                    self._national[period].set(user_id, score)
+                    self._changed[period].add(user_id)
+                self._versions[period] += 1
+            self.updated_at = datetime.utcnow()
+
+    def move_user(self, user_id, province: Optional[str], city: Optional[str]):
+        """用户地区变更时将其分数移至新分片"""
+        user_id = str(user_id)
+        region = (province or "", city or "")
+        with self._lock:
+            old = self._regions.get(user_id, UNKNOWN_REGION)
+            self._regions[user_id] = region
+            if old == region:
+                return
+            for period in PERIODS:
+                shard = self._partition(period, local_today()).get(old)
+                score = shard.score(user_id) if shard else None
+                if score is None:
+                    continue
+                shard.remove(user_id)
+                self._shard(period, user_id).set(user_id, score)
+                self._changed[period].add(user_id)
+                self._versions[period] += 1
+
+    def profiles(self, user_ids: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """榜单用户的(用户名, 头像)"""
+        with self._lock:
+            return {user_id: self._profiles.get(user_id, UNKNOWN_PROFILE) for user_id in user_ids}
+
+    def top(self, period: str, n: int, province: Optional[str] = None, city: Optional[str] = None) -> List[Tuple[str, int]]:
+        """前n名，可限定省份、城市；全国榜直接读取，地区榜由对应分片的前n名合并得到"""
+        with self._lock:
+            if province is None:
+                return self._nation(period).top(n)
+            shards = self._matching(period, province, city)
+            return list(islice(heapq.merge(*(shard.top(n) for shard in shards), key=order_key), n))
+
+    def rank(self, period: str, user_id) -> Optional[int]:
+        with self._lock:
+            return self._nation(period).rank(str(user_id))
+
+    def around(self, period: str, user_id, k: int) -> Tuple[Optional[int], int, List[Tuple[str, int]]]:
+        """用户名次及上下各k名，返回(用户名次, 列表起始名次, [(成员, 分数)])"""
+        with self._lock:
+            national = self._nation(period)
+            rank = national.rank(str(user_id))
+            if rank is None:
+                return None, 0, []
+            start = max(1, rank - k)
+            return rank, start, national.range(start, rank - start + 1 + k)
+
+    def friends(self, period: str, user_ids: Iterable) -> List[Tuple[str, int]]:
+        """好友榜：只取给定用户各自的分数排序，未上榜的用户不计入"""
+        with self._lock:
+            national = self._nation(period)
+            entries = []
+            for user_id in {str(user_id) for user_id in user_ids}:
+                score = national.score(user_id)
+                if score is not None:
+                    entries.append((user_id, score))
+        return sorted(entries, key=order_key)
+
+    def load(self):
+        """从leaderboard表中当前周期的快照恢复
+
+        快照之后落库的增量不在快照中：对上次快照完成时间（减去REPLAY_MARGIN）之后仍有敲击分桶的用户，
+        按周期内的全部分桶重算分数，并在下次快照时写回。
+        """
+        today = local_today()
+        db = self.session_factory()
+        try:
+            with self._lock:
+                for period in PERIODS:
+                    self._partition(period, today)
+                    start, end = period_range(period, self._period_keys[period])
+                    rows = db.query(
+                        models.Leaderboard.user_id, models.Leaderboard.tap_count,
+                        models.User.province, models.User.city, models.User.username, models.User.avatar
+                    ).outerjoin(models.User, models.User.id == models.Leaderboard.user_id).filter(
+                        crud.current_board(period),
+                        models.Leaderboard.created_at >= start
+                    ).all()
+                    for user_id, tap_count, province, city, username, avatar in rows:
+                        user_id = str(user_id)
+                        self._regions[user_id] = (province or "", city or "")
+                        self._profiles[user_id] = (username or "", avatar)
+                        self._set(period, user_id, tap_count or 0)
+
+                    replayed = self._replay(db, period, start, end)
+                    missing = [user_id for user_id in replayed if user_id not in self._regions]
+                    for user_id, (region, profile) in self._load_users(missing).items():
+                        self._regions[user_id] = region
+                        self._profiles[user_id] = profile
+                    for user_id, score in replayed.items():
+                        self._set(period, user_id, score)
+                    self._changed[period] = set(replayed)
+                    self._versions[period] += 1
+                self._ready = True
+        finally:
+            db.close()
+        logger.info("排行榜引擎已从快照恢复")
+
+    def _replay(self, db, period: str, start: datetime, end: datetime) -> Dict[str, int]:
+        """上次快照之后仍有敲击的用户在周期内的总敲击数"""
+        finished = get_last_run_key(db, f"leaderboard_snapshot_{period}")
+        since = start
+        if finished:
+            since = max(start, datetime.fromisoformat(finished).replace(minute=0, second=0, microsecond=0) - REPLAY_MARGIN)
+        histogram = models.TapHistogram
+        active = db.query(histogram.user_id).filter(histogram.bucket_start >= since, histogram.bucket_start < end)
+        rows = db.query(histogram.user_id, func.sum(histogram.taps)).filter(
+            histogram.bucket_start >= start,
+            histogram.bucket_start < end,
+            histogram.user_id.in_(active)
+        ).group_by(histogram.user_id).all()
+        return {str(user_id): taps or 0 for user_id, taps in rows}
+
+    def snapshot(self) -> int:
+        """将上次快照以来变化的成员写入leaderboard表，返回写入的行数
+
+        锁内先切换到当前周期（跨周期时旧榜单随之清空，不会以新时间写回），再由全国榜取变化成员的名次、分数
+        及展示信息；写库在锁外进行，不阻塞榜单读取。
+        按SNAPSHOT_CHUNK_SIZE分块更新或插入，每块一个事务；rank列为写入时的全国名次，
+        未变化成员的行不重写，恢复时按分数重新排序。全部写完后记录快照时间，供恢复时重算之后的增量。
+        """
+        with self._lock:
+            # 周期与快照时间取自同一时刻，快照时间必定落在所写榜单的周期内，恢复时按此筛选
+            now = datetime.utcnow()
+            for period in PERIODS:
+                self._partition(period, local_today(now))
+            stale = [period for period in PERIODS if period in self._stale]
+            self._stale.difference_update(stale)
+            changed = {period: self._changed[period] for period in PERIODS if self._changed[period]}
+            for period in changed:
+                self._changed[period] = set()
+            boards = {
+                period: sorted(
+                    (user_id, self._national[period].rank(user_id), self._national[period].score(user_id))
+                    for user_id in members if user_id in self._national[period]
+                )
+                for period, members in changed.items()
+            }
+            display = {
+                user_id: (self._regions.get(user_id, UNKNOWN_REGION), self._profiles.get(user_id, UNKNOWN_PROFILE))
+                for members in changed.values() for user_id in members
+            }
+            period_starts = {period: period_range(period, self._period_keys[period])[0] for period in stale}
+        if not changed and not stale:
+            return 0
+
+        written = 0
+        db = self.session_factory()
+        try:
+            for period, start in period_starts.items():
+                self._purge(db, period, start)
+            for period, rows in boards.items():
+                for offset in range(0, len(rows), SNAPSHOT_CHUNK_SIZE):
+                    self._write_chunk(db, period, rows[offset:offset + SNAPSHOT_CHUNK_SIZE], display, now)
+                written += len(rows)
+            for period in PERIODS:
+                record_job_run(db, f"leaderboard_snapshot_{period}", now.isoformat())
+        except Exception:
+            db.rollback()
+            # 已写入的块重写一次结果相同，失败时整体放回
+            with self._lock:
+                self._stale.update(stale)
+                for period, members in changed.items():
+                    if self._period_keys.get(period) == self.period_key(period, local_today(now)):
+                        self._changed[period].update(members)
+            raise
+        finally:
+            db.close()
+        return written
+
+    @staticmethod
+    def _purge(db, period: str, start: datetime):
+        """分块删除早于当前周期的快照行"""
+        table = models.Leaderboard.__table__
+        while True:
+            ids = [row[0] for row in db.execute(
+                table.select().with_only_columns(table.c.id).where(
+                    table.c.period == period, table.c.created_at < start
+                ).limit(SNAPSHOT_CHUNK_SIZE)
+            )]
+            if not ids:
+                return
+            db.execute(table.delete().where(table.c.id.in_(ids)))
+            db.commit()
+
+    @staticmethod
+    def _write_chunk(db, period: str, rows: List[Tuple[str, int, int]], display: dict, now: datetime):
+        """更新或插入一块快照行并提交"""
+        table = models.Leaderboard.__table__
+        generation = crud.get_leaderboard_generation(db, period)
+        existing = dict(db.execute(
+            table.select().with_only_columns(table.c.user_id, table.c.id).where(
+                table.c.period == period, table.c.generation == generation,
+                table.c.user_id.in_([user_id for user_id, _, _ in rows])
+            )
+        ).all())
+        updates, inserts = [], []
+        for user_id, rank, score in rows:
+            (province, city), (username, avatar) = display[user_id]
+            values = {
+                'rank': rank, 'tap_count': score, 'created_at': now,
+                'username': username, 'avatar': avatar, 'province': province or None, 'city': city or None
+            }
+            if user_id in existing:
+                updates.append({'row_id': existing[user_id], **{f'new_{key}': value for key, value in values.items()}})
+            else:
+                inserts.append({'user_id': user_id, 'period': period, 'generation': generation, **values})
+        if updates:
+            db.execute(
+                table.update().where(table.c.id == bindparam('row_id')).values(
+                    {key: bindparam(f'new_{key}') for key in (
+                        'rank', 'tap_count', 'created_at', 'username', 'avatar', 'province', 'city'
+                    )}
+                ),
+                updates
+            )
+        if inserts:
+            db.execute(table.insert(), inserts)
+        db.commit()
+
+    def start(self):
+        """启动快照线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止快照线程并写入最终快照"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.snapshot()
+
+    def _run(self):
+        while not self._stop_event.wait(self.snapshot_interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"排行榜快照写入失败: {e}")
+
+# 全局排行榜引擎
+leaderboard_engine = LeaderboardEngine()
@@ -0,0 +1,137 @@
+"""
+排行榜物化任务
+
+供没有常驻进程的部署使用（如定时任务调用），替代内存排行榜引擎：
+由敲击分桶表用一条INSERT…SELECT及RANK() OVER窗口函数语句计算当日、当周榜单
+（连同用户展示信息及地区）以新的代次写入leaderboard表，主键为预留的时间有序ID，按名次顺序递增；
+写完后更新leaderboard_generations中该周期的代次即完成切换，读取方只读取当前代次，
+不会看到写了一半的榜单，榜单也无需再复制一遍。旧代次的行在切换后分块删除。
+
+用法: python leaderboard_job.py [daily|weekly]
+"""
+
+import sys
+import time
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import text, bindparam, DateTime
+
+from database import SessionLocal
+from id_generator import id_generator, IDS_PER_MS, MS_STEP
+from periods import local_today, period_range
+from daily_rollover import record_job_run
+import models
+import crud
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("daily", "weekly")
+
+# 切换后每个事务删除的旧代次行数
+DELETE_CHUNK_SIZE = 10000
+
+COUNT_SQL = text("""
+    SELECT COUNT(DISTINCT user_id) FROM tap_histograms
+    WHERE bucket_start >= :start AND bucket_start < :end
+""").bindparams(
+    bindparam("start", type_=DateTime),
+    bindparam("end", type_=DateTime)
+)
+
+# 主键由预留的ID块按行号在SQL中算出，与按名次顺序逐个生成的ID相同
+MATERIALIZE_SQL = text("""
+    INSERT INTO leaderboard (id, user_id, period, rank, tap_count, created_at, username, avatar, province, city,
+                             generation)
+    SELECT CAST(:first_id + (b.rn - 1) / :ids_per_ms * :ms_step + (b.rn - 1) % :ids_per_ms AS TEXT),
+           b.user_id,
+           :period,
+           b.rank,
+           b.tap_count,
+           :now,
+           b.username,
+           b.avatar,
+           b.province,
+           b.city,
+           :generation
+    FROM (
+        SELECT h.user_id,
+               RANK() OVER (ORDER BY SUM(h.taps) DESC) AS rank,
+               ROW_NUMBER() OVER (ORDER BY SUM(h.taps) DESC, h.user_id) AS rn,
+               SUM(h.taps) AS tap_count,
+               u.username,
+               u.avatar,
+               u.province,
+               u.city
+        FROM tap_histograms h
+        LEFT JOIN users u ON u.id = h.user_id
+        WHERE h.bucket_start >= :start AND h.bucket_start < :end
+        GROUP BY h.user_id
+    ) b
+""").bindparams(
+    bindparam("now", type_=DateTime),
+    bindparam("start", type_=DateTime),
+    bindparam("end", type_=DateTime)
+)
+
+# 删除上次中断时写了一半、尚未生效的代次
+DISCARD_SQL = text("DELETE FROM leaderboard WHERE period = :period AND generation > :generation")
+
+PRUNE_SQL = text("""
+    DELETE FROM leaderboard WHERE id IN (
+        SELECT id FROM leaderboard WHERE period = :period AND generation < :generation LIMIT :limit
+    )
+""")
+
+def materialize_leaderboard(period: str, session_factory=SessionLocal, today: Optional[date] = None) -> dict:
+    """物化一个周期的排行榜"""
+    if period not in PERIODS:
+        raise ValueError(f"无效的排行榜周期: {period}")
+    today = today or local_today()
+    start, end = period_range(period, today)
+    started = time.monotonic()
+
+    db = session_factory()
+    try:
+        # 以新代次写入完整榜单（读取方仍读取当前代次，不受影响）
+        current = crud.get_leaderboard_generation(db, period)
+        generation = current + 1
+        db.execute(DISCARD_SQL, {"period": period, "generation": current})
+        # 删除语句已开启写事务，计数与插入之间分桶表不会变化
+        rows = db.execute(COUNT_SQL, {"start": start, "end": end}).scalar()
+        if rows:
+            db.execute(MATERIALIZE_SQL, {
+                "period": period, "now": datetime.utcnow(), "start": start, "end": end, "generation": generation,
+                "first_id": id_generator.reserve(rows), "ids_per_ms": IDS_PER_MS, "ms_step": MS_STEP
+            })
+        db.commit()
+
+        # 只更新一行代次记录即完成切换
+        pointer = db.get(models.LeaderboardGeneration, period)
+        if pointer is None:
+            db.add(models.LeaderboardGeneration(period=period, generation=generation))
+        else:
+            pointer.generation = generation
+        db.commit()
+
+        # 旧代次已不再被读取，分块删除，每块单独提交
+        while db.execute(PRUNE_SQL, {"period": period, "generation": generation,
+                                     "limit": DELETE_CHUNK_SIZE}).rowcount:
+            db.commit()
+        db.commit()
+        record_job_run(db, f"leaderboard_{period}", today.isoformat())
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    metrics = {"period": period, "rows": rows, "elapsed": time.monotonic() - started}
+    logger.info(f"排行榜物化完成: {metrics}")
+    return metrics
+
+if __name__ == "__main__":
+    periods = sys.argv[1:] or list(PERIODS)
+    for period in periods:
+        print(materialize_leaderboard(period))
@@ -1,12 +1,50 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import Base, engine
-from api import user, stat, meditation, achievement, leaderboard, share, wechat_verify
+from database import Base, engine, async_engine, session_metrics, SessionLocal
+from api import user, stat, tap_stream, meditation, achievement, leaderboard, share, wechat_verify, admin
+from tap_aggregator import tap_aggregator
+from daily_rollover import rollover_scheduler
+from leaderboard_engine import leaderboard_engine
+from verification_purge import verification_purger
+from profile_cache import profile_cache
+from third_party_auth import apple_auth_service
+from session_tokens import token_service
 
 # 初始化数据库表
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="WoodenFis Python Server", description="木鱼App后端API服务", version="1.0.0")
+# 排行榜模式：engine为进程内增量引擎，materialized为由leaderboard_job.py定时物化
+LEADERBOARD_MODE = os.getenv('LEADERBOARD_MODE', 'engine')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动及停止后台任务"""
+    # 加载吊销列表，已退出登录的令牌重启后仍然无效
+    token_service.load_revoked(SessionLocal)
+    if LEADERBOARD_MODE == 'engine':
+        leaderboard_engine.load()
+        tap_aggregator.add_flush_listener(leaderboard_engine.apply)
+        leaderboard_engine.start()
+    tap_aggregator.start()
+    rollover_scheduler.start()
+    verification_purger.start()
+    # 预先拉取Apple公钥并定时刷新，登录请求不再同步请求公钥
+    if apple_auth_service.is_configured():
+        apple_auth_service.jwks.start()
+    yield
+    apple_auth_service.jwks.stop()
+    verification_purger.stop()
+    rollover_scheduler.stop()
+    # 停止时写入缓冲区中剩余的敲击数据
+    tap_aggregator.stop()
+    if LEADERBOARD_MODE == 'engine':
+        tap_aggregator.remove_flush_listener(leaderboard_engine.apply)
+        leaderboard_engine.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="WoodenFis Python Server", description="木鱼App后端API服务", version="1.0.0", lifespan=lifespan)
 
 # 允许所有来源跨域（开发环境）
 app.add_middleware(
@@ -20,11 +58,13 @@ app.add_middleware(
 # 注册路由
 app.include_router(user.router)
 app.include_router(stat.router)
+app.include_router(tap_stream.router)
 app.include_router(meditation.router)
 app.include_router(achievement.router)
 app.include_router(leaderboard.router)
 app.include_router(share.router)
 app.include_router(wechat_verify.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
@@ -35,6 +75,20 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics/database")
+async def database_metrics():
+    """数据库会话及连接池计数"""
+    return {
+        **session_metrics.snapshot(),
+        "pool": engine.pool.status(),
+        "async_pool": async_engine.pool.status()
+    }
+
+@app.get("/metrics/profile-cache")
+async def profile_cache_metrics():
+    """用户资料缓存命中、未命中及淘汰计数，用于调整容量"""
+    return profile_cache.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：按查询模式建立复合索引
+
+为已有数据库补建模型中声明的全部索引，包括：
+- verification_codes (phone, created_at)、(phone, code, used, expires_at)、(expires_at)（过期清理）
+- meditation_sessions (user_id, created_at)
+- third_party_auth (platform, platform_user_id) 唯一索引
+- user_stats、user_achievements、user_share_tasks、third_party_auth 的 user_id 外键索引
+- users.login_type
+- user_stats.user_id 改为唯一索引（主键不再等于user_id，由该索引保证每个用户一行）
+
+并删除被复合索引前缀覆盖的旧单列索引及与主键重复的id列索引，最后执行ANALYZE更新统计信息。可重复执行。
+"""
+
+from sqlalchemy import Index, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from database import engine
+import models
+
+# 被复合索引取代的旧单列索引，及与主键自带索引重复的id列索引
+OBSOLETE_INDEXES = (
+    "ix_verification_codes_phone",
+    "ix_third_party_auth_platform",
+    "ix_third_party_auth_platform_user_id",
+    "ix_users_id",
+    "ix_verification_codes_id",
+    "ix_user_stats_id",
+    "ix_meditation_sessions_id",
+    "ix_achievements_id",
+    "ix_user_achievements_id",
+    "ix_leaderboard_id",
+    "ix_share_tasks_id",
+    "ix_user_share_tasks_id",
+    "ix_third_party_auth_id",
+)
+
+def rebuild_index(db_engine, index):
+    """按模型重建唯一性不一致的索引
+
+    先以临时名称建立新索引，遇到重复数据失败时原索引保持不变；
+    成功后再删除原索引并以原名称重建，期间临时索引仍覆盖相同的列，最后删除临时索引。
+    """
+    temporary = Index(f"{index.name}_rebuild", *index.columns, unique=index.unique)
+    # 临时索引只用于本次迁移，不保留在模型元数据中
+    index.table.indexes.discard(temporary)
+    with db_engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {temporary.name}"))
+    temporary.create(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {index.name}"))
+        index.create(conn)
+        conn.execute(text(f"DROP INDEX {temporary.name}"))
+
+def migrate_database(db_engine=engine):
+    """执行数据库迁移"""
+    print("开始数据库迁移...")
+    inspector = inspect(db_engine)
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"]: bool(index["unique"]) for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing and existing[index.name] == bool(index.unique):
+                continue
+            try:
+                if index.name in existing:
+                    # 唯一性与模型不一致时重建
+                    rebuild_index(db_engine, index)
+                    print(f"已重建索引: {index.name}")
+                else:
+                    index.create(db_engine)
+                    print(f"已创建索引: {index.name}")
+            except IntegrityError:
+                # 唯一索引遇到重复数据时需人工清理后重新执行，原有索引保留
+                print(f"创建唯一索引 {index.name} 失败：{table.name} 表存在重复数据")
+
+    with db_engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ANALYZE"))
+    print("数据库迁移完成")
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：将计数字段由字符串改为整数
+
+涉及字段：
+- users.merit_points
+- user_stats.total_taps, today_taps, consecutive_days
+- meditation_sessions.duration, tap_count
+- leaderboard.rank, tap_count
+- share_tasks.merit
+
+SQLite不支持修改列类型，需按新结构重建表。为不长时间锁表，迁移在线进行：
+1. 按模型创建新表 <表名>__new，并在旧表上建立触发器，迁移期间的增删改同步写入新表；
+2. 按rowid分块将旧表数据转换后复制到新表（已由触发器写入的行不覆盖），每块单独提交，
+   进度记录在job_runs表中，中断后重新执行从上次的位置继续；
+3. 复制完成后在一个事务内删除触发器和旧表、将新表改名并重建索引。
+
+用法: python migrate_integer_columns.py [--chunk-size N] [--pause 秒]
+"""
+
+import argparse
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from database import engine as default_engine
+import models
+
+# 表名 -> 改为整数的字段
+INTEGER_COLUMNS = {
+    "users": ("merit_points",),
+    "user_stats": ("total_taps", "today_taps", "consecutive_days"),
+    "meditation_sessions": ("duration", "tap_count"),
+    "leaderboard": ("rank", "tap_count"),
+    "share_tasks": ("merit",),
+}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+def job_name(table: str) -> str:
+    return f"integer_migration_{table}"
+
+def needs_migration(conn, table: str) -> bool:
+    """表存在且仍有非整数类型的目标字段"""
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return False
+    types = {column["name"]: str(column["type"]).upper() for column in inspector.get_columns(table)}
+    return any(column in types and "INT" not in types[column] for column in INTEGER_COLUMNS[table])
+
+def _select_list(table: str, columns, prefix: str = "") -> str:
+    """旧表取值表达式，目标字段转换为整数"""
+    return ", ".join(
+        f"CAST({prefix}{column} AS INTEGER)" if column in INTEGER_COLUMNS[table] else f"{prefix}{column}"
+        for column in columns
+    )
+
+def _get_progress(conn, table: str) -> int:
+    row = conn.execute(text("SELECT last_run_key FROM job_runs WHERE name = :name"),
+                       {"name": job_name(table)}).first()
+    return int(row[0]) if row and row[0] else 0
+
+def _set_progress(conn, table: str, rowid: int):
+    conn.execute(text("""
+        INSERT INTO job_runs (name, last_run_key, finished_at) VALUES (:name, :key, :now)
+        ON CONFLICT(name) DO UPDATE SET last_run_key = excluded.last_run_key, finished_at = excluded.finished_at
+    """), {"name": job_name(table), "key": str(rowid), "now": datetime.utcnow()})
+
+def prepare(conn, table: str):
+    """创建新表及同步触发器（已存在时跳过，以便续跑）"""
+    # pysqlite不会为DDL自动开启事务，显式开启以保证原子性
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    new_table = f"{table}__new"
+    model_table = models.Base.metadata.tables[table]
+    columns = [column.name for column in model_table.columns]
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    missing = [column for column in columns if column not in existing]
+    if missing:
+        raise RuntimeError(f"{table}表缺少字段{missing}，请先执行其他迁移脚本")
+    if not inspect(conn).has_table(new_table):
+        # 复制全部模型表以便解析外键引用
+        metadata = MetaData()
+        for source in models.Base.metadata.sorted_tables:
+            source.to_metadata(metadata)
+        conn.execute(CreateTable(model_table.to_metadata(metadata, name=new_table)))
+
+    column_list = ", ".join(columns)
+    new_values = _select_list(table, columns, "NEW.")
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}__mig_insert AFTER INSERT ON {table} BEGIN
+            INSERT OR REPLACE INTO {new_table} (rowid, {column_list}) VALUES (NEW.rowid, {new_values});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}__mig_update AFTER UPDATE ON {table} BEGIN
+            DELETE FROM {new_table} WHERE rowid = OLD.rowid;
+            INSERT OR REPLACE INTO {new_table} (rowid, {column_list}) VALUES (NEW.rowid, {new_values});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}__mig_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {new_table} WHERE rowid = OLD.rowid;
+        END
+    """))
+
+def copy_chunks(db_engine, table: str, chunk_size: int, pause: float = 0.0,
+                progress: Optional[Callable[[str, int, int], None]] = None) -> int:
+    """按rowid分块复制旧表数据，返回本次复制的行数"""
+    new_table = f"{table}__new"
+    columns = [column.name for column in models.Base.metadata.tables[table].columns]
+    copy_sql = text(f"""
+        INSERT OR IGNORE INTO {new_table} (rowid, {', '.join(columns)})
+        SELECT rowid, {_select_list(table, columns)} FROM {table}
+        WHERE rowid > :low AND rowid <= :high
+    """)
+
+    with db_engine.begin() as conn:
+        max_rowid = conn.execute(text(f"SELECT MAX(rowid) FROM {table}")).scalar() or 0
+        low = _get_progress(conn, table)
+
+    copied = 0
+    while low < max_rowid:
+        high = low + chunk_size
+        with db_engine.begin() as conn:
+            copied += conn.execute(copy_sql, {"low": low, "high": high}).rowcount
+            _set_progress(conn, table, high)
+        if progress:
+            progress(table, min(high, max_rowid), max_rowid)
+        low = high
+        if pause:
+            time.sleep(pause)
+    return copied
+
+def swap(conn, table: str):
+    """删除触发器和旧表，新表改名并重建索引"""
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+    for suffix in ("insert", "update", "delete"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {table}__mig_{suffix}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {table}__new RENAME TO {table}"))
+    for index in models.Base.metadata.tables[table].indexes:
+        index.create(conn, checkfirst=True)
+    conn.execute(text("DELETE FROM job_runs WHERE name = :name"), {"name": job_name(table)})
+
+def migrate_table(db_engine, table: str, chunk_size: int = DEFAULT_CHUNK_SIZE, pause: float = 0.0,
+                  progress: Optional[Callable[[str, int, int], None]] = None) -> dict:
+    """在线迁移一张表"""
+    started = time.monotonic()
+    with db_engine.begin() as conn:
+        if not needs_migration(conn, table):
+            return {"table": table, "skipped": True}
+        prepare(conn, table)
+
+    copied = copy_chunks(db_engine, table, chunk_size, pause, progress)
+
+    # 触发器保证新表已包含复制期间的全部变更，整体切换只需一个短事务
+    with db_engine.begin() as conn:
+        swap(conn, table)
+    return {"table": table, "copied": copied, "elapsed": time.monotonic() - started}
+
+def print_progress(table: str, done: int, total: int):
+    print(f"{table}: {done}/{total}")
+
+def migrate_database(db_engine=default_engine, chunk_size: int = DEFAULT_CHUNK_SIZE, pause: float = 0.0,
+                     progress: Optional[Callable[[str, int, int], None]] = print_progress) -> list:
+    """执行数据库迁移"""
+    models.JobRun.__table__.create(db_engine, checkfirst=True)
+    results = []
+    for table in INTEGER_COLUMNS:
+        result = migrate_table(db_engine, table, chunk_size, pause, progress)
+        print(result)
+        results.append(result)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将计数字段迁移为整数类型")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块复制的行数")
+    parser.add_argument("--pause", type=float, default=0.0, help="每块之间的暂停秒数")
+    args = parser.parse_args()
+    print("开始数据库迁移...")
+    migrate_database(chunk_size=args.chunk_size, pause=args.pause)
+    print("数据库迁移完成")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：为排行榜表添加用户展示信息及地区字段
+
+新增字段（leaderboard、leaderboard_shadow）：
+- username: 物化时的用户名快照
+- avatar: 物化时的头像快照
+- province, city: 物化时的地区快照
+
+新增字段（users）：
+- province, city: 用户所在地区
+
+同时将ix_leaderboard_period_rank重建为包含展示字段的覆盖索引，创建地区榜索引，
+并为已有榜单行回填展示信息。好友关系表friendships由应用启动时自动创建。可重复执行。
+"""
+
+import sqlite3
+import os
+
+LEADERBOARD_COLUMNS = ("username", "avatar", "province", "city")
+USER_COLUMNS = ("province", "city")
+
+RANK_INDEX_SQL = """
+CREATE INDEX ix_leaderboard_period_rank ON leaderboard (
+    period, rank, user_id, tap_count, created_at, username, avatar
+)
+"""
+
+REGION_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS ix_leaderboard_period_province_rank "
+    "ON leaderboard (period, province, rank)",
+    "CREATE INDEX IF NOT EXISTS ix_leaderboard_period_city_rank "
+    "ON leaderboard (period, province, city, rank)",
+)
+
+def add_columns(cursor, table: str, columns: tuple) -> list:
+    """为表添加缺失的字段，返回新增的字段"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {column[1] for column in cursor.fetchall()}
+    if not existing:
+        return []
+    added = []
+    for column in columns:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} VARCHAR")
+            added.append(column)
+    return added
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = "woodenfis.db"
+
+    if not os.path.exists(db_path):
+        print(f"数据库文件 {db_path} 不存在，跳过迁移")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        print("开始数据库迁移...")
+        for table, columns in (("users", USER_COLUMNS),
+                               ("leaderboard", LEADERBOARD_COLUMNS),
+                               ("leaderboard_shadow", LEADERBOARD_COLUMNS)):
+            added = add_columns(cursor, table, columns)
+            if added:
+                print(f"{table} 已添加字段: {', '.join(added)}")
+
+        cursor.execute("PRAGMA table_info(leaderboard)")
+        if not cursor.fetchall():
+            print("leaderboard表不存在，跳过")
+            conn.commit()
+            return
+
+        # 重建为覆盖索引
+        cursor.execute("DROP INDEX IF EXISTS ix_leaderboard_period_rank")
+        cursor.execute(RANK_INDEX_SQL)
+        for statement in REGION_INDEX_SQL:
+            cursor.execute(statement)
+
+        # 回填已有榜单行的展示信息
+        cursor.execute("""
+        UPDATE leaderboard
+        SET (username, avatar, province, city) = (
+            SELECT username, avatar, province, city FROM users WHERE users.id = leaderboard.user_id
+        )
+        WHERE username IS NULL
+        """)
+        print(f"已回填 {cursor.rowcount} 条榜单记录")
+
+        conn.commit()
+        print("数据库迁移完成")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"迁移失败: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
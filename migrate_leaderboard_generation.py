@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：排行榜按代次切换
+
+- leaderboard表新增generation字段（已有行为代次0）
+- 创建leaderboard_generations表，记录各周期当前生效的代次
+- 重建leaderboard的四个索引，在period之后加入generation
+- 删除不再使用的leaderboard_shadow表
+
+需在migrate_leaderboard_fields之后、migrate_integer_columns之前执行。可重复执行。
+"""
+
+import sqlite3
+import os
+
+GENERATIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS leaderboard_generations (
+    period VARCHAR NOT NULL PRIMARY KEY,
+    generation INTEGER
+)
+"""
+
+INDEX_SQL = {
+    "ix_leaderboard_period_user": "period, generation, user_id",
+    "ix_leaderboard_period_rank": "period, generation, rank, user_id, tap_count, created_at, username, avatar",
+    "ix_leaderboard_period_province_rank": "period, generation, province, rank",
+    "ix_leaderboard_period_city_rank": "period, generation, province, city, rank",
+}
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = "woodenfis.db"
+
+    if not os.path.exists(db_path):
+        print(f"数据库文件 {db_path} 不存在，跳过迁移")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        print("开始数据库迁移...")
+        cursor.execute("PRAGMA table_info(leaderboard)")
+        columns = {column[1] for column in cursor.fetchall()}
+        if not columns:
+            print("leaderboard表不存在，跳过")
+            return
+
+        if "generation" not in columns:
+            cursor.execute("ALTER TABLE leaderboard ADD COLUMN generation INTEGER DEFAULT 0")
+            print("leaderboard 已添加字段: generation")
+        cursor.execute(GENERATIONS_TABLE_SQL)
+
+        for name, index_columns in INDEX_SQL.items():
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            cursor.execute(f"CREATE INDEX {name} ON leaderboard ({index_columns})")
+        print("已重建排行榜索引")
+
+        cursor.execute("DROP TABLE IF EXISTS leaderboard_shadow")
+
+        conn.commit()
+        print("数据库迁移完成")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"迁移失败: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
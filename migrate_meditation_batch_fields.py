@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：冥想记录保存上传批次
+
+新增字段（meditation_sessions）：
+- client_id: 客户端安装标识
+- batch_seq: 客户端内的批次序号
+
+并建立(user_id, client_id, batch_seq)唯一索引，重试的批次按此返回原记录。可重复执行。
+"""
+
+import sqlite3
+import os
+
+COLUMNS = (("client_id", "VARCHAR"), ("batch_seq", "INTEGER"))
+
+INDEX_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS ux_meditation_sessions_batch
+ON meditation_sessions (user_id, client_id, batch_seq)
+"""
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = "woodenfis.db"
+
+    if not os.path.exists(db_path):
+        print(f"数据库文件 {db_path} 不存在，跳过迁移")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        print("开始数据库迁移...")
+        cursor.execute("PRAGMA table_info(meditation_sessions)")
+        existing = {column[1] for column in cursor.fetchall()}
+        if not existing:
+            print("meditation_sessions表不存在，跳过")
+            return
+
+        for column, column_type in COLUMNS:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE meditation_sessions ADD COLUMN {column} {column_type}")
+                print(f"meditation_sessions 已添加字段: {column}")
+        cursor.execute(INDEX_SQL)
+
+        conn.commit()
+        print("数据库迁移完成")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"迁移失败: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
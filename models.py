@@ -1,11 +1,12 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
+from id_generator import new_id
 import datetime
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True, nullable=True)  # 邮箱改为可空
     phone = Column(String, unique=True, index=True, nullable=True)  # 手机号改为可空（第三方登录可能没有手机号）
@@ -13,53 +14,111 @@ class User(Base):
     avatar = Column(String, nullable=True)
     is_vip = Column(Boolean, default=False)
     vip_expire_date = Column(DateTime, nullable=True)
-    merit_points = Column(String, default="0")  # 修改为String类型
+    merit_points = Column(Integer, default=0)
     # 第三方登录备份字段
     backup_phone = Column(String, nullable=True, index=True)  # 备份手机号，用于第三方登录用户绑定手机号
-    login_type = Column(String, default="phone")  # 登录类型：phone, apple, wechat
+    login_type = Column(String, default="phone", index=True)  # 登录类型：phone, apple, wechat
     is_phone_verified = Column(Boolean, default=False)  # 手机号是否已验证
+    # 所在地区，用于地区排行榜
+    province = Column(String, nullable=True)
+    city = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class VerificationCode(Base):
     """验证码存储表"""
     __tablename__ = "verification_codes"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
-    phone = Column(String, index=True)
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
+    phone = Column(String)
     code = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     expires_at = Column(DateTime)  # 过期时间
     used = Column(Boolean, default=False)  # 是否已使用
 
+    __table_args__ = (
+        # 发送频率检查：按手机号查最近发送时间
+        Index("ix_verification_codes_phone_created", "phone", "created_at"),
+        # 校验验证码：按手机号、验证码查未使用且未过期的记录
+        Index("ix_verification_codes_phone_code", "phone", "code", "used", "expires_at"),
+        # 后台清理按过期时间分批查找
+        Index("ix_verification_codes_expires", "expires_at"),
+    )
+
+class VerificationCodeArchive(Base):
+    """已过期验证码的冷数据表，仅供审计查询，不存验证码本身"""
+    __tablename__ = "verification_code_archive"
+    id = Column(String, primary_key=True)  # 沿用原验证码记录的id
+    phone = Column(String)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    used = Column(Boolean)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class UserStat(Base):
     __tablename__ = "user_stats"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
-    user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
-    total_taps = Column(String, default="0")  # 修改为String类型
-    today_taps = Column(String, default="0")  # 修改为String类型
-    consecutive_days = Column(String, default="0")  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
+    user_id = Column(String, ForeignKey("users.id"), index=True, unique=True)  # 每个用户一行
+    total_taps = Column(Integer, default=0)
+    today_taps = Column(Integer, default=0)
+    consecutive_days = Column(Integer, default=0)
     last_tap_date = Column(DateTime, nullable=True)
     user = relationship("User")
 
+class TapHistogram(Base):
+    """用户敲击时间分桶（近期按小时，过保留期后合并为按天）"""
+    __tablename__ = "tap_histograms"
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)  # 桶起始时间（UTC）
+    taps = Column(Integer, default=0)
+
+    # 按时间范围汇总全部用户时使用的覆盖索引
+    __table_args__ = (Index("ix_tap_histograms_bucket_user", "bucket_start", "user_id", "taps"),)
+
+class JobRun(Base):
+    """后台任务运行记录（用于重启后补跑）"""
+    __tablename__ = "job_runs"
+    name = Column(String, primary_key=True)  # 任务名称
+    last_run_key = Column(String)  # 最近一次完成的批次标识，如日期
+    finished_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class RevokedToken(Base):
+    """已吊销的会话令牌，令牌到期后删除"""
+    __tablename__ = "revoked_tokens"
+    jti = Column(String, primary_key=True)  # 令牌ID
+    user_id = Column(String)
+    expires_at = Column(DateTime, index=True)  # 令牌过期时间
+    revoked_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class MeditationSession(Base):
     __tablename__ = "meditation_sessions"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
     user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
-    duration = Column(String)  # 修改为String类型，秒
-    tap_count = Column(String)  # 修改为String类型
+    duration = Column(Integer)  # 秒
+    tap_count = Column(Integer)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # 上传时的客户端批次，重试的批次按此返回原记录；旧客户端不携带，为空
+    client_id = Column(String, nullable=True)
+    batch_seq = Column(Integer, nullable=True)
     user = relationship("User")
 
+    __table_args__ = (
+        # 按用户取最近的冥想记录
+        Index("ix_meditation_sessions_user_created", "user_id", "created_at"),
+        # 同一批次只写入一条记录（为空的批次不参与唯一性判断）
+        Index("ux_meditation_sessions_batch", "user_id", "client_id", "batch_seq", unique=True),
+    )
+
 class Achievement(Base):
     __tablename__ = "achievements"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
     name = Column(String)
     description = Column(String)
     icon = Column(String)
 
 class UserAchievement(Base):
     __tablename__ = "user_achievements"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
-    user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
+    user_id = Column(String, ForeignKey("users.id"), index=True)  # 修改为String类型
     achievement_id = Column(String, ForeignKey("achievements.id"))  # 修改为String类型
     unlocked_at = Column(DateTime, default=datetime.datetime.utcnow)
     user = relationship("User")
@@ -67,26 +126,69 @@ class UserAchievement(Base):
 
 class Leaderboard(Base):
     __tablename__ = "leaderboard"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
     user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
     period = Column(String)  # daily, weekly
-    rank = Column(String)  # 修改为String类型
-    tap_count = Column(String)  # 修改为String类型
+    rank = Column(Integer)
+    tap_count = Column(Integer)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # 物化时写入的用户展示信息快照，读取榜单时无需关联users表
+    username = Column(String, nullable=True)
+    avatar = Column(String, nullable=True)
+    province = Column(String, nullable=True)
+    city = Column(String, nullable=True)
+    # 榜单代次，读取方只读取leaderboard_generations中记录的当前代次
+    generation = Column(Integer, default=0)
     user = relationship("User")
 
+# 按用户定位名次
+Index("ix_leaderboard_period_user", Leaderboard.period, Leaderboard.generation, Leaderboard.user_id)
+# 按名次读取榜单的覆盖索引（包含响应所需的全部列）
+Index(
+    "ix_leaderboard_period_rank",
+    Leaderboard.period, Leaderboard.generation, Leaderboard.rank, Leaderboard.user_id, Leaderboard.tap_count,
+    Leaderboard.created_at, Leaderboard.username, Leaderboard.avatar
+)
+# 省份榜、城市榜按全国名次顺序读取
+Index("ix_leaderboard_period_province_rank",
+      Leaderboard.period, Leaderboard.generation, Leaderboard.province, Leaderboard.rank)
+Index("ix_leaderboard_period_city_rank",
+      Leaderboard.period, Leaderboard.generation, Leaderboard.province, Leaderboard.city, Leaderboard.rank)
+
+class LeaderboardGeneration(Base):
+    """各周期当前生效的榜单代次，物化任务写完新代次后更新此行即完成切换；无记录时为0"""
+    __tablename__ = "leaderboard_generations"
+    period = Column(String, primary_key=True)  # daily, weekly
+    generation = Column(Integer, default=0)
+
+class LeaderboardArchive(Base):
+    """已结束周期的排行榜归档，整个榜单编码压缩为一个数据块"""
+    __tablename__ = "leaderboard_archives"
+    period = Column(String, primary_key=True)  # daily, weekly
+    period_start = Column(String, primary_key=True)  # 周期起始日（日切时区，ISO格式）
+    entry_count = Column(Integer)
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Friendship(Base):
+    """好友关系，互为好友时双方各存一行"""
+    __tablename__ = "friendships"
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    friend_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class ShareTask(Base):
     __tablename__ = "share_tasks"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
     title = Column(String)
     description = Column(String)
-    merit = Column(String)  # 修改为String类型
+    merit = Column(Integer)
     icon = Column(String)
 
 class UserShareTask(Base):
     __tablename__ = "user_share_tasks"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
-    user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
+    user_id = Column(String, ForeignKey("users.id"), index=True)  # 修改为String类型
     task_id = Column(String, ForeignKey("share_tasks.id"))  # 修改为String类型
     completed = Column(Boolean, default=False)
     completed_at = Column(DateTime, nullable=True)
@@ -96,13 +198,18 @@ class UserShareTask(Base):
 class ThirdPartyAuth(Base):
     """第三方认证信息表"""
     __tablename__ = "third_party_auth"
-    id = Column(String, primary_key=True, index=True)  # 修改为String类型
-    user_id = Column(String, ForeignKey("users.id"))  # 修改为String类型
-    platform = Column(String, index=True)  # apple, wechat
-    platform_user_id = Column(String, index=True)  # 第三方平台的用户ID
+    id = Column(String, primary_key=True, default=new_id)  # 时间有序主键
+    user_id = Column(String, ForeignKey("users.id"), index=True)  # 修改为String类型
+    platform = Column(String)  # apple, wechat
+    platform_user_id = Column(String)  # 第三方平台的用户ID
     access_token = Column(String, nullable=True)  # 访问令牌
     refresh_token = Column(String, nullable=True)  # 刷新令牌
     expires_at = Column(DateTime, nullable=True)  # 令牌过期时间
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+    # 同一平台用户只对应一条认证记录
+    __table_args__ = (
+        Index("ux_third_party_auth_platform_user", "platform", "platform_user_id", unique=True),
+    )
\ No newline at end of file
@@ -0,0 +1,32 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+# 日切使用的时区偏移（小时），默认北京时间
+UTC_OFFSET_HOURS = int(os.getenv('ROLLOVER_UTC_OFFSET_HOURS', '8'))
+
+def local_today(now: Optional[datetime] = None) -> date:
+    """按日切时区获取当前日期"""
+    return local_day(now or datetime.utcnow())
+
+def local_day(moment: datetime) -> date:
+    """UTC时间对应的日切时区日期"""
+    return (moment + timedelta(hours=UTC_OFFSET_HOURS)).date()
+
+def day_start_utc(day: date) -> datetime:
+    """日切时区某日零点对应的UTC时间"""
+    return datetime.combine(day, datetime.min.time()) - timedelta(hours=UTC_OFFSET_HOURS)
+
+def week_start(day: date) -> date:
+    """某日所在周的周一"""
+    return day - timedelta(days=day.weekday())
+
+def period_range(period: str, day: date):
+    """某日所属周期（daily、weekly）的UTC起止时间"""
+    if period == "weekly":
+        start_day = week_start(day)
+        end_day = start_day + timedelta(days=7)
+    else:
+        start_day = day
+        end_day = day + timedelta(days=1)
+    return day_start_utc(start_day), day_start_utc(end_day)
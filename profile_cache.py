@@ -0,0 +1,116 @@
+"""
+用户资料缓存
+
+GET /users/{user_id}读多写少，按用户缓存序列化后的资料（UserOut的JSON字节），
+命中时不访问数据库也不做Pydantic转换。容量有上限，按最近使用淘汰，条目到期后重新查询；
+不存在的用户缓存为空条目（有效期较短），避免反复查询不存在的ID。
+
+crud中所有修改users表的函数在提交后调用invalidate，本进程内的缓存随即失效；
+多进程部署时其他进程最长在ttl后读到新资料。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+class ProfileCache:
+    """LRU+TTL缓存，支持空条目"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, negative_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # 键 -> (到期时间, 序列化资料或None)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[bytes]]]" = OrderedDict()
+        # 每次失效递增，查询期间发生过失效的结果不写入缓存，避免旧资料覆盖失效
+        self._generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id: Hashable) -> str:
+        return str(user_id)
+
+    def _lookup(self, key: str) -> Tuple[bool, Optional[bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, body = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    if body is None:
+                        self.negative_hits += 1
+                    else:
+                        self.hits += 1
+                    return True, body
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def _store(self, key: str, body: Optional[bytes], generation: int):
+        ttl = self.negative_ttl if body is None else self.ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_load(self, user_id: Hashable,
+                          load: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        """返回用户资料的序列化结果，用户不存在时返回None；未命中时调用load查询"""
+        key = self._key(user_id)
+        found, body = self._lookup(key)
+        if found:
+            return body
+        generation = self._generation
+        body = await load()
+        self._store(key, body, generation)
+        return body
+
+    def invalidate(self, user_id: Hashable):
+        """资料修改或用户创建后调用"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(self._key(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# 全局用户资料缓存
+profile_cache = ProfileCache(
+    max_entries=int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', '10000')),
+    ttl=float(os.getenv('PROFILE_CACHE_TTL', '60')),
+    negative_ttl=float(os.getenv('PROFILE_CACHE_NEGATIVE_TTL', '5'))
+)
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+class CachedResponse:
+    """已序列化的响应体及其强ETag"""
+    __slots__ = ("body", "etag", "version", "expires_at")
+
+    def __init__(self, body: bytes, version, expires_at: Optional[float]):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.version = version
+        self.expires_at = expires_at
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match是否命中当前ETag"""
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+class ResponseCache:
+    """按版本失效的响应缓存
+
+    数据源能提供版本号时，版本变化即失效；不能提供时（版本为None）按ttl过期。
+    同一键并发未命中时只有一个请求重新计算，其余请求等待并复用结果。
+    """
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._async_key_locks: Dict[Hashable, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key: Hashable, version) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_or_compute(self, key: Hashable, version, compute: Callable[[], bytes]) -> CachedResponse:
+        """返回键对应的缓存响应，未命中或已失效时调用compute重新生成"""
+        with self._lock:
+            entry = self._fresh(key, version)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # 等待期间其他请求可能已完成计算
+            with self._lock:
+                entry = self._fresh(key, version)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+            return self._store(key, version, compute())
+
+    async def get_or_compute_async(self, key: Hashable, version,
+                                   compute: Callable[[], Awaitable[bytes]]) -> CachedResponse:
+        """get_or_compute的协程版本，compute为协程函数，等待重新计算时不阻塞事件循环"""
+        with self._lock:
+            entry = self._fresh(key, version)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            key_lock = self._async_key_locks.setdefault(key, asyncio.Lock())
+
+        async with key_lock:
+            with self._lock:
+                entry = self._fresh(key, version)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+            return self._store(key, version, await compute())
+
+    def _store(self, key: Hashable, version, body: bytes) -> CachedResponse:
+        expires_at = time.monotonic() + self.ttl if version is None else None
+        entry = CachedResponse(body, version, expires_at)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+                self._async_key_locks.pop(evicted, None)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# 排行榜响应缓存
+leaderboard_cache = ResponseCache(
+    ttl=float(os.getenv('LEADERBOARD_CACHE_TTL', '5')),
+    max_entries=int(os.getenv('LEADERBOARD_CACHE_MAX_ENTRIES', '1024'))
+)
@@ -27,6 +27,12 @@ class VerifyCodeRequest(BaseModel):
     phone: str
     code: str
 
+class TokenUser(BaseModel):
+    """会话令牌中的用户身份"""
+    id: str
+    jti: str
+    expires_at: int
+
 class SendCodeResponse(BaseModel):
     """发送验证码响应"""
     message: str
@@ -35,7 +41,7 @@ class SendCodeResponse(BaseModel):
 class LoginResponse(BaseModel):
     """登录响应"""
     user: 'UserOut'
-    token: Optional[str] = None  # 如果需要JWT token
+    token: Optional[str] = None  # 会话令牌
     message: str
 
 class UserOut(BaseModel):
@@ -50,11 +56,22 @@ class UserOut(BaseModel):
     backup_phone: Optional[str] = None
     login_type: str
     is_phone_verified: bool
+    province: Optional[str] = None
+    city: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class RegionUpdate(BaseModel):
+    """更新用户地区"""
+    province: Optional[str] = None
+    city: Optional[str] = None
+
+class FriendCreate(BaseModel):
+    """添加好友"""
+    friend_id: int
+
 class UserStatOut(BaseModel):
     total_taps: int
     today_taps: int
@@ -64,17 +81,52 @@ class UserStatOut(BaseModel):
     class Config:
         from_attributes = True
 
+class TapBatchCreate(BaseModel):
+    """批量上报敲击"""
+    count: int
+    started_at: datetime
+    ended_at: datetime
+    client_id: Optional[str] = None  # 客户端安装标识，用于重试去重
+    batch_seq: Optional[int] = None  # 客户端内单调递增的批次序号
+
+class TapBatchAck(BaseModel):
+    """批量上报敲击响应"""
+    user_id: int
+    accepted: int
+    pending_taps: int  # 已接收但尚未落库的敲击数
+    duplicate: bool = False  # 是否为已接收过的重复批次
+
+class TapHistogramPoint(BaseModel):
+    """敲击分布图数据点"""
+    bucket_start: datetime
+    taps: int
+
+class TapHistogramOut(BaseModel):
+    """敲击分布图"""
+    range: str  # day, week, month
+    granularity: str  # hour, day
+    points: List[TapHistogramPoint]
+
 class MeditationSessionCreate(BaseModel):
     duration: int
     tap_count: int
+    client_id: Optional[str] = None  # 客户端安装标识，用于重试去重
+    batch_seq: Optional[int] = None  # 客户端内单调递增的批次序号
 
-class MeditationSessionOut(MeditationSessionCreate):
+class MeditationSessionOut(BaseModel):
     id: int
+    duration: int
+    tap_count: int
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class AchievementCreate(BaseModel):
+    name: str
+    description: str
+    icon: str
+
 class AchievementOut(BaseModel):
     id: int
     name: str
@@ -98,10 +150,25 @@ class LeaderboardOut(BaseModel):
     tap_count: int
     created_at: datetime
     username: str
+    avatar: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+class LeaderboardAroundOut(BaseModel):
+    """用户名次及上下相邻用户"""
+    period: str
+    user_id: int
+    rank: int
+    tap_count: int
+    entries: List[LeaderboardOut]
+
+class ShareTaskCreate(BaseModel):
+    title: str
+    description: str
+    merit: int
+    icon: Optional[str] = None
+
 class ShareTaskOut(BaseModel):
     id: int
     title: str
@@ -0,0 +1,126 @@
+"""
+会话令牌
+
+登录成功后签发HS256签名的访问令牌（sub为用户ID，jti为令牌ID），校验只需验证签名和有效期，
+不查询数据库。最近校验通过的令牌放入LRU，重复请求跳过签名计算。
+
+吊销列表按jti保存在内存中（并写入revoked_tokens表，重启后加载），校验时一次字典查找；
+条目在令牌到期后清除，列表大小只与有效期内被吊销的令牌数有关。
+多进程部署时其他进程在下次加载吊销列表前仍接受已吊销的令牌，需要立即生效时应缩短令牌有效期。
+"""
+
+import os
+import secrets
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import jwt
+
+import models
+from id_generator import new_id
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+
+class TokenService:
+    """签发、校验及吊销会话令牌"""
+
+    def __init__(self, secret: str, ttl: float = 7 * 24 * 3600, cache_size: int = 10000, clock=time.time):
+        self.secret = secret
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        # 令牌 -> (用户ID, jti, 过期时间)
+        self._verified: "OrderedDict[str, Tuple[str, str, int]]" = OrderedDict()
+        # jti -> 过期时间
+        self._revoked: Dict[str, int] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def issue(self, user_id) -> str:
+        """为用户签发令牌"""
+        now = int(self._clock())
+        claims = {"sub": str(user_id), "jti": new_id(), "iat": now, "exp": now + int(self.ttl)}
+        return jwt.encode(claims, self.secret, algorithm=ALGORITHM)
+
+    def verify(self, token: str) -> Optional[Tuple[str, str, int]]:
+        """校验令牌，返回(用户ID, jti, 过期时间)，无效、过期或已吊销时返回None"""
+        now = self._clock()
+        with self._lock:
+            entry = self._verified.get(token)
+            if entry is not None:
+                self._verified.move_to_end(token)
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+        if entry is None:
+            try:
+                claims = jwt.decode(token, self.secret, algorithms=[ALGORITHM],
+                                    options={"require": ["sub", "jti", "exp"], "verify_exp": False})
+            except jwt.InvalidTokenError:
+                return None
+            entry = (claims["sub"], claims["jti"], int(claims["exp"]))
+            with self._lock:
+                self._verified[token] = entry
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+
+        # 有效期和吊销在缓存命中时同样检查
+        if entry[2] <= now or entry[1] in self._revoked:
+            return None
+        return entry
+
+    def revoke(self, jti: str, expires_at: int):
+        """吊销令牌（内存中立即生效）"""
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._purge(self._clock())
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def _purge(self, now: float):
+        expired = [jti for jti, expires_at in self._revoked.items() if expires_at <= now]
+        for jti in expired:
+            del self._revoked[jti]
+
+    def load_revoked(self, session_factory):
+        """从revoked_tokens表加载未过期的吊销记录，并删除已过期的记录"""
+        now = datetime.utcfromtimestamp(self._clock())
+        db = session_factory()
+        try:
+            db.query(models.RevokedToken).filter(models.RevokedToken.expires_at <= now).delete(
+                synchronize_session=False)
+            db.commit()
+            rows = db.query(models.RevokedToken.jti, models.RevokedToken.expires_at).all()
+        finally:
+            db.close()
+        with self._lock:
+            for jti, expires_at in rows:
+                self._revoked[jti] = int((expires_at - datetime(1970, 1, 1)).total_seconds())
+
+    def snapshot(self) -> dict:
+        return {"cached": len(self._verified), "revoked": len(self._revoked),
+                "cache_hits": self.cache_hits, "cache_misses": self.cache_misses}
+
+def load_secret() -> str:
+    secret = os.getenv('SESSION_TOKEN_SECRET', '')
+    if not secret:
+        # 未配置时每次启动随机生成，重启后已签发的令牌全部失效
+        logger.warning("未配置SESSION_TOKEN_SECRET，使用随机密钥")
+        secret = secrets.token_urlsafe(32)
+    return secret
+
+# 全局令牌服务
+token_service = TokenService(
+    load_secret(),
+    ttl=float(os.getenv('SESSION_TOKEN_TTL', str(7 * 24 * 3600))),
+    cache_size=int(os.getenv('SESSION_TOKEN_CACHE_SIZE', '10000'))
+)
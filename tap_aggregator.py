@@ -0,0 +1,140 @@
+import os
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import SessionLocal
+from tap_log import tap_event_log
+import crud
+
+logger = logging.getLogger(__name__)
+
+class TapAggregator:
+    """敲击计数写后聚合器
+
+    敲击先追加到事件日志，再在进程内按用户合并，由后台线程定期批量写入user_stats，
+    避免每次敲击都提交一次事务。
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_interval: Optional[float] = None, event_log=None):
+        self.session_factory = session_factory
+        self.event_log = event_log
+        if flush_interval is None:
+            flush_interval = float(os.getenv('TAP_FLUSH_INTERVAL', '2'))
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_tap_at: Dict[str, datetime] = {}
+        self._hourly: Dict[Tuple[str, datetime], int] = {}
+        self._listeners: List[Callable[[Dict[str, int], Dict[str, datetime]], None]] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, user_id, count: int, tapped_at: Optional[datetime] = None) -> int:
+        """记录一批敲击，返回该用户尚未落库的敲击数"""
+        key = str(user_id)
+        tapped_at = tapped_at or datetime.utcnow()
+        if tapped_at.tzinfo is not None:
+            # 数据库中统一存储UTC时间（不带时区）
+            tapped_at = tapped_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if self.event_log is not None:
+            # 先顺序写入事件日志，再进入聚合缓冲区
+            self.event_log.append(key, tapped_at, count)
+        with self._lock:
+            pending = self._pending.get(key, 0) + count
+            self._pending[key] = pending
+            last = self._last_tap_at.get(key)
+            if last is None or tapped_at > last:
+                self._last_tap_at[key] = tapped_at
+            bucket = (key, tapped_at.replace(minute=0, second=0, microsecond=0))
+            self._hourly[bucket] = self._hourly.get(bucket, 0) + count
+        return pending
+
+    def add_flush_listener(self, listener: Callable[[Dict[str, int], Dict[str, datetime]], None]):
+        """注册落库成功后的回调，参数为本次落库的{用户: 增量}与{用户: 最后敲击时间}；重复注册时忽略"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_flush_listener(self, listener: Callable[[Dict[str, int], Dict[str, datetime]], None]):
+        """移除落库回调"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def pending_taps(self, user_id) -> int:
+        """获取用户尚未落库的敲击数"""
+        with self._lock:
+            return self._pending.get(str(user_id), 0)
+
+    def flush(self) -> int:
+        """将缓冲区写入数据库，返回本次写入的用户数"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                last_tap_at, self._last_tap_at = self._last_tap_at, {}
+                hourly, self._hourly = self._hourly, {}
+
+            db = self.session_factory()
+            try:
+                # 分桶与累计数在同一事务中提交
+                crud.bulk_increment_tap_histogram(db, hourly)
+                crud.bulk_increment_user_taps(db, pending, last_tap_at)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"敲击数据落库失败，将在下次刷新时重试: {e}")
+                self._restore(pending, last_tap_at, hourly)
+                raise
+            finally:
+                db.close()
+
+            for listener in self._listeners:
+                try:
+                    listener(pending, last_tap_at)
+                except Exception as e:
+                    logger.error(f"敲击落库回调执行失败: {e}")
+            return len(pending)
+
+    def _restore(self, pending: Dict[str, int], last_tap_at: Dict[str, datetime],
+                 hourly: Dict[Tuple[str, datetime], int]):
+        """写入失败时将数据合并回缓冲区"""
+        with self._lock:
+            for key, count in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + count
+            for bucket, count in hourly.items():
+                self._hourly[bucket] = self._hourly.get(bucket, 0) + count
+            for key, tapped_at in last_tap_at.items():
+                last = self._last_tap_at.get(key)
+                if last is None or tapped_at > last:
+                    self._last_tap_at[key] = tapped_at
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="tap-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程并写入剩余数据"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.event_log is not None:
+            self.event_log.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # 已在flush中记录日志，数据保留在缓冲区等待重试
+                pass
+
+# 全局聚合器实例
+tap_aggregator = TapAggregator(event_log=tap_event_log)
@@ -0,0 +1,333 @@
+"""
+敲击事件日志
+
+敲击事件按顺序追加写入分段文件，作为user_stats与排行榜的恢复来源：
+- 活跃分段只追加写入，达到大小上限后封存并切换到新分段
+- 压缩：将封存分段按日汇总为每日摘要文件后删除分段
+- 回放：由每日摘要与未压缩分段从头重建UserStat与Leaderboard
+
+每日摘要头部记录已合并的最大分段号，压缩中途崩溃后重跑不会重复累计。
+"""
+
+import os
+import sys
+import struct
+import threading
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import SessionLocal
+from periods import local_day, local_today, week_start
+import models
+import crud
+
+logger = logging.getLogger(__name__)
+
+# 事件记录：用户ID、时间戳（毫秒）、敲击数
+RECORD = struct.Struct('<qqI')
+# 摘要头：魔数、已合并的最大分段号
+SUMMARY_HEADER = struct.Struct('<4sq')
+SUMMARY_MAGIC = b'TPS1'
+# 摘要条目：用户ID、敲击数、最后敲击时间戳（毫秒）
+SUMMARY_ENTRY = struct.Struct('<qqq')
+
+SEGMENT_PREFIX = 'segment-'
+SUMMARY_PREFIX = 'summary-'
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_millis(moment: datetime) -> int:
+    return int((moment - EPOCH).total_seconds() * 1000)
+
+def from_millis(millis: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=millis)
+
+class TapEventLog:
+    """分段式追加写敲击事件日志"""
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024, fsync: bool = False):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._file = None
+        self._active_seq: Optional[int] = None
+        self._next_seq: Optional[int] = None
+
+    # 写入
+
+    def append(self, user_id, tapped_at: datetime, count: int):
+        """追加一条敲击事件"""
+        record = RECORD.pack(int(user_id), to_millis(tapped_at), count)
+        with self._lock:
+            if self._file is None:
+                self._open_next_segment()
+            self._file.write(record)
+            self._file.flush()
+            if self._file.tell() >= self.segment_max_bytes:
+                self._seal_active()
+
+    def roll(self):
+        """封存当前活跃分段"""
+        with self._lock:
+            if self._file is not None:
+                self._seal_active()
+
+    def close(self):
+        """关闭日志"""
+        self.roll()
+
+    def _open_next_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._next_seq is None:
+            # 分段号需单调递增：压缩删除分段后也不能复用摘要中已记录的分段号
+            watermarks = [self._read_watermark(day) for day in self._summary_days()]
+            self._next_seq = max(self._segment_seqs() + watermarks, default=0) + 1
+        self._active_seq = self._next_seq
+        self._next_seq += 1
+        self._file = open(self._segment_path(self._active_seq), 'ab')
+
+    def _seal_active(self):
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._active_seq = None
+
+    # 文件布局
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{seq:012d}.log')
+
+    def _summary_path(self, day: date) -> str:
+        return os.path.join(self.directory, f'{SUMMARY_PREFIX}{day.isoformat()}.bin')
+
+    def _segment_seqs(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-4])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith('.log')
+        )
+
+    def _summary_days(self) -> List[date]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            date.fromisoformat(name[len(SUMMARY_PREFIX):-4])
+            for name in os.listdir(self.directory)
+            if name.startswith(SUMMARY_PREFIX) and name.endswith('.bin')
+        )
+
+    # 读取
+
+    def read_segment(self, seq: int) -> Iterator[Tuple[int, int, int]]:
+        """读取分段中的事件，忽略末尾未写完整的记录"""
+        with open(self._segment_path(seq), 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size
+        return RECORD.iter_unpack(data[:usable])
+
+    def _read_watermark(self, day: date) -> int:
+        with open(self._summary_path(day), 'rb') as f:
+            return SUMMARY_HEADER.unpack(f.read(SUMMARY_HEADER.size))[1]
+
+    def read_summary(self, day: date) -> Tuple[int, Dict[int, List[int]]]:
+        """读取每日摘要，返回(已合并的最大分段号, {用户ID: [敲击数, 最后敲击毫秒]})"""
+        path = self._summary_path(day)
+        if not os.path.exists(path):
+            return 0, {}
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, last_segment = SUMMARY_HEADER.unpack_from(data)
+        if magic != SUMMARY_MAGIC:
+            raise ValueError(f"无效的摘要文件: {path}")
+        entries = {
+            user_id: [taps, last_ms]
+            for user_id, taps, last_ms in SUMMARY_ENTRY.iter_unpack(data[SUMMARY_HEADER.size:])
+        }
+        return last_segment, entries
+
+    def _write_summary(self, day: date, last_segment: int, entries: Dict[int, List[int]]):
+        path = self._summary_path(day)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SUMMARY_HEADER.pack(SUMMARY_MAGIC, last_segment))
+            for user_id in sorted(entries):
+                taps, last_ms = entries[user_id]
+                f.write(SUMMARY_ENTRY.pack(user_id, taps, last_ms))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _segment_days(self, seq: int) -> Dict[date, Dict[int, List[int]]]:
+        """按日汇总一个分段"""
+        days: Dict[date, Dict[int, List[int]]] = defaultdict(dict)
+        for user_id, millis, count in self.read_segment(seq):
+            entry = days[local_day(from_millis(millis))].setdefault(user_id, [0, 0])
+            entry[0] += count
+            entry[1] = max(entry[1], millis)
+        return days
+
+    # 压缩
+
+    def compact(self) -> int:
+        """将已封存的分段合并到每日摘要并删除，返回压缩的分段数"""
+        with self._compact_lock:
+            with self._lock:
+                sealed = [seq for seq in self._segment_seqs() if seq != self._active_seq]
+
+            for seq in sealed:
+                for day, entries in self._segment_days(seq).items():
+                    last_segment, summary = self.read_summary(day)
+                    if last_segment >= seq:
+                        # 上次压缩已合并该分段的这一天
+                        continue
+                    for user_id, (taps, last_ms) in entries.items():
+                        current = summary.setdefault(user_id, [0, 0])
+                        current[0] += taps
+                        current[1] = max(current[1], last_ms)
+                    self._write_summary(day, seq, summary)
+                os.remove(self._segment_path(seq))
+            if sealed:
+                logger.info(f"敲击日志压缩完成，共 {len(sealed)} 个分段")
+            return len(sealed)
+
+    # 回放
+
+    def daily_totals(self) -> Dict[date, Dict[int, List[int]]]:
+        """合并每日摘要与未压缩分段，得到每日每用户的敲击汇总"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            segments = self._segment_seqs()
+
+        with self._compact_lock:
+            days: Dict[date, Dict[int, List[int]]] = {}
+            watermarks: Dict[date, int] = {}
+            for day in self._summary_days():
+                watermarks[day], days[day] = self.read_summary(day)
+
+            for seq in segments:
+                if not os.path.exists(self._segment_path(seq)):
+                    continue
+                for day, entries in self._segment_days(seq).items():
+                    if watermarks.get(day, 0) >= seq:
+                        continue
+                    summary = days.setdefault(day, {})
+                    for user_id, (taps, last_ms) in entries.items():
+                        current = summary.setdefault(user_id, [0, 0])
+                        current[0] += taps
+                        current[1] = max(current[1], last_ms)
+            return days
+
+    def rebuild(self, session_factory=SessionLocal, today: Optional[date] = None) -> dict:
+        """由事件日志从头重建user_stats及当日、当周排行榜
+
+        应在停止写入（聚合器已刷新并停止）后执行，否则缓冲区中的敲击会被重复计入。
+        """
+        today = today or local_today()
+        days = self.daily_totals()
+
+        stats: Dict[int, dict] = {}
+        active_days: Dict[int, set] = defaultdict(set)
+        for day, entries in days.items():
+            for user_id, (taps, last_ms) in entries.items():
+                stat = stats.setdefault(user_id, {'total': 0, 'today': 0, 'last_ms': 0})
+                stat['total'] += taps
+                if day == today:
+                    stat['today'] += taps
+                stat['last_ms'] = max(stat['last_ms'], last_ms)
+                active_days[user_id].add(day)
+
+        def consecutive_days(user_days: set) -> int:
+            # 与日切规则一致：截至昨日的连续敲击天数
+            count = 0
+            day = today - timedelta(days=1)
+            while day in user_days:
+                count += 1
+                day -= timedelta(days=1)
+            return count
+
+        boards = {
+            'daily': self._period_scores(days, today, today),
+            'weekly': self._period_scores(days, week_start(today), today),
+        }
+
+        db = session_factory()
+        try:
+            db.query(models.UserStat).delete()
+            if stats:
+                db.execute(models.UserStat.__table__.insert(), [
+                    {
+                        'user_id': str(user_id),
+                        'total_taps': stat['total'],
+                        'today_taps': stat['today'],
+                        'consecutive_days': consecutive_days(active_days[user_id]),
+                        'last_tap_date': from_millis(stat['last_ms'])
+                    }
+                    for user_id, stat in stats.items()
+                ])
+            for period, scores in boards.items():
+                db.query(models.Leaderboard).filter(models.Leaderboard.period == period).delete()
+                ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+                if ranked:
+                    generation = crud.get_leaderboard_generation(db, period)
+                    db.execute(models.Leaderboard.__table__.insert(), [
+                        {
+                            'user_id': str(user_id),
+                            'period': period,
+                            'rank': rank,
+                            'tap_count': taps,
+                            'created_at': datetime.utcnow(),
+                            'generation': generation
+                        }
+                        for rank, (user_id, taps) in enumerate(ranked, start=1)
+                    ])
+                    crud.fill_leaderboard_display(db, period)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        result = {
+            'users': len(stats),
+            'days': len(days),
+            'daily': len(boards['daily']),
+            'weekly': len(boards['weekly'])
+        }
+        logger.info(f"由敲击日志重建完成: {result}")
+        return result
+
+    @staticmethod
+    def _period_scores(days, start: date, end: date) -> Dict[int, int]:
+        scores: Dict[int, int] = defaultdict(int)
+        for day, entries in days.items():
+            if start <= day <= end:
+                for user_id, (taps, _) in entries.items():
+                    scores[user_id] += taps
+        return scores
+
+# 全局事件日志实例
+tap_event_log = TapEventLog(
+    os.getenv('TAP_LOG_DIR', './data/tap_log'),
+    segment_max_bytes=int(os.getenv('TAP_LOG_SEGMENT_BYTES', str(64 * 1024 * 1024))),
+    fsync=os.getenv('TAP_LOG_FSYNC', '0') == '1'
+)
+
+if __name__ == "__main__":
+    # 用法: python tap_log.py compact|rebuild
+    command = sys.argv[1] if len(sys.argv) > 1 else 'compact'
+    if command == 'compact':
+        tap_event_log.roll()
+        print(f"已压缩 {tap_event_log.compact()} 个分段")
+    elif command == 'rebuild':
+        print(tap_event_log.rebuild())
+    else:
+        print("用法: python tap_log.py compact|rebuild")
@@ -0,0 +1,82 @@
+"""
+成就及分享任务目录缓存测试
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from api import admin
+from catalog_cache import catalog_cache
+from database import SessionLocal, session_metrics
+import models
+
+ADMIN_HEADERS = {"X-Admin-Token": "test-admin-token"}
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "test-admin-token")
+    catalog_cache.invalidate()
+    yield TestClient(app)
+    db = SessionLocal()
+    db.query(models.Achievement).filter(models.Achievement.name.like("catalog-%")).delete(synchronize_session=False)
+    db.query(models.ShareTask).filter(models.ShareTask.title.like("catalog-%")).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+    catalog_cache.invalidate()
+
+class TestCatalogCache:
+    """目录缓存测试"""
+
+    def test_hit_does_not_touch_database(self, client):
+        """命中时不打开数据库会话"""
+        first = client.get("/achievements/")
+        assert first.status_code == 200
+
+        session_metrics.reset()
+        second = client.get("/achievements/")
+        assert second.content == first.content
+        assert second.headers["etag"] == first.headers["etag"]
+        snapshot = session_metrics.snapshot()
+        assert snapshot["sessions_opened"] == 0
+        assert snapshot["pool_checkouts"] == 0
+
+    def test_not_modified(self, client):
+        etag = client.get("/share/tasks").headers["etag"]
+        response = client.get("/share/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_admin_write_bumps_version(self, client):
+        """通过管理接口新增条目后目录立即更新"""
+        before = client.get("/share/tasks")
+        version = catalog_cache.version("share_tasks")
+
+        response = client.post("/admin/share/tasks", headers=ADMIN_HEADERS, json={
+            "title": "catalog-share", "description": "分享到朋友圈", "merit": 10
+        })
+        assert response.status_code == 200
+        assert catalog_cache.version("share_tasks") == version + 1
+
+        after = client.get("/share/tasks")
+        assert after.headers["etag"] != before.headers["etag"]
+        assert "catalog-share" in [task["title"] for task in after.json()]
+
+    def test_invalidate_after_direct_edit(self, client):
+        """直接修改数据库后，调用失效接口才会读到新数据"""
+        client.get("/achievements/")
+        db = SessionLocal()
+        db.add(models.Achievement(name="catalog-direct", description="直接写入", icon="x"))
+        db.commit()
+        db.close()
+
+        assert "catalog-direct" not in [a["name"] for a in client.get("/achievements/").json()]
+        response = client.post("/admin/catalog/invalidate", params={"catalog": "achievements"}, headers=ADMIN_HEADERS)
+        assert response.status_code == 200
+        assert "catalog-direct" in [a["name"] for a in client.get("/achievements/").json()]
+
+    def test_admin_auth(self, client, monkeypatch):
+        assert client.post("/admin/catalog/invalidate").status_code == 401
+        assert client.post("/admin/catalog/invalidate", params={"catalog": "nope"},
+                           headers=ADMIN_HEADERS).status_code == 404
+        monkeypatch.setattr(admin, "ADMIN_TOKEN", "")
+        assert client.post("/admin/catalog/invalidate", headers=ADMIN_HEADERS).status_code == 403
@@ -0,0 +1,146 @@
+"""
+日切任务测试
+"""
+
+import pytest
+from datetime import date, timedelta
+
+from database import SessionLocal
+import daily_rollover
+from daily_rollover import (run_daily_rollover, day_start_utc, get_last_run_key, record_job_run, JOB_NAME,
+                            PROGRESS_JOB_NAME, DailyRolloverScheduler)
+from periods import local_today
+import models
+
+@pytest.fixture
+def stats():
+    """创建三类用户的统计记录"""
+    closing_day = date(2025, 3, 1)
+    day_start = day_start_utc(closing_day)
+    db = SessionLocal()
+    db.add_all([
+        # 当天有敲击：连续天数加一
+        models.UserStat(id="1", user_id="1", total_taps="100", today_taps="30", consecutive_days="4",
+                        last_tap_date=day_start + timedelta(hours=5)),
+        # 前一天之后再无敲击：连续天数清零
+        models.UserStat(id="2", user_id="2", total_taps=50, today_taps=0, consecutive_days=3,
+                        last_tap_date=day_start - timedelta(hours=1)),
+        # 从未敲击
+        models.UserStat(id="3", user_id="3", total_taps=0, today_taps=0, consecutive_days=0),
+        models.TapHistogram(user_id="1", granularity="hour", bucket_start=day_start + timedelta(hours=5), taps=30),
+    ])
+    db.commit()
+    yield closing_day
+    db.query(models.UserStat).delete()
+    db.query(models.TapHistogram).delete()
+    db.query(models.JobRun).delete()
+    db.commit()
+    db.close()
+
+class TestDailyRollover:
+    """日切测试"""
+
+    def test_rollover_updates_all_rows_in_chunks(self, stats):
+        """分块更新所有行并上报进度"""
+        progress = []
+        metrics = run_daily_rollover(stats, chunk_size=2, progress=progress.append)
+
+        assert metrics['rows'] == 3
+        assert metrics['chunks'] == 2
+        assert [p['rows'] for p in progress] == [2, 3]
+
+        db = SessionLocal()
+        rows = {s.user_id: s for s in db.query(models.UserStat).all()}
+        assert int(rows["1"].consecutive_days) == 5
+        assert int(rows["2"].consecutive_days) == 0
+        assert int(rows["3"].consecutive_days) == 0
+        assert all(int(s.today_taps) == 0 for s in rows.values())
+        assert int(rows["1"].total_taps) == 100
+        assert get_last_run_key(db, JOB_NAME) == "2025-03-01"
+        db.close()
+
+    def test_scheduler_skips_completed_day(self, stats):
+        """上一自然日已日切时不重复执行"""
+        scheduler = DailyRolloverScheduler()
+        assert scheduler.run_pending() is not None
+        assert scheduler.run_pending() is None
+
+    def test_rollover_ignores_later_taps(self, stats):
+        """补跑旧日期时，之后才有敲击的用户不计入当日"""
+        db = SessionLocal()
+        db.query(models.UserStat).filter_by(user_id="2").update(
+            {"last_tap_date": day_start_utc(stats + timedelta(days=1)) + timedelta(hours=1)})
+        db.commit()
+        db.close()
+
+        run_daily_rollover(stats)
+        db = SessionLocal()
+        assert int(db.query(models.UserStat).filter_by(user_id="2").one().consecutive_days) == 0
+        db.close()
+
+    def test_scheduler_catches_up_missed_days(self, stats, monkeypatch):
+        """停机错过的日期逐日补跑，每天记录一次完成"""
+        yesterday = local_today() - timedelta(days=1)
+        db = SessionLocal()
+        record_job_run(db, JOB_NAME, (yesterday - timedelta(days=3)).isoformat())
+        db.close()
+
+        days = []
+        original = daily_rollover.run_daily_rollover
+
+        def run(closing_day, session_factory):
+            db = SessionLocal()
+            try:
+                # 每天开始前前一天已记录完成
+                assert get_last_run_key(db, JOB_NAME) == (closing_day - timedelta(days=1)).isoformat()
+            finally:
+                db.close()
+            days.append(closing_day)
+            return original(closing_day, session_factory)
+
+        monkeypatch.setattr(daily_rollover, "run_daily_rollover", run)
+        assert DailyRolloverScheduler().run_pending() is not None
+        assert days == [yesterday - timedelta(days=n) for n in (2, 1, 0)]
+        assert DailyRolloverScheduler().run_pending() is None
+
+    def test_taps_after_midnight_keep_streak(self, stats):
+        """零点之后又有敲击的用户保留连续天数，今日敲击数只扣除日切当天的部分"""
+        db = SessionLocal()
+        db.query(models.UserStat).filter_by(user_id="1").update({
+            "today_taps": 42, "last_tap_date": day_start_utc(stats + timedelta(days=1)) + timedelta(minutes=5)
+        })
+        db.commit()
+        db.close()
+
+        run_daily_rollover(stats)
+        db = SessionLocal()
+        row = db.query(models.UserStat).filter_by(user_id="1").one()
+        assert int(row.consecutive_days) == 5
+        assert int(row.today_taps) == 12
+        db.close()
+
+    def test_retry_resumes_after_committed_chunks(self, stats, monkeypatch):
+        """分块中途失败后重试，已提交的分块不重复加一"""
+        executed = []
+        original = daily_rollover.set_job_run
+
+        def fail_after_first_chunk(db, name, run_key):
+            original(db, name, run_key)
+            executed.append(run_key)
+            if len(executed) == 2:
+                raise RuntimeError("模拟中断")
+
+        monkeypatch.setattr(daily_rollover, "set_job_run", fail_after_first_chunk)
+        with pytest.raises(RuntimeError):
+            run_daily_rollover(stats, chunk_size=1)
+        monkeypatch.setattr(daily_rollover, "set_job_run", original)
+
+        db = SessionLocal()
+        assert get_last_run_key(db, PROGRESS_JOB_NAME) == f"{stats.isoformat()}/1"
+        db.close()
+        metrics = run_daily_rollover(stats, chunk_size=1)
+        assert metrics['chunks'] == 2
+
+        db = SessionLocal()
+        assert int(db.query(models.UserStat).filter_by(user_id="1").one().consecutive_days) == 5
+        db.close()
@@ -0,0 +1,162 @@
+"""
+数据库引擎及SQLite连接配置测试
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from database import (SessionLocal, async_session_scope, create_async_db_engine, create_sqlite_engine,
+                      get_sqlite_pragmas, session_metrics)
+import models
+
+def read_pragmas(db_engine) -> dict:
+    with db_engine.connect() as conn:
+        return {
+            name: conn.execute(text(f"PRAGMA {name}")).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store")
+        }
+
+class TestSQLiteProfile:
+    """SQLite连接配置测试"""
+
+    def test_production_profile(self, tmp_path):
+        """生产预设在每个连接上生效"""
+        db_engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'p.db'}", profile="production")
+        assert read_pragmas(db_engine) == {
+            "journal_mode": "wal",
+            "synchronous": 1,  # NORMAL
+            "busy_timeout": 5000,
+            "cache_size": -65536,
+            "temp_store": 2,  # MEMORY
+        }
+        db_engine.dispose()
+
+    def test_default_profile(self, tmp_path):
+        db_engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'd.db'}", profile="default")
+        pragmas = read_pragmas(db_engine)
+        assert pragmas["journal_mode"] == "delete"
+        assert pragmas["synchronous"] == 2  # FULL
+        db_engine.dispose()
+
+    def test_env_override(self, monkeypatch):
+        monkeypatch.setenv("SQLITE_SYNCHRONOUS", "FULL")
+        monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "10000")
+        pragmas = get_sqlite_pragmas("production")
+        assert pragmas["synchronous"] == "FULL"
+        assert pragmas["busy_timeout"] == "10000"
+        assert pragmas["journal_mode"] == "WAL"
+
+    def test_invalid_config(self, monkeypatch):
+        with pytest.raises(ValueError):
+            get_sqlite_pragmas("fastest")
+        monkeypatch.setenv("SQLITE_CACHE_SIZE", "1; DROP TABLE users")
+        with pytest.raises(ValueError):
+            get_sqlite_pragmas("production")
+
+class TestAsyncEngine:
+    """异步引擎测试"""
+
+    def test_pragmas_applied(self, tmp_path):
+        """aiosqlite连接同样按配置设置PRAGMA"""
+        async def run():
+            db_engine = create_async_db_engine(f"sqlite+aiosqlite:///{tmp_path / 'a.db'}", profile="production")
+            async with db_engine.connect() as conn:
+                journal_mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                busy_timeout = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+            await db_engine.dispose()
+            return journal_mode, busy_timeout
+
+        assert asyncio.run(run()) == ("wal", 5000)
+
+    def test_mixed_sync_and_async(self, tmp_path):
+        """同步引擎写入的数据可由异步会话并发读取，异步会话也可执行同步函数"""
+        path = tmp_path / "m.db"
+        sync_engine = create_sqlite_engine(f"sqlite:///{path}")
+        with sync_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+            conn.execute(text("INSERT INTO t (id, v) VALUES (1, 42)"))
+
+        async def run():
+            db_engine = create_async_db_engine(f"sqlite+aiosqlite:///{path}")
+            session_factory = async_sessionmaker(db_engine)
+
+            async def read():
+                async with session_factory() as db:
+                    return await db.scalar(text("SELECT v FROM t WHERE id = 1"))
+
+            values = await asyncio.gather(*(read() for _ in range(20)))
+            async with session_factory() as db:
+                synced = await db.run_sync(lambda session: session.execute(text("SELECT COUNT(*) FROM t")).scalar())
+            await db_engine.dispose()
+            return values, synced
+
+        values, synced = asyncio.run(run())
+        assert values == [42] * 20
+        assert synced == 1
+        sync_engine.dispose()
+
+class TestSessionScope:
+    """请求会话作用域及计数测试"""
+
+    @pytest.fixture(autouse=True)
+    def clean_job_runs(self):
+        db = SessionLocal()
+        db.query(models.JobRun).filter(models.JobRun.name.like("scope-%")).delete(synchronize_session=False)
+        db.commit()
+        yield
+        db.query(models.JobRun).filter(models.JobRun.name.like("scope-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def insert_job_run(self, name: str, read_only: bool):
+        async def run():
+            async with async_session_scope(read_only=read_only) as db:
+                db.add(models.JobRun(name=name, last_run_key="1"))
+                await db.flush()
+        asyncio.run(run())
+        db = SessionLocal()
+        try:
+            return db.get(models.JobRun, name)
+        finally:
+            db.close()
+
+    def test_commit_on_exit(self):
+        """读写会话在作用域结束时提交"""
+        assert self.insert_job_run("scope-rw", read_only=False) is not None
+
+    def test_readonly_skips_commit(self):
+        """只读会话结束时不提交"""
+        assert self.insert_job_run("scope-ro", read_only=True) is None
+
+    def test_rollback_on_error(self):
+        async def run():
+            async with async_session_scope() as db:
+                db.add(models.JobRun(name="scope-err", last_run_key="1"))
+                await db.flush()
+                raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run())
+        db = SessionLocal()
+        assert db.get(models.JobRun, "scope-err") is None
+        db.close()
+
+    def test_request_metrics(self):
+        """每个请求只打开一个会话，连接在查询时签出"""
+        client = TestClient(app)
+        session_metrics.reset()
+        assert client.get("/achievements/1/user").status_code == 200
+        snapshot = session_metrics.snapshot()
+        assert snapshot["sessions_opened"] == 1
+        assert snapshot["readonly_sessions"] == 1
+        assert snapshot["pool_checkouts"] >= 1
+        assert snapshot["pool_wait_ms"] >= 0
+
+        metrics = client.get("/metrics/database").json()
+        assert metrics["sessions_opened"] == 1
+        assert "async_pool" in metrics
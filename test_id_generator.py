@@ -0,0 +1,108 @@
+"""
+时间有序主键生成器测试
+"""
+
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from id_generator import ID_EPOCH, IdGenerator, SEQUENCE_MASK, IDS_PER_MS, MS_STEP, claim_node_id, id_timestamp, new_id
+from database import SessionLocal
+import models
+
+class FakeClock:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __call__(self) -> float:
+        return self.seconds
+
+class TestIdGenerator:
+    """ID生成器测试"""
+
+    def test_ordered_and_fixed_width(self):
+        """十进制恒为19位，字符串顺序与生成顺序一致"""
+        generator = IdGenerator(node_id=3)
+        ids = [str(generator.next_id()) for _ in range(10000)]
+        assert all(len(value) == 19 for value in ids)
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+
+    def test_unique_across_threads(self):
+        generator = IdGenerator(node_id=0)
+        results = []
+
+        def worker():
+            results.extend(generator.next_id() for _ in range(5000))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(results)) == 40000
+
+    def test_clock_rollback(self):
+        """时钟回拨时不会生成更小或重复的ID"""
+        clock = FakeClock(ID_EPOCH.timestamp() + 100)
+        generator = IdGenerator(node_id=1, clock=clock)
+        first = generator.next_id()
+        clock.seconds -= 5
+        second = generator.next_id()
+        assert second > first
+
+    def test_sequence_overflow_borrows_next_millisecond(self):
+        clock = FakeClock(ID_EPOCH.timestamp() + 100)
+        generator = IdGenerator(node_id=1, clock=clock)
+        ids = [generator.next_id() for _ in range(SEQUENCE_MASK + 2)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        assert id_timestamp(ids[-1]) > id_timestamp(ids[0])
+
+    def test_nodes_do_not_collide(self):
+        clock = FakeClock(ID_EPOCH.timestamp() + 100)
+        a = IdGenerator(node_id=1, clock=clock)
+        b = IdGenerator(node_id=2, clock=clock)
+        assert not {a.next_id() for _ in range(100)} & {b.next_id() for _ in range(100)}
+
+    def test_claimed_nodes_unique(self, tmp_path):
+        """未指定节点号时各进程通过文件锁取得不同的节点号"""
+        claimed = [claim_node_id(str(tmp_path)) for _ in range(3)]
+        assert claimed == [0, 1, 2]
+
+    def test_reserve_block(self):
+        """预留的ID块与逐个生成的ID同样有序，且不与之后生成的ID重复"""
+        clock = FakeClock(ID_EPOCH.timestamp() + 100)
+        generator = IdGenerator(node_id=1, clock=clock)
+        before = generator.next_id()
+        count = IDS_PER_MS + 10
+        first = generator.reserve(count)
+        block = [first + n // IDS_PER_MS * MS_STEP + n % IDS_PER_MS for n in range(count)]
+        assert block == sorted(block) and len(set(block)) == count
+        assert before < block[0]
+        assert all(id_timestamp(value) >= id_timestamp(first) for value in block)
+        after = generator.next_id()
+        assert after > block[-1]
+
+    def test_invalid_node(self):
+        with pytest.raises(ValueError):
+            IdGenerator(node_id=1024)
+
+    def test_timestamp_roundtrip(self):
+        moment = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+        generator = IdGenerator(node_id=1, clock=FakeClock(moment.timestamp()))
+        assert id_timestamp(generator.next_id()) == moment
+
+    def test_model_default(self):
+        """模型未指定id时使用生成器，且可按int解析"""
+        db = SessionLocal()
+        try:
+            earlier = new_id()
+            code = models.VerificationCode(phone="13800000000", code="000000", expires_at=datetime.utcnow())
+            db.add(code)
+            db.flush()
+            assert int(code.id) > int(earlier)
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,170 @@
+"""
+JWKS公钥缓存测试，使用本地JWKS服务模拟Apple公钥地址
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from jwks_cache import JWKSCache
+from third_party_auth import AppleAuthService
+
+def make_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private_key, jwk
+
+class JWKSServer:
+    """本地JWKS服务，记录请求次数，可切换公钥或模拟故障"""
+
+    def __init__(self):
+        self.jwks = {"keys": []}
+        self.requests = 0
+        self.fail = False
+        self.delay = 0.0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.delay)
+                if server.fail:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                body = json.dumps(server.jwks).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/auth/keys"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture(scope="module")
+def keys():
+    return {kid: make_key(kid) for kid in ("k1", "k2")}
+
+@pytest.fixture
+def server(keys):
+    server = JWKSServer()
+    server.jwks = {"keys": [keys["k1"][1]]}
+    yield server
+    server.close()
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def cache(server, clock):
+    return JWKSCache(server.url, refresh_interval=3600, min_refresh_interval=60, timeout=2, clock=clock)
+
+class TestJWKSCache:
+    """公钥缓存测试"""
+
+    def test_fetch_once(self, cache, server):
+        """首次使用时拉取，之后按kid直接返回"""
+        for _ in range(10):
+            assert cache.get_key("k1").key_id == "k1"
+        assert server.requests == 1
+
+    def test_unknown_kid_refreshes(self, cache, server, clock, keys):
+        """公钥轮换后遇到新kid同步刷新一次"""
+        cache.get_key("k1")
+        server.jwks = {"keys": [keys["k1"][1], keys["k2"][1]]}
+        clock.now += 61
+        assert cache.get_key("k2").key_id == "k2"
+        assert server.requests == 2
+
+    def test_unknown_kid_rate_limited(self, cache, server):
+        """伪造的kid在最小刷新间隔内不再触发请求"""
+        cache.get_key("k1")
+        for _ in range(5):
+            assert cache.get_key("forged") is None
+        assert server.requests == 1
+
+    def test_stale_while_revalidate(self, cache, server, clock, keys):
+        """缓存过期时先返回旧公钥，后台完成刷新"""
+        cache.get_key("k1")
+        server.jwks = {"keys": [keys["k1"][1], keys["k2"][1]]}
+        server.delay = 0.2
+        clock.now += 3601
+
+        started = time.monotonic()
+        assert cache.get_key("k1").key_id == "k1"
+        assert time.monotonic() - started < 0.1
+        cache._background.join()
+        assert server.requests == 2
+        assert cache.snapshot()["keys"] == ["k1", "k2"]
+
+    def test_failure_keeps_stale_keys(self, cache, server, clock):
+        cache.get_key("k1")
+        server.fail = True
+        clock.now += 3601
+        assert cache.refresh() is False
+        assert cache.get_key("k1").key_id == "k1"
+        assert cache.failures == 1
+
+    def test_initial_failure_throttled(self, cache, server, clock):
+        """首次拉取失败后，最小刷新间隔内不再同步请求"""
+        server.fail = True
+        for _ in range(5):
+            assert cache.get_key("k1") is None
+        assert server.requests == 1
+
+        server.fail = False
+        clock.now += 61
+        assert cache.get_key("k1").key_id == "k1"
+        assert server.requests == 2
+
+    def test_scheduler(self, server):
+        """后台线程启动即预先拉取"""
+        cache = JWKSCache(server.url, refresh_interval=0.05, min_refresh_interval=0.05)
+        cache.start()
+        try:
+            deadline = time.monotonic() + 2
+            while server.requests < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            cache.stop()
+        assert server.requests >= 2
+        assert cache.snapshot()["keys"] == ["k1"]
+
+    def test_verify_identity_token(self, cache, keys):
+        """Apple身份令牌通过缓存的公钥校验"""
+        service = AppleAuthService()
+        service.team_id = service.key_id = service.private_key = "configured"
+        service.jwks = cache
+        now = int(time.time())
+        claims = {"sub": "001", "iss": "https://appleid.apple.com", "aud": service.client_id,
+                  "iat": now, "exp": now + 600}
+
+        token = jwt.encode(claims, keys["k1"][0], algorithm="RS256", headers={"kid": "k1"})
+        assert service.verify_identity_token(token)["sub"] == "001"
+
+        forged = jwt.encode(claims, keys["k2"][0], algorithm="RS256", headers={"kid": "k1"})
+        assert service.verify_identity_token(forged) is None
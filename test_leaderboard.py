@@ -0,0 +1,595 @@
+"""
+排行榜测试
+"""
+
+import random
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal
+from leaderboard_engine import RankedSet, LeaderboardEngine
+from leaderboard_job import materialize_leaderboard
+from leaderboard_archive import (encode_board, decode_board, with_ranks, archive_period, archive_closed_periods,
+                                 archive_cache)
+from id_generator import new_id
+from periods import local_today, day_start_utc, week_start
+from response_cache import ResponseCache, leaderboard_cache
+from sqlalchemy import text
+import api.leaderboard
+import api.user
+import crud
+import models
+
+client = TestClient(app)
+
+@pytest.fixture
+def engine():
+    """提供已加载的排行榜引擎，并清理排行榜数据"""
+    board_engine = LeaderboardEngine(session_factory=SessionLocal, snapshot_interval=60)
+    board_engine.load()
+    leaderboard_cache.clear()
+    yield board_engine
+    leaderboard_cache.clear()
+    db = SessionLocal()
+    db.query(models.Leaderboard).delete()
+    db.query(models.LeaderboardGeneration).delete()
+    db.query(models.JobRun).delete()
+    db.query(models.Friendship).delete()
+    db.query(models.User).filter(models.User.id.in_(["301", "302", "303"])).delete()
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def users():
+    db = SessionLocal()
+    db.add_all([models.User(id=user_id, username=f"user{user_id}") for user_id in ["301", "302", "303"]])
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def histogram():
+    """当日三个用户的敲击分桶，前一天另有一条"""
+    today = local_today()
+    start = day_start_utc(today)
+    db = SessionLocal()
+    db.add_all([
+        models.TapHistogram(user_id="301", granularity="hour", bucket_start=start + timedelta(hours=1), taps=5),
+        models.TapHistogram(user_id="301", granularity="hour", bucket_start=start + timedelta(hours=2), taps=5),
+        models.TapHistogram(user_id="302", granularity="hour", bucket_start=start + timedelta(hours=3), taps=10),
+        models.TapHistogram(user_id="303", granularity="hour", bucket_start=start + timedelta(hours=4), taps=3),
+        # 前一天的数据不计入日榜
+        models.TapHistogram(user_id="303", granularity="day", bucket_start=start - timedelta(days=1), taps=100),
+    ])
+    db.commit()
+    yield today
+    db.query(models.TapHistogram).delete()
+    db.query(models.JobRun).delete()
+    db.query(models.LeaderboardArchive).delete()
+    db.commit()
+    db.close()
+
+class TestRankedSet:
+    """跳表有序集合测试"""
+
+    def test_matches_sorted_reference(self):
+        """随机增删改后与排序结果一致"""
+        rng = random.Random(7)
+        ranked = RankedSet()
+        scores = {}
+        for _ in range(2000):
+            member = f"u{rng.randint(1, 300)}"
+            if rng.random() < 0.1 and member in scores:
+                ranked.remove(member)
+                del scores[member]
+            else:
+                delta = rng.randint(1, 50)
+                ranked.increment(member, delta)
+                scores[member] = scores.get(member, 0) + delta
+
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        assert len(ranked) == len(expected)
+        assert list(ranked.items()) == expected
+        for position, (member, _) in enumerate(expected, start=1):
+            assert ranked.rank(member) == position
+        assert ranked.range(11, 5) == expected[10:15]
+        assert ranked.top(3) == expected[:3]
+        assert ranked.count_ahead("zz", expected[5][1]) == 6
+
+    def test_missing_member(self):
+        ranked = RankedSet()
+        assert ranked.rank("x") is None
+        assert ranked.range(1, 10) == []
+
+class TestLeaderboardEngine:
+    """排行榜引擎测试"""
+
+    def test_apply_increments(self, engine):
+        """落库增量累加到当前周期"""
+        now = datetime.utcnow()
+        engine.apply({"301": 10, "302": 30}, {"301": now, "302": now})
+        engine.apply({"301": 25}, {"301": now})
+        assert engine.top("daily", 10) == [("301", 35), ("302", 30)]
+        assert engine.rank("weekly", 302) == 2
+
+    def test_closed_period_ignored(self, engine):
+        """已结束周期的增量不计入当前榜单"""
+        engine.apply({"301": 10}, {"301": datetime.utcnow() - timedelta(days=8)})
+        assert engine.top("daily", 10) == []
+        assert engine.top("weekly", 10) == []
+
+    def test_snapshot_and_restore(self, engine):
+        """快照写入后新引擎可恢复"""
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 1}, {"301": now, "302": now, "303": now})
+        assert engine.snapshot() == 6
+        assert engine.snapshot() == 0
+
+        restored = LeaderboardEngine(session_factory=SessionLocal)
+        restored.load()
+        assert restored.top("daily", 10) == engine.top("daily", 10)
+
+    def test_snapshot_writes_changed_members(self, engine, monkeypatch):
+        """再次快照只写入分数变化的成员，分块提交"""
+        monkeypatch.setattr("leaderboard_engine.SNAPSHOT_CHUNK_SIZE", 2)
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 1}, {"301": now, "302": now, "303": now})
+        engine.snapshot()
+        engine.apply({"303": 20}, {"303": now})
+        assert engine.snapshot() == 2
+
+        db = SessionLocal()
+        rows = db.query(models.Leaderboard.user_id, models.Leaderboard.rank, models.Leaderboard.tap_count).filter(
+            models.Leaderboard.period == "daily"
+        ).order_by(models.Leaderboard.user_id).all()
+        db.close()
+        # 未变化成员的名次保持上次写入时的值
+        assert [tuple(row) for row in rows] == [("301", 2, 5), ("302", 1, 9), ("303", 1, 21)]
+
+    def test_load_replays_taps_after_snapshot(self, engine):
+        """快照之后仍有敲击的用户在恢复时按周期内全部分桶重算，未写入快照的增量不会丢失"""
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9}, {"301": now, "302": now})
+        engine.snapshot()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        db = SessionLocal()
+        db.add_all([
+            models.TapHistogram(user_id="301", granularity="hour", bucket_start=hour, taps=8),
+            models.TapHistogram(user_id="303", granularity="hour", bucket_start=hour, taps=4),
+        ])
+        db.commit()
+        try:
+            restored = LeaderboardEngine(session_factory=SessionLocal)
+            restored.load()
+            assert restored.top("daily", 10) == [("302", 9), ("301", 8), ("303", 4)]
+            assert restored.snapshot() == 4
+        finally:
+            db.query(models.TapHistogram).delete()
+            db.commit()
+            db.close()
+
+    def test_snapshot_after_period_end(self, engine):
+        """跨日后的首次快照不会把前一天的榜单写成当天的"""
+        now = datetime.utcnow()
+        engine.apply({"301": 5}, {"301": now})
+        # 模拟榜单建立于前一天、尚未被读取切换
+        engine._period_keys["daily"] -= timedelta(days=1)
+        engine.snapshot()
+
+        restored = LeaderboardEngine(session_factory=SessionLocal)
+        restored.load()
+        assert restored.top("daily", 10) == []
+        assert restored.top("weekly", 10) == [("301", 5)]
+
+    def test_snapshot_reuses_unchanged_shards(self, engine):
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9}, {"301": now, "302": now})
+        shard = engine._shards["daily"][("", "")]
+        items = shard.snapshot_items()
+        assert shard.snapshot_items() is items
+        engine.apply({"301": 10}, {"301": now})
+        assert shard.snapshot_items() == [("301", 15), ("302", 9)]
+        assert items == [("302", 9), ("301", 5)]
+
+    def test_flush_listener_registered_once(self, engine):
+        """重复注册的落库回调只调用一次，移除后不再调用"""
+        from tap_aggregator import TapAggregator
+        aggregator = TapAggregator(session_factory=SessionLocal)
+        aggregator.add_flush_listener(engine.apply)
+        aggregator.add_flush_listener(engine.apply)
+        assert len(aggregator._listeners) == 1
+        aggregator.remove_flush_listener(engine.apply)
+        aggregator.remove_flush_listener(engine.apply)
+        assert aggregator._listeners == []
+
+class TestLeaderboardAPI:
+    """排行榜API测试"""
+
+    def test_top_from_engine(self, engine, users, monkeypatch):
+        """引擎可用时返回前N名及用户名"""
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", engine)
+        db = SessionLocal()
+        db.query(models.User).filter(models.User.id == "301").update({"avatar": "a301.png"})
+        db.commit()
+        db.close()
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 1}, {"301": now, "302": now, "303": now})
+
+        # 用户名、头像由引擎提供，不再查询users表
+        monkeypatch.setattr(crud, "get_usernames", None)
+        data = client.get("/leaderboard/daily?limit=2").json()
+        assert [(row["user_id"], row["rank"], row["tap_count"], row["username"]) for row in data] == [
+            (302, 1, 9, "user302"), (301, 2, 5, "user301")
+        ]
+        assert data[1]["avatar"] == "a301.png"
+
+    def test_table_ordered_by_numeric_rank(self, engine, users):
+        """未启用引擎时按整数名次读取快照"""
+        now = datetime.utcnow()
+        scores = {"301": 100, "302": 50, "303": 1}
+        engine.apply(scores, {user_id: now for user_id in scores})
+        engine.snapshot()
+        # 构造第10名之后的名次，验证不按字符串排序
+        db = SessionLocal()
+        db.add_all([
+            models.Leaderboard(id=f"x{i}", user_id="303", period="daily", rank=i, tap_count=0, created_at=now)
+            for i in range(4, 12)
+        ])
+        db.commit()
+        db.close()
+
+        data = client.get("/leaderboard/daily?limit=3").json()
+        assert [row["rank"] for row in data] == [1, 2, 3]
+        assert data[0]["username"] == "user301"
+
+class TestAroundMe:
+    """用户名次及相邻用户测试"""
+
+    def test_around_from_engine(self, engine, users, monkeypatch):
+        """引擎中按名次取上下相邻用户"""
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", engine)
+        now = datetime.utcnow()
+        scores = {str(i): 1000 - i for i in range(1, 21)}
+        scores.update({"301": 995, "302": 2000})
+        engine.apply(scores, {user_id: now for user_id in scores})
+
+        data = client.get("/leaderboard/daily/users/301?k=2").json()
+        assert data["rank"] == 6
+        assert data["tap_count"] == 995
+        assert [row["rank"] for row in data["entries"]] == [4, 5, 6, 7, 8]
+        assert data["entries"][2]["username"] == "user301"
+
+        # 榜首时只返回下方用户
+        data = client.get("/leaderboard/daily/users/302?k=2").json()
+        assert data["rank"] == 1
+        assert [row["user_id"] for row in data["entries"]] == [302, 1, 2]
+
+    def test_around_from_table(self, engine, users):
+        """由leaderboard表的索引定位"""
+        now = datetime.utcnow()
+        engine.apply({"301": 30, "302": 20, "303": 10}, {"301": now, "302": now, "303": now})
+        engine.snapshot()
+
+        data = client.get("/leaderboard/weekly/users/302?k=1").json()
+        assert data["rank"] == 2
+        assert [row["username"] for row in data["entries"]] == ["user301", "user302", "user303"]
+
+    def test_around_from_table_with_ties(self, engine, users):
+        """并列名次较多时只取用户所在行两侧各k行"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        db.add_all([
+            models.Leaderboard(id=f"t{i:02d}", user_id=f"9{i:02d}", period="daily", rank=1, tap_count=50,
+                               created_at=now)
+            for i in range(20)
+        ])
+        db.commit()
+        db.close()
+
+        data = client.get("/leaderboard/daily/users/910?k=2").json()
+        assert data["rank"] == 1
+        assert [row["user_id"] for row in data["entries"]] == [908, 909, 910, 911, 912]
+
+    def test_user_not_ranked(self, engine):
+        assert client.get("/leaderboard/daily/users/999").status_code == 404
+
+class TestDenormalizedRows:
+    """榜单行冗余用户展示信息测试"""
+
+    def test_snapshot_fills_display_fields(self, engine, users):
+        """快照写入用户名与头像，读取榜单不再依赖users表"""
+        db = SessionLocal()
+        db.query(models.User).filter(models.User.id == "301").update({"avatar": "a301.png"})
+        db.commit()
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9}, {"301": now, "302": now})
+        engine.snapshot()
+
+        # 删除用户后榜单仍返回快照中的展示信息
+        db.query(models.User).filter(models.User.id == "301").delete()
+        db.commit()
+        db.close()
+        data = client.get("/leaderboard/daily").json()
+        assert [(row["username"], row["avatar"]) for row in data] == [("user302", None), ("user301", "a301.png")]
+
+    def test_read_uses_covering_index(self):
+        """按名次读取只访问覆盖索引"""
+        db = SessionLocal()
+        statement = db.query(*crud.LEADERBOARD_COLUMNS).filter(crud.current_board("daily")).order_by(
+            models.Leaderboard.rank
+        ).limit(10).statement
+        compiled = statement.compile(db.bind, compile_kwargs={"literal_binds": True})
+        plan = " ".join(str(row[-1]) for row in db.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        db.close()
+        assert "COVERING INDEX ix_leaderboard_period_rank" in plan
+        assert "TEMP B-TREE" not in plan
+
+class TestScopedBoards:
+    """地区分片与好友榜测试"""
+
+    def test_shards_match_global_reference(self, engine, monkeypatch):
+        """分片合并后的全国榜、名次及相邻用户与整体排序一致"""
+        rng = random.Random(11)
+        regions = [("浙江", "杭州"), ("浙江", "宁波"), ("广东", "深圳"), ("", "")]
+        assignment = {str(i): rng.choice(regions) for i in range(1, 200)}
+        monkeypatch.setattr(engine, "_load_users", lambda user_ids: {u: (assignment[u], ("", None)) for u in user_ids})
+        now = datetime.utcnow()
+        scores = {}
+        for _ in range(5):
+            batch = {user_id: rng.randint(1, 30) for user_id in rng.sample(sorted(assignment), 80)}
+            engine.apply(batch, {user_id: now for user_id in batch})
+            for user_id, delta in batch.items():
+                scores[user_id] = scores.get(user_id, 0) + delta
+
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        assert engine.top("daily", 20) == expected[:20]
+        zhejiang = [entry for entry in expected if assignment[entry[0]][0] == "浙江"]
+        assert engine.top("daily", 10, "浙江") == zhejiang[:10]
+        assert engine.top("daily", 10, "浙江", "宁波") == [
+            entry for entry in zhejiang if assignment[entry[0]][1] == "宁波"
+        ][:10]
+        for position in (1, 2, 40, len(expected)):
+            user_id = expected[position - 1][0]
+            assert engine.rank("daily", user_id) == position
+            rank, start, entries = engine.around("daily", user_id, 3)
+            assert rank == position
+            assert entries == expected[start - 1:position + 3]
+
+    def test_move_user_keeps_score(self, engine):
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9}, {"301": now, "302": now})
+        engine.move_user("301", "浙江", "杭州")
+        assert engine.top("daily", 10, "浙江") == [("301", 5)]
+        assert engine.top("daily", 10) == [("302", 9), ("301", 5)]
+        assert engine.rank("weekly", "301") == 2
+        # 全国榜与各分片保持一致
+        shards = engine._shards["daily"].values()
+        assert sorted(entry for shard in shards for entry in shard.items()) == sorted(engine._national["daily"].items())
+
+    def test_friends_from_scores(self, engine):
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 1}, {"301": now, "302": now, "303": now})
+        assert engine.friends("daily", ["303", "301", "999"]) == [("301", 5), ("303", 1)]
+
+    def test_regional_api(self, engine, users, monkeypatch):
+        """地区设置后引擎与表两种读取方式的地区榜一致"""
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", engine)
+        monkeypatch.setattr(api.user, "leaderboard_engine", engine)
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 7}, {"301": now, "302": now, "303": now})
+        for user_id in ("301", "303"):
+            response = client.put(f"/users/{user_id}/region", json={"province": "浙江", "city": "杭州"})
+            assert response.status_code == 200
+            assert response.json()["province"] == "浙江"
+
+        data = client.get("/leaderboard/daily/regions/浙江").json()
+        assert [(row["user_id"], row["rank"]) for row in data] == [(303, 1), (301, 2)]
+
+        engine.snapshot()
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", LeaderboardEngine(session_factory=SessionLocal))
+        leaderboard_cache.clear()
+        data = client.get("/leaderboard/daily/regions/浙江?city=杭州").json()
+        assert [(row["user_id"], row["rank"], row["username"]) for row in data] == [
+            (303, 1, "user303"), (301, 2, "user301")
+        ]
+        assert client.get("/leaderboard/daily/regions/广东").json() == []
+
+    def test_friend_api(self, engine, users, monkeypatch):
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", engine)
+        now = datetime.utcnow()
+        engine.apply({"301": 5, "302": 9, "303": 7}, {"301": now, "302": now, "303": now})
+        assert client.post("/users/301/friends", json={"friend_id": 302}).status_code == 200
+        assert client.post("/users/301/friends", json={"friend_id": 301}).status_code == 400
+        assert client.get("/users/302/friends").json() == [301]
+
+        data = client.get("/leaderboard/daily/friends/301").json()
+        assert [(row["user_id"], row["rank"]) for row in data] == [(302, 1), (301, 2)]
+
+        engine.snapshot()
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", LeaderboardEngine(session_factory=SessionLocal))
+        data = client.get("/leaderboard/daily/friends/302").json()
+        assert [(row["user_id"], row["rank"]) for row in data] == [(302, 1), (301, 2)]
+
+        client.delete("/users/301/friends/302")
+        assert client.get("/users/301/friends").json() == []
+
+class TestLeaderboardCache:
+    """排行榜响应缓存测试"""
+
+    def test_etag_and_not_modified(self, engine, users, monkeypatch):
+        """相同ETag返回304，榜单变化后ETag随之变化"""
+        monkeypatch.setattr(api.leaderboard, "leaderboard_engine", engine)
+        now = datetime.utcnow()
+        engine.apply({"301": 5}, {"301": now})
+
+        response = client.get("/leaderboard/daily")
+        etag = response.headers["etag"]
+        assert response.json()[0]["user_id"] == 301
+        response = client.get("/leaderboard/daily", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+        engine.apply({"302": 9}, {"302": now})
+        response = client.get("/leaderboard/daily", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert [row["user_id"] for row in response.json()] == [302, 301]
+
+    def test_version_and_ttl(self):
+        """版本变化立即失效，无版本时按有效期过期"""
+        cache = ResponseCache(ttl=0.05)
+        assert cache.get_or_compute("k", 1, lambda: b"a").body == b"a"
+        assert cache.get_or_compute("k", 1, lambda: b"b").body == b"a"
+        assert cache.get_or_compute("k", 2, lambda: b"b").body == b"b"
+
+        cache.get_or_compute("t", None, lambda: b"a")
+        assert cache.get_or_compute("t", None, lambda: b"b").body == b"a"
+        time.sleep(0.06)
+        assert cache.get_or_compute("t", None, lambda: b"b").body == b"b"
+
+    def test_concurrent_misses_compute_once(self):
+        """并发未命中只计算一次"""
+        cache = ResponseCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return b"[]"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_compute("k", 1, compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert len({result.etag for result in results}) == 1
+
+class TestLeaderboardJob:
+    """排行榜物化任务测试"""
+
+    def test_materialize_daily_with_ties(self, engine, users, histogram):
+        """按日聚合并用RANK()计算并列名次"""
+        metrics = materialize_leaderboard("daily", today=histogram)
+        assert metrics["rows"] == 3
+
+        db = SessionLocal()
+        rows = db.query(models.Leaderboard).filter(models.Leaderboard.period == "daily").all()
+        assert sorted((row.user_id, row.rank, row.tap_count) for row in rows) == [
+            ("301", 1, 10), ("302", 1, 10), ("303", 3, 3)
+        ]
+        # 主键在SQL中由预留的ID块生成，按名次顺序递增
+        ids = [row.id for row in sorted(rows, key=lambda row: (row.rank, row.user_id))]
+        assert all(len(value) == 19 for value in ids) and ids == sorted(ids)
+        assert int(new_id()) > int(ids[-1])
+        db.close()
+
+    def test_rerun_switches_generation(self, engine, users, histogram):
+        """重新物化写入新代次并切换，旧代次的行随后删除"""
+        materialize_leaderboard("daily", today=histogram)
+        materialize_leaderboard("daily", today=histogram)
+
+        db = SessionLocal()
+        assert crud.get_leaderboard_generation(db, "daily") == 2
+        generations = {row[0] for row in db.query(models.Leaderboard.generation).filter(
+            models.Leaderboard.period == "daily"
+        )}
+        assert generations == {2}
+        db.close()
+
+    def test_unswitched_generation_not_visible(self, engine, users, histogram):
+        """尚未切换的代次对读取方不可见"""
+        materialize_leaderboard("daily", today=histogram)
+        db = SessionLocal()
+        db.add(models.Leaderboard(id="pending", user_id="303", period="daily", rank=1, tap_count=999,
+                                  created_at=datetime.utcnow(), generation=2))
+        db.commit()
+        db.close()
+
+        data = client.get("/leaderboard/daily").json()
+        assert [row["tap_count"] for row in data] == [10, 10, 3]
+
+    def test_rerun_replaces_board(self, engine, users, histogram):
+        """重复物化整体替换而非追加"""
+        materialize_leaderboard("daily", today=histogram)
+        materialize_leaderboard("daily", today=histogram)
+        data = client.get("/leaderboard/daily").json()
+        assert len(data) == 3
+        assert data[-1]["username"] == "user303"
+
+    def test_invalid_period(self):
+        with pytest.raises(ValueError):
+            materialize_leaderboard("yearly")
+
+class TestLeaderboardArchive:
+    """排行榜历史归档测试"""
+
+    def test_encode_roundtrip(self):
+        """编码解码还原，名次按RANK()规则推出"""
+        entries = [("302", 900), ("301", 900), ("9", 7), ("1000000", 0)]
+        assert decode_board(encode_board(entries)) == entries
+        assert decode_board(encode_board([])) == []
+        assert [rank for rank, _, _ in with_ranks(entries)] == [1, 1, 3, 4]
+        with pytest.raises(ValueError):
+            encode_board([("1", 1), ("2", 5)])
+
+    def test_compact_size(self):
+        """大榜单压缩后远小于逐行存储"""
+        entries = [(str(100000 + i), 50000 - i * 3) for i in range(10000)]
+        assert len(encode_board(entries)) < 10000 * 8
+
+    def test_archive_closed_day(self, engine, users, histogram):
+        """归档日榜后清除热表中的旧行，可按日期读取历史榜单"""
+        yesterday = histogram - timedelta(days=1)
+        materialize_leaderboard("daily", today=histogram)
+        db = SessionLocal()
+        db.query(models.Leaderboard).update({"created_at": day_start_utc(histogram) - timedelta(minutes=1)})
+        db.commit()
+
+        metrics = archive_period("daily", histogram)
+        assert metrics["entries"] == 3
+        assert metrics["removed"] == 3
+        assert db.query(models.Leaderboard).count() == 0
+        db.close()
+
+        data = client.get(f"/leaderboard/daily/history/{histogram.isoformat()}?limit=2&offset=1").json()
+        assert [(row["user_id"], row["rank"], row["tap_count"], row["username"]) for row in data] == [
+            (302, 1, 10, "user302"), (303, 3, 3, "user303")
+        ]
+        assert client.get(f"/leaderboard/daily/history/{yesterday.isoformat()}").status_code == 404
+
+        # 周榜可用周内任意一天查询
+        archive_period("weekly", histogram)
+        data = client.get(f"/leaderboard/weekly/history/{histogram.isoformat()}").json()
+        expected = [103, 10, 10] if week_start(yesterday) == week_start(histogram) else [10, 10, 3]
+        assert [row["tap_count"] for row in data] == expected
+
+    def test_history_decoded_once(self, engine, users, histogram):
+        """同一归档的翻页请求只解码一次，重新归档后缓存失效"""
+        archive_cache.clear()
+        archive_period("daily", histogram)
+        misses, hits = archive_cache.misses, archive_cache.hits
+        url = f"/leaderboard/daily/history/{histogram.isoformat()}"
+        assert len(client.get(f"{url}?limit=1").json()) == 1
+        assert [row["rank"] for row in client.get(f"{url}?limit=2&offset=1").json()] == [1, 3]
+        assert (archive_cache.misses - misses, archive_cache.hits - hits) == (1, 1)
+
+        db = SessionLocal()
+        db.add(models.TapHistogram(user_id="301", granularity="hour", bucket_start=day_start_utc(histogram), taps=89))
+        db.commit()
+        db.close()
+        archive_period("daily", histogram)
+        assert client.get(url).json()[0]["tap_count"] == 99
+        archive_cache.clear()
+
+    def test_weekly_archived_on_last_day(self, histogram):
+        sunday = histogram + timedelta(days=6 - histogram.weekday())
+        assert [m["period"] for m in archive_closed_periods(sunday)] == ["daily", "weekly"]
+        assert [m["period"] for m in archive_closed_periods(sunday - timedelta(days=1))] == ["daily"]
@@ -0,0 +1,50 @@
+"""
+索引迁移测试
+"""
+
+import pytest
+from sqlalchemy import MetaData, create_engine, inspect, text
+
+import models
+from migrate_indexes import migrate_database
+
+UNIQUE_INDEX = "ix_user_stats_user_id"
+
+def create_legacy_schema(db_engine):
+    """按迁移前的结构建表（user_stats.user_id为普通索引）"""
+    metadata = MetaData()
+    for table in models.Base.metadata.tables.values():
+        legacy = table.to_metadata(metadata)
+        for index in legacy.indexes:
+            if index.name == UNIQUE_INDEX:
+                index.unique = False
+    metadata.create_all(db_engine)
+
+def user_stats_indexes(db_engine):
+    return {index["name"]: bool(index["unique"]) for index in inspect(db_engine).get_indexes("user_stats")}
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    create_legacy_schema(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text("INSERT INTO user_stats (id, user_id) VALUES ('1', '7'), ('2', '7')"))
+    yield db_engine
+    db_engine.dispose()
+
+class TestIndexMigration:
+    """索引迁移测试"""
+
+    def test_duplicates_keep_existing_index(self, legacy_engine):
+        """存在重复数据时重建失败，原索引保留"""
+        migrate_database(legacy_engine)
+        assert user_stats_indexes(legacy_engine) == {UNIQUE_INDEX: False}
+
+    def test_rebuild_as_unique(self, legacy_engine):
+        """清理重复数据后重建为唯一索引，不留下临时索引"""
+        with legacy_engine.begin() as conn:
+            conn.execute(text("DELETE FROM user_stats WHERE id = '2'"))
+        migrate_database(legacy_engine)
+        assert user_stats_indexes(legacy_engine) == {UNIQUE_INDEX: True}
+        assert UNIQUE_INDEX in {index.name for index in models.UserStat.__table__.indexes}
+        assert len(models.UserStat.__table__.indexes) == 1
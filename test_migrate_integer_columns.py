@@ -0,0 +1,84 @@
+"""
+计数字段整数迁移测试
+"""
+
+import pytest
+from sqlalchemy import MetaData, String, create_engine, text
+
+import models
+from migrate_integer_columns import INTEGER_COLUMNS, migrate_database, migrate_table
+
+def create_legacy_schema(db_engine):
+    """按迁移前的结构建表（目标字段为字符串）"""
+    metadata = MetaData()
+    for name, table in models.Base.metadata.tables.items():
+        legacy = table.to_metadata(metadata)
+        for column in INTEGER_COLUMNS.get(name, ()):
+            legacy.c[column].type = String()
+    metadata.create_all(db_engine)
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    create_legacy_schema(db_engine)
+    with db_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO user_stats (id, user_id, total_taps, today_taps, consecutive_days) VALUES "
+            + ", ".join(f"('{i}', '{i}', '{i * 10}', '{i}', '1')" for i in range(1, 101))
+        ))
+        conn.execute(text("INSERT INTO users (id, username, merit_points) VALUES ('1', 'a', '12')"))
+    yield db_engine
+    db_engine.dispose()
+
+class TestIntegerMigration:
+    """计数字段整数迁移测试"""
+
+    def test_converts_types_and_values(self, legacy_engine):
+        """迁移后字段为整数，可直接排序和求和"""
+        results = migrate_database(legacy_engine, chunk_size=7, progress=None)
+        assert {result["table"] for result in results} == set(INTEGER_COLUMNS)
+
+        with legacy_engine.connect() as conn:
+            types = conn.execute(text("SELECT DISTINCT typeof(total_taps) FROM user_stats")).scalars().all()
+            assert types == ["integer"]
+            top = conn.execute(text("SELECT user_id FROM user_stats ORDER BY total_taps DESC LIMIT 1")).scalar()
+            assert top == "100"
+            assert conn.execute(text("SELECT SUM(total_taps) FROM user_stats")).scalar() == 50500
+            assert conn.execute(text("SELECT merit_points FROM users")).scalar() == 12
+            indexes = {row[1] for row in conn.execute(text("PRAGMA index_list(users)"))}
+            assert "ix_users_username" in indexes
+            assert conn.execute(text("SELECT COUNT(*) FROM job_runs")).scalar() == 0
+
+        # 再次执行时跳过已迁移的表
+        assert all(result.get("skipped") for result in migrate_database(legacy_engine, progress=None))
+
+    def test_resume_and_concurrent_writes(self, legacy_engine):
+        """中断后续跑，复制期间的增删改不丢失"""
+        def interrupt(table, done, total):
+            # 复制第一块后模拟业务写入，再模拟进程中断
+            with legacy_engine.begin() as conn:
+                conn.execute(text("UPDATE user_stats SET total_taps = '999' WHERE id = '90'"))
+                conn.execute(text("UPDATE user_stats SET total_taps = '5' WHERE id = '2'"))
+                conn.execute(text("DELETE FROM user_stats WHERE id = '95'"))
+                conn.execute(text(
+                    "INSERT INTO user_stats (id, user_id, total_taps, today_taps, consecutive_days) "
+                    "VALUES ('101', '101', '7', '7', '0')"
+                ))
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            migrate_table(legacy_engine, "user_stats", chunk_size=10, progress=interrupt)
+
+        with legacy_engine.connect() as conn:
+            assert conn.execute(text(
+                "SELECT last_run_key FROM job_runs WHERE name = 'integer_migration_user_stats'"
+            )).scalar() == "10"
+
+        result = migrate_table(legacy_engine, "user_stats", chunk_size=10)
+        assert result["copied"] == 100 - 10 - 2
+
+        with legacy_engine.connect() as conn:
+            rows = dict(conn.execute(text("SELECT id, total_taps FROM user_stats")).all())
+        assert len(rows) == 100
+        assert rows["90"] == 999 and rows["2"] == 5 and rows["101"] == 7
+        assert "95" not in rows
@@ -0,0 +1,113 @@
+"""
+用户资料缓存测试
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal, async_session_scope, session_metrics
+from profile_cache import ProfileCache, profile_cache
+import crud
+import models
+
+@pytest.fixture
+def client():
+    profile_cache.clear()
+    yield TestClient(app)
+    profile_cache.clear()
+
+@pytest.fixture
+def user():
+    db = SessionLocal()
+    db_user = models.User(username="profile-cache", login_type="apple", phone="13811112222")
+    db.add(db_user)
+    db.commit()
+    user_id = db_user.id
+    db.close()
+    yield user_id
+    db = SessionLocal()
+    db.query(models.User).filter(models.User.id == user_id).delete()
+    db.commit()
+    db.close()
+
+def load(value):
+    async def loader():
+        return value
+    return loader
+
+class TestProfileCache:
+    """LRU+TTL缓存测试"""
+
+    def test_lru_eviction(self):
+        cache = ProfileCache(max_entries=2)
+        for key in ("a", "b"):
+            asyncio.run(cache.get_or_load(key, load(key.encode())))
+        asyncio.run(cache.get_or_load("a", load(b"x")))  # a变为最近使用
+        asyncio.run(cache.get_or_load("c", load(b"c")))
+        assert cache.evictions == 1
+        assert asyncio.run(cache.get_or_load("a", load(b"x"))) == b"a"
+        assert asyncio.run(cache.get_or_load("b", load(b"b2"))) == b"b2"
+
+    def test_ttl_and_negative_entries(self):
+        cache = ProfileCache(ttl=0.05, negative_ttl=0.01)
+        assert asyncio.run(cache.get_or_load(1, load(None))) is None
+        assert asyncio.run(cache.get_or_load(1, load(b"late"))) is None
+        assert cache.negative_hits == 1
+        time.sleep(0.02)
+        assert asyncio.run(cache.get_or_load(1, load(b"v1"))) == b"v1"
+        assert asyncio.run(cache.get_or_load(1, load(b"v2"))) == b"v1"
+        time.sleep(0.06)
+        assert asyncio.run(cache.get_or_load(1, load(b"v2"))) == b"v2"
+        assert cache.expirations == 2
+
+    def test_invalidate_during_load(self):
+        """查询期间发生失效时，查询结果不写入缓存"""
+        cache = ProfileCache()
+
+        async def stale():
+            cache.invalidate(1)
+            return b"stale"
+
+        assert asyncio.run(cache.get_or_load(1, stale)) == b"stale"
+        assert asyncio.run(cache.get_or_load(1, load(b"fresh"))) == b"fresh"
+
+class TestProfileEndpoint:
+    """GET /users/{user_id}缓存测试"""
+
+    def test_hit_skips_query(self, client, user):
+        first = client.get(f"/users/{user}")
+        assert first.status_code == 200
+        session_metrics.reset()
+        second = client.get(f"/users/{user}")
+        assert second.json() == first.json()
+        assert session_metrics.snapshot()["pool_checkouts"] == 0
+        assert client.get("/metrics/profile-cache").json()["hits"] == 1
+
+    def test_write_paths_invalidate(self, client, user):
+        """crud写入后立即读到新资料"""
+        assert client.get(f"/users/{user}").json()["backup_phone"] is None
+
+        async def update(write):
+            async with async_session_scope() as db:
+                await write(db)
+
+        asyncio.run(update(lambda db: crud.update_user_backup_phone(db, user, "13833334444")))
+        assert client.get(f"/users/{user}").json()["backup_phone"] == "13833334444"
+
+        asyncio.run(update(lambda db: crud.bind_phone_to_third_party_user(db, user, "13855556666")))
+        profile = client.get(f"/users/{user}").json()
+        assert profile["phone"] == "13855556666"
+        assert profile["is_phone_verified"] is True
+
+        response = client.put(f"/users/{user}/region", json={"province": "浙江", "city": "杭州"})
+        assert response.status_code == 200
+        assert client.get(f"/users/{user}").json()["city"] == "杭州"
+
+    def test_missing_user_cached(self, client):
+        assert client.get("/users/1").status_code == 404
+        assert client.get("/users/1").status_code == 404
+        assert profile_cache.negative_hits >= 1
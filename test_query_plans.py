@@ -0,0 +1,120 @@
+"""
+查询计划测试：crud中的查询均应命中索引，不做全表扫描
+"""
+
+import asyncio
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import Base, create_async_db_engine, create_sqlite_engine
+import crud
+
+NOW = datetime.utcnow()
+
+def sync(call):
+    """同步crud函数通过AsyncSession.run_sync在异步会话中执行"""
+    return lambda db: db.run_sync(call)
+
+# (名称, 调用) —— 只列出按条件查询的函数，全表列表查询（如成就、分享任务列表）不在此列
+CRUD_QUERIES = [
+    ("get_user_by_username", lambda db: crud.get_user_by_username(db, "u")),
+    ("get_user_by_email", lambda db: crud.get_user_by_email(db, "u@example.com")),
+    ("get_user_by_phone", lambda db: crud.get_user_by_phone(db, "13800000000")),
+    ("get_third_party_auth", lambda db: crud.get_third_party_auth(db, "apple", "p1")),
+    ("resolve_third_party", lambda db: crud.resolve_third_party(db, "apple", "p1")),
+    ("update_third_party_auth", lambda db: crud.update_third_party_auth(db, "1", {})),
+    ("get_users_by_login_type", lambda db: crud.get_users_by_login_type(db, "apple")),
+    ("get_user_stat", lambda db: crud.get_user_stat(db, 1)),
+    ("bulk_increment_user_taps", sync(lambda db: crud.bulk_increment_user_taps(db, {"1": 1}, {"1": NOW}))),
+    ("get_tap_histogram", lambda db: crud.get_tap_histogram(db, 1, NOW)),
+    ("get_meditation_sessions", lambda db: crud.get_meditation_sessions(db, 1)),
+    ("get_meditation_session_by_batch", lambda db: crud.get_meditation_session_by_batch(db, 1, "device-1", 1)),
+    ("get_user_achievements", lambda db: crud.get_user_achievements(db, 1)),
+    ("get_leaderboard", lambda db: crud.get_leaderboard(db, "daily")),
+    ("get_leaderboard_entry", lambda db: crud.get_leaderboard_entry(db, "daily", 1)),
+    ("get_leaderboard_neighbours", lambda db: crud.get_leaderboard_neighbours(db, "daily", 5, 1, 3)),
+    ("get_regional_leaderboard", lambda db: crud.get_regional_leaderboard(db, "daily", "浙江", "杭州", 10)),
+    ("get_friend_leaderboard", lambda db: crud.get_friend_leaderboard(db, "daily", ["1", "2"])),
+    ("get_usernames", lambda db: crud.get_usernames(db, ["1", "2"])),
+    ("get_user_display", sync(lambda db: crud.get_user_display(db, ["1", "2"]))),
+    ("get_friend_ids", lambda db: crud.get_friend_ids(db, 1)),
+    ("get_user_share_tasks", lambda db: crud.get_user_share_tasks(db, 1)),
+    ("can_send_verification_code", lambda db: crud.can_send_verification_code(db, "13800000000")),
+    ("get_valid_verification_code", lambda db: crud.get_valid_verification_code(db, "13800000000", "123456")),
+    ("use_verification_code", lambda db: crud.use_verification_code(db, "1")),
+]
+
+# 无索引的全表扫描，如"SCAN users"；"SCAN users USING INDEX ..."不在此列
+TABLE_SCAN = re.compile(r"^SCAN (\w+)$")
+
+class PlanDatabase:
+    """按模型建表的临时数据库，同步引擎用于读取查询计划，异步引擎用于执行crud"""
+
+    def __init__(self, path):
+        self.engine = create_sqlite_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(self.engine)
+        self.async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{path}")
+        self.session_factory = async_sessionmaker(self.async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    def dispose(self):
+        asyncio.run(self.async_engine.dispose())
+        self.engine.dispose()
+
+@pytest.fixture(scope="module")
+def plan_db(tmp_path_factory):
+    database = PlanDatabase(tmp_path_factory.mktemp("plans") / "plans.db")
+    yield database
+    database.dispose()
+
+def capture_statements(plan_db, call):
+    """执行调用并记录发出的SQL语句及参数"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    async def run():
+        async with plan_db.session_factory() as db:
+            try:
+                await call(db)
+            finally:
+                await db.rollback()
+
+    event.listen(plan_db.async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        asyncio.run(run())
+    finally:
+        event.remove(plan_db.async_engine.sync_engine, "before_cursor_execute", record)
+    return statements
+
+def query_plan(plan_db, statement: str, parameters) -> list:
+    connection = plan_db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        return [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    finally:
+        connection.close()
+
+class TestQueryPlans:
+    """crud查询计划测试"""
+
+    @pytest.mark.parametrize("name,call", CRUD_QUERIES, ids=[name for name, _ in CRUD_QUERIES])
+    def test_no_table_scan(self, plan_db, name, call):
+        statements = capture_statements(plan_db, call)
+        assert statements, f"{name} 未执行查询"
+        for statement, parameters in statements:
+            plan = query_plan(plan_db, statement, parameters)
+            scans = [detail for detail in plan if TABLE_SCAN.match(detail)]
+            assert not scans, f"{name} 全表扫描: {scans}\n{statement}"
+
+    def test_meditation_sessions_sorted_by_index(self, plan_db):
+        """最近冥想记录由复合索引直接有序返回，无需额外排序"""
+        statements = capture_statements(plan_db, lambda db: crud.get_meditation_sessions(db, 1))
+        plan = query_plan(plan_db, *statements[0])
+        assert any("ix_meditation_sessions_user_created" in detail for detail in plan)
+        assert not any("TEMP B-TREE" in detail for detail in plan)
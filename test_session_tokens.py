@@ -0,0 +1,141 @@
+"""
+会话令牌测试
+"""
+
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal, session_metrics
+from session_tokens import TokenService, token_service
+import models
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def service(clock):
+    return TokenService("test-secret", ttl=3600, cache_size=2, clock=clock)
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+@pytest.fixture
+def phone_user():
+    """通过验证码登录创建的用户，返回(手机号, 登录响应)"""
+    phone = "139" + str(uuid.uuid4().int)[:8]
+    db = SessionLocal()
+    db.add(models.VerificationCode(phone=phone, code="654321",
+                                   expires_at=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    db.close()
+    response = TestClient(app).post("/users/login", json={"phone": phone, "code": "654321"})
+    assert response.status_code == 200
+    yield response.json()
+    db = SessionLocal()
+    user_id = response.json()["user"]["id"]
+    db.query(models.UserStat).filter_by(user_id=str(user_id)).delete()
+    db.query(models.User).filter_by(id=str(user_id)).delete()
+    db.query(models.VerificationCode).filter_by(phone=phone).delete()
+    db.commit()
+    db.close()
+
+class TestTokenService:
+    """令牌签发与校验测试"""
+
+    def test_issue_and_verify(self, service):
+        token = service.issue(42)
+        user_id, jti, expires_at = service.verify(token)
+        assert user_id == "42"
+        assert jti
+        assert service.cache_misses == 1
+        assert service.verify(token)[0] == "42"
+        assert service.cache_hits == 1
+
+    def test_expiry_checked_on_cache_hit(self, service, clock):
+        token = service.issue(1)
+        assert service.verify(token)
+        clock.now += 3601
+        assert service.verify(token) is None
+
+    def test_tampered_and_foreign_tokens(self, service):
+        token = service.issue(1)
+        header, payload, signature = token.split(".")
+        assert service.verify(f"{header}.{payload}.{signature[::-1]}") is None
+        foreign = jwt.encode({"sub": "1", "jti": "x", "exp": 2_000_000_000}, "other-secret", algorithm="HS256")
+        assert service.verify(foreign) is None
+        unsigned = jwt.encode({"sub": "1", "jti": "x", "exp": 2_000_000_000}, None, algorithm="none")
+        assert service.verify(unsigned) is None
+
+    def test_revocation(self, service, clock):
+        token = service.issue(1)
+        _, jti, expires_at = service.verify(token)
+        service.revoke(jti, expires_at)
+        assert service.verify(token) is None
+        # 令牌到期后吊销记录随下次吊销清除
+        clock.now += 3601
+        service.revoke("other", int(clock.now) + 10)
+        assert not service.is_revoked(jti)
+
+    def test_lru_bounded(self, service):
+        tokens = [service.issue(i) for i in range(5)]
+        for token in tokens:
+            service.verify(token)
+        assert service.snapshot()["cached"] == 2
+
+class TestAuthenticatedEndpoints:
+    """登录签发令牌及认证接口测试"""
+
+    def test_login_issues_token(self, phone_user):
+        user_id, _, _ = token_service.verify(phone_user["token"])
+        assert user_id == str(phone_user["user"]["id"])
+
+    def test_auth_without_database(self, client, phone_user):
+        """认证本身不查询数据库：请求在认证失败时不签出连接"""
+        session_metrics.reset()
+        response = client.post("/users/bind-backup-phone", json={"phone": "123"},
+                               headers={"Authorization": f"Bearer {phone_user['token']}"})
+        assert response.status_code == 400  # 通过认证，手机号格式校验失败
+        assert session_metrics.snapshot()["pool_checkouts"] == 0
+
+        assert client.post("/users/bind-backup-phone", json={"phone": "13812345678"}).status_code == 401
+        assert client.post("/users/bind-backup-phone", json={"phone": "13812345678"},
+                           headers={"Authorization": "Bearer invalid"}).status_code == 401
+
+    def test_bind_backup_phone(self, client, phone_user):
+        headers = {"Authorization": f"Bearer {phone_user['token']}"}
+        backup = "137" + str(uuid.uuid4().int)[:8]
+        response = client.post("/users/bind-backup-phone", json={"phone": backup}, headers=headers)
+        assert response.status_code == 200
+        assert client.get(f"/users/{phone_user['user']['id']}").json()["backup_phone"] == backup
+
+    def test_logout_revokes(self, client, phone_user):
+        headers = {"Authorization": f"Bearer {phone_user['token']}"}
+        assert client.post("/users/logout", headers=headers).status_code == 200
+        assert client.post("/users/logout", headers=headers).status_code == 401
+
+        # 重启后从数据库加载吊销列表
+        jti = jwt.decode(phone_user["token"], options={"verify_signature": False})["jti"]
+        restarted = TokenService(token_service.secret)
+        restarted.load_revoked(SessionLocal)
+        assert restarted.is_revoked(jti)
+        assert restarted.verify(phone_user["token"]) is None
+
+        db = SessionLocal()
+        db.query(models.RevokedToken).filter_by(jti=jti).delete()
+        db.commit()
+        db.close()
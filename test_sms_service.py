@@ -1,28 +1,22 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, patch
 from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from database import Base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database import Base, create_async_db_engine, get_session_factory
 from main import app
-from database import get_db
 import models
 import crud
 
-# 创建测试数据库
+# 创建测试数据库，路由通过替换会话工厂访问同一文件
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_sms.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 @pytest.fixture(scope="module")
 def setup_database():
@@ -32,7 +26,9 @@ def setup_database():
 
 @pytest.fixture
 def client(setup_database):
-    return TestClient(app)
+    app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_session_factory, None)
 
 @pytest.fixture
 def db_session():
@@ -42,6 +38,13 @@ def db_session():
     finally:
         db.close()
 
+def can_send(phone: str) -> bool:
+    """在测试库的异步会话中调用验证码发送限制检查"""
+    async def check():
+        async with TestingAsyncSessionLocal() as db:
+            return await crud.can_send_verification_code(db, phone)
+    return asyncio.run(check())
+
 class TestSMSService:
     """短信服务测试类"""
     
@@ -173,12 +176,12 @@ class TestSMSService:
         assert response.status_code == 400
         assert "验证码无效或已过期" in response.json()["detail"]
     
-    def test_can_send_verification_code(self, db_session):
+    def test_can_send_verification_code(self, setup_database, db_session):
         """测试验证码发送限制检查函数"""
         phone = "13800138006"
         
         # 没有记录时应该可以发送
-        assert crud.can_send_verification_code(db_session, phone) is True
+        assert can_send(phone) is True
         
         # 创建5分钟内的记录
         code_record = models.VerificationCode(
@@ -191,7 +194,7 @@ class TestSMSService:
         db_session.commit()
         
         # 5分钟内不应该可以发送
-        assert crud.can_send_verification_code(db_session, phone) is False
+        assert can_send(phone) is False
         
         # 删除旧记录，创建6分钟前的记录
         db_session.delete(code_record)
@@ -207,7 +210,7 @@ class TestSMSService:
         db_session.commit()
         
         # 6分钟后应该可以发送
-        assert crud.can_send_verification_code(db_session, phone) is True
+        assert can_send(phone) is True
 
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
\ No newline at end of file
@@ -0,0 +1,326 @@
+"""
+敲击上报及写后聚合测试
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from periods import day_start_utc, local_today
+from fastapi.testclient import TestClient
+
+from main import app
+from database import SessionLocal
+from tap_aggregator import TapAggregator, tap_aggregator
+from batch_dedupe import BatchDeduper, batch_deduper
+from api.stat import MAX_BATCH_AGE
+import models
+import crud
+
+client = TestClient(app)
+
+def reset_aggregator():
+    """清空全局聚合器缓冲区"""
+    tap_aggregator._pending.clear()
+    tap_aggregator._last_tap_at.clear()
+    tap_aggregator._hourly.clear()
+
+@pytest.fixture
+def aggregator():
+    """提供独立的聚合器实例"""
+    agg = TapAggregator(session_factory=SessionLocal, flush_interval=60)
+    yield agg
+    db = SessionLocal()
+    db.query(models.UserStat).delete()
+    db.query(models.TapHistogram).delete()
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def uploaders():
+    """上报敲击的用户"""
+    db = SessionLocal()
+    db.add_all([models.User(id=user_id, username=f"uploader{user_id}") for user_id in ["7", "9", "10"]])
+    db.commit()
+    yield
+    db.query(models.User).filter(models.User.id.in_(["7", "9", "10"])).delete()
+    db.commit()
+    db.close()
+
+class TestTapAggregator:
+    """写后聚合器测试"""
+
+    def test_add_coalesces_per_user(self, aggregator):
+        """同一用户的多批敲击在内存中合并"""
+        assert aggregator.add(1, 10) == 10
+        assert aggregator.add(1, 5) == 15
+        assert aggregator.add(2, 3) == 3
+        assert aggregator.pending_taps(1) == 15
+
+    def test_flush_creates_and_increments_stats(self, aggregator):
+        """刷新时创建缺失的统计记录并累加计数"""
+        tapped_at = datetime(2025, 1, 1, 8, 0, 0)
+        aggregator.add(101, 30, tapped_at)
+        assert aggregator.flush() == 1
+        assert aggregator.pending_taps(101) == 0
+
+        aggregator.add(101, 12, tapped_at + timedelta(minutes=1))
+        aggregator.flush()
+
+        db = SessionLocal()
+        stat = db.query(models.UserStat).filter(models.UserStat.user_id == 101).first()
+        assert int(stat.total_taps) == 42
+        assert int(stat.today_taps) == 42
+        assert stat.last_tap_date == tapped_at + timedelta(minutes=1)
+        db.close()
+
+    def test_flush_empty_buffer(self, aggregator):
+        """缓冲区为空时不访问数据库"""
+        assert aggregator.flush() == 0
+
+class TestTapUploadAPI:
+    """敲击上报API测试"""
+
+    def teardown_method(self):
+        reset_aggregator()
+
+    def test_upload_taps(self, uploaders):
+        """上报成功后返回待落库数量"""
+        now = datetime.utcnow()
+        response = client.post("/stats/7/taps", json={
+            "count": 50,
+            "started_at": (now - timedelta(seconds=30)).isoformat(),
+            "ended_at": now.isoformat()
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["accepted"] == 50
+        assert data["pending_taps"] == 50
+
+    def test_upload_taps_invalid_range(self):
+        """结束时间早于开始时间"""
+        now = datetime.utcnow()
+        response = client.post("/stats/7/taps", json={
+            "count": 5,
+            "started_at": now.isoformat(),
+            "ended_at": (now - timedelta(seconds=10)).isoformat()
+        })
+        assert response.status_code == 400
+
+    def test_upload_taps_rate_limit(self):
+        """敲击频率超过上限"""
+        now = datetime.utcnow()
+        response = client.post("/stats/7/taps", json={
+            "count": 1000,
+            "started_at": (now - timedelta(seconds=1)).isoformat(),
+            "ended_at": now.isoformat()
+        })
+        assert response.status_code == 400
+        assert "敲击频率异常" in response.json()["detail"]
+
+    def test_upload_taps_unknown_user(self):
+        """不存在的用户不写入缓冲区"""
+        now = datetime.utcnow()
+        response = client.post("/stats/999999/taps", json={
+            "count": 5,
+            "started_at": (now - timedelta(seconds=10)).isoformat(),
+            "ended_at": now.isoformat()
+        })
+        assert response.status_code == 404
+        assert tap_aggregator.pending_taps(999999) == 0
+
+    def test_upload_taps_clamps_ended_at(self, uploaders):
+        """结束时间限定在最近MAX_BATCH_AGE内，不记到未来或过早的时间"""
+        now = datetime.utcnow()
+        for ended_at in (now + timedelta(days=2), now - timedelta(days=3)):
+            response = client.post("/stats/7/taps", json={
+                "count": 5,
+                "started_at": (ended_at - timedelta(seconds=10)).isoformat(),
+                "ended_at": ended_at.isoformat()
+            })
+            assert response.status_code == 200
+        assert now - MAX_BATCH_AGE <= tap_aggregator._last_tap_at["7"] <= datetime.utcnow()
+        assert all(now - timedelta(hours=2) <= hour <= now for _, hour in tap_aggregator._hourly)
+
+class TestTapStream:
+    """WebSocket敲击流测试"""
+
+    def teardown_method(self):
+        reset_aggregator()
+
+    def test_stream_acknowledges_running_total(self):
+        """每条消息返回确认及累计值"""
+        with client.websocket_connect("/stats/8/stream") as ws:
+            ws.send_json({"seq": 1, "count": 3})
+            ack = ws.receive_json()
+            assert ack == {"seq": 1, "session_taps": 3, "total_taps": 3, "pending_taps": 3}
+
+            ws.send_json({"seq": 2, "count": 4})
+            ack = ws.receive_json()
+            assert ack["seq"] == 2
+            assert ack["session_taps"] == 7
+            assert ack["total_taps"] == 7
+
+        assert tap_aggregator.pending_taps(8) == 7
+
+    def test_stream_rejects_invalid_count(self):
+        """无效增量返回错误且不计数"""
+        with client.websocket_connect("/stats/8/stream") as ws:
+            ws.send_json({"seq": 1, "count": -1})
+            assert ws.receive_json()["error"] == "敲击数无效"
+        assert tap_aggregator.pending_taps(8) == 0
+
+    def test_stream_rate_limited(self):
+        """超过敲击频率上限的消息不计数"""
+        with client.websocket_connect("/stats/8/stream") as ws:
+            ws.send_json({"seq": 1, "count": 20})
+            assert ws.receive_json()["session_taps"] == 20
+            ws.send_json({"seq": 2, "count": 1})
+            assert ws.receive_json() == {"seq": 2, "error": "敲击频率异常"}
+        assert tap_aggregator.pending_taps(8) == 20
+
+    def test_stream_invalid_json(self):
+        """无法解析的消息返回错误帧，连接保持可用"""
+        with client.websocket_connect("/stats/8/stream") as ws:
+            ws.send_text("{not json")
+            assert ws.receive_json()["error"] == "消息格式无效"
+            ws.send_json({"seq": 1, "count": 2})
+            assert ws.receive_json()["session_taps"] == 2
+
+class TestBatchDeduper:
+    """批次去重测试"""
+
+    def test_duplicate_and_out_of_order(self):
+        """乱序到达的新批次接受，重复批次拒绝"""
+        deduper = BatchDeduper(window=8)
+        assert deduper.check_and_record("a", 5)
+        assert deduper.check_and_record("a", 3)
+        assert not deduper.check_and_record("a", 5)
+        assert not deduper.check_and_record("a", 3)
+        assert deduper.check_and_record("a", 4)
+        assert deduper.check_and_record("a", 20)
+        # 超出窗口的旧序号视为重复
+        assert not deduper.check_and_record("a", 12)
+        assert deduper.check_and_record("a", 13)
+
+    def test_memory_bounded(self):
+        """超过客户端上限时淘汰最久未使用的状态"""
+        deduper = BatchDeduper(max_clients=2)
+        deduper.check_and_record("a", 1)
+        deduper.check_and_record("b", 1)
+        deduper.check_and_record("a", 2)
+        deduper.check_and_record("c", 1)
+        assert len(deduper) == 2
+        assert not deduper.check_and_record("a", 2)
+
+    def test_discard_allows_retry(self):
+        """处理失败后撤销的序号可以重新提交"""
+        deduper = BatchDeduper(window=8)
+        assert deduper.check_and_record("a", 5)
+        assert deduper.check_and_record("a", 6)
+        deduper.discard("a", 5)
+        assert deduper.check_and_record("a", 5)
+        assert not deduper.check_and_record("a", 6)
+        deduper.discard("b", 1)
+        assert len(deduper) == 1
+
+    def test_failed_upload_can_be_retried(self, uploaders, monkeypatch):
+        """写入缓冲区失败的批次不记为已处理"""
+        now = datetime.utcnow()
+        payload = {
+            "count": 10,
+            "started_at": (now - timedelta(seconds=10)).isoformat(),
+            "ended_at": now.isoformat(),
+            "client_id": "device-2",
+            "batch_seq": 1
+        }
+
+        def fail(*args):
+            raise OSError("事件日志写入失败")
+
+        monkeypatch.setattr(tap_aggregator, "add", fail)
+        with pytest.raises(OSError):
+            client.post("/stats/10/taps", json=payload)
+        monkeypatch.undo()
+
+        retry = client.post("/stats/10/taps", json=payload).json()
+        assert retry["duplicate"] is False
+        assert tap_aggregator.pending_taps(10) == 10
+        reset_aggregator()
+
+    def test_retried_upload_counted_once(self, uploaders):
+        """重试的上传只计数一次"""
+        now = datetime.utcnow()
+        payload = {
+            "count": 10,
+            "started_at": (now - timedelta(seconds=10)).isoformat(),
+            "ended_at": now.isoformat(),
+            "client_id": "device-1",
+            "batch_seq": 1
+        }
+        first = client.post("/stats/9/taps", json=payload).json()
+        retry = client.post("/stats/9/taps", json=payload).json()
+        assert first["duplicate"] is False
+        assert retry["duplicate"] is True
+        assert retry["accepted"] == 0
+        assert tap_aggregator.pending_taps(9) == 10
+        reset_aggregator()
+
+    def test_replayed_meditation_returns_stored_session(self, uploaders):
+        """重试已上传的冥想批次返回原记录，不重复写入"""
+        payload = {"duration": 600, "tap_count": 120, "client_id": "device-3", "batch_seq": 1}
+        first = client.post("/meditation/9/sessions", json=payload)
+        retry = client.post("/meditation/9/sessions", json=payload)
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+
+        # 重启后去重记录丢失时由批次唯一索引判重
+        batch_deduper._state.clear()
+        assert client.post("/meditation/9/sessions", json=payload).json() == first.json()
+
+        db = SessionLocal()
+        assert db.query(models.MeditationSession).filter_by(user_id="9").count() == 1
+        db.query(models.MeditationSession).delete()
+        db.commit()
+        db.close()
+
+class TestTapHistogram:
+    """敲击分布图测试"""
+
+    def test_flush_fills_hourly_buckets(self, aggregator):
+        """刷新时按小时累加分桶"""
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        aggregator.add(201, 5, hour + timedelta(minutes=5))
+        aggregator.add(201, 7, hour + timedelta(minutes=50))
+        aggregator.add(201, 3, hour - timedelta(minutes=10))
+        aggregator.flush()
+        aggregator.add(201, 1, hour + timedelta(minutes=55))
+        aggregator.flush()
+
+        data = client.get("/stats/201/histogram?range=day").json()
+        assert data["granularity"] == "hour"
+        assert len(data["points"]) == 24
+        assert [p["taps"] for p in data["points"][-2:]] == [3, 13]
+
+    def test_compaction_keeps_daily_series(self, aggregator):
+        """小时桶合并为日桶后按周统计不变"""
+        today_start = day_start_utc(local_today())
+        aggregator.add(202, 4, today_start - timedelta(days=2) + timedelta(hours=1))
+        aggregator.add(202, 6, today_start - timedelta(days=2) + timedelta(hours=20))
+        aggregator.add(202, 2, today_start + timedelta(minutes=1))
+        aggregator.flush()
+        before = client.get("/stats/202/histogram?range=week").json()
+
+        db = SessionLocal()
+        assert crud.compact_tap_histogram(db, today_start) == 2
+        # 重复合并不会产生重复日桶
+        assert crud.compact_tap_histogram(db, today_start) == 0
+        rows = db.query(models.TapHistogram).filter(models.TapHistogram.user_id == "202").all()
+        assert sorted((r.granularity, r.taps) for r in rows) == [("day", 10), ("hour", 2)]
+        db.close()
+
+        after = client.get("/stats/202/histogram?range=week").json()
+        assert after == before
+        assert [p["taps"] for p in after["points"]][-3:] == [10, 0, 2]
+
+    def test_invalid_range(self):
+        """无效的时间范围"""
+        assert client.get("/stats/1/histogram?range=year").status_code == 400
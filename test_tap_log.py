@@ -0,0 +1,115 @@
+"""
+敲击事件日志测试
+"""
+
+import os
+import shutil
+import pytest
+from datetime import datetime, timedelta
+
+from database import SessionLocal
+from periods import day_start_utc, local_today
+from tap_log import TapEventLog
+import models
+
+@pytest.fixture
+def event_log(tmp_path):
+    """提供临时目录中的事件日志"""
+    log = TapEventLog(str(tmp_path), segment_max_bytes=20 * 4)
+    yield log
+    log.close()
+
+@pytest.fixture
+def clean_db():
+    yield
+    db = SessionLocal()
+    db.query(models.UserStat).delete()
+    db.query(models.Leaderboard).delete()
+    db.commit()
+    db.close()
+
+def write_events(log, base):
+    log.append(1, base + timedelta(hours=1), 10)
+    log.append(2, base + timedelta(hours=2), 5)
+    log.append(1, base + timedelta(hours=3), 7)
+    log.append(1, base + timedelta(days=1, hours=1), 4)
+    log.append(3, base + timedelta(days=1, hours=2), 9)
+
+class TestTapEventLog:
+    """事件日志测试"""
+
+    def test_segments_roll_at_size_limit(self, event_log, tmp_path):
+        """分段达到大小上限后切换"""
+        write_events(event_log, datetime(2025, 1, 1))
+        segments = sorted(name for name in os.listdir(tmp_path) if name.startswith('segment-'))
+        assert len(segments) == 2
+
+    def test_compact_preserves_totals(self, event_log, tmp_path):
+        """压缩前后每日汇总一致，分段被删除"""
+        base = day_start_utc(datetime(2025, 1, 1).date())
+        write_events(event_log, base)
+        before = event_log.daily_totals()
+
+        event_log.roll()
+        assert event_log.compact() == 2
+        assert not [name for name in os.listdir(tmp_path) if name.startswith('segment-')]
+        after = event_log.daily_totals()
+
+        assert after == before
+        day1 = after[datetime(2025, 1, 1).date()]
+        assert day1[1][0] == 17
+        assert day1[2][0] == 5
+
+    def test_compact_is_idempotent_after_crash(self, event_log, tmp_path):
+        """分段已合并但未删除时重跑压缩不会重复累计"""
+        write_events(event_log, datetime(2025, 1, 1))
+        event_log.roll()
+        backup = tmp_path / 'backup'
+        backup.mkdir()
+        for name in os.listdir(tmp_path):
+            if name.startswith('segment-'):
+                shutil.copy(tmp_path / name, backup / name)
+        event_log.compact()
+        expected = event_log.daily_totals()
+
+        # 模拟删除分段前崩溃
+        for name in os.listdir(backup):
+            shutil.copy(backup / name, tmp_path / name)
+        assert event_log.daily_totals() == expected
+        event_log.compact()
+        assert event_log.daily_totals() == expected
+
+    def test_segment_numbers_not_reused_after_compaction(self, event_log, tmp_path):
+        """压缩后新分段的数据不会被摘要水位线忽略"""
+        base = day_start_utc(datetime(2025, 1, 1).date())
+        write_events(event_log, base)
+        event_log.roll()
+        event_log.compact()
+
+        event_log.append(1, base + timedelta(hours=5), 100)
+        totals = event_log.daily_totals()
+        assert totals[datetime(2025, 1, 1).date()][1][0] == 117
+
+    def test_rebuild_user_stats_and_leaderboard(self, event_log, clean_db):
+        """由事件日志重建统计与排行榜"""
+        today = local_today()
+        today_start = day_start_utc(today)
+        event_log.append(1, today_start - timedelta(days=2) + timedelta(hours=1), 10)
+        event_log.append(1, today_start - timedelta(days=1) + timedelta(hours=1), 20)
+        event_log.append(1, today_start + timedelta(minutes=1), 3)
+        event_log.append(2, today_start + timedelta(minutes=2), 8)
+
+        result = event_log.rebuild(today=today)
+        assert result['users'] == 2
+
+        db = SessionLocal()
+        stats = {s.user_id: s for s in db.query(models.UserStat).all()}
+        assert int(stats["1"].total_taps) == 33
+        assert int(stats["1"].today_taps) == 3
+        assert int(stats["1"].consecutive_days) == 2
+        assert int(stats["2"].consecutive_days) == 0
+
+        daily = db.query(models.Leaderboard).filter(models.Leaderboard.period == 'daily').all()
+        ranks = {row.user_id: int(row.rank) for row in daily}
+        assert ranks == {"2": 1, "1": 2}
+        db.close()
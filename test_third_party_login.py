@@ -0,0 +1,109 @@
+"""
+第三方登录身份解析测试：老用户登录只读一次库且不写库
+"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from main import app
+from database import SessionLocal, async_engine
+from identity_cache import identity_cache
+from third_party_auth import apple_auth_service
+import models
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+@pytest.fixture
+def apple_user_id(monkeypatch):
+    """模拟Apple身份令牌校验，令牌内容即为Apple用户标识"""
+    monkeypatch.setattr(apple_auth_service, "verify_identity_token", lambda token: {"sub": token})
+    platform_user_id = f"apple-{uuid.uuid4().hex}"
+    yield platform_user_id
+    cleanup("apple", platform_user_id)
+
+def cleanup(platform: str, platform_user_id: str):
+    identity_cache.invalidate(platform, platform_user_id)
+    db = SessionLocal()
+    auth = db.query(models.ThirdPartyAuth).filter_by(platform=platform, platform_user_id=platform_user_id).first()
+    if auth:
+        db.query(models.UserStat).filter_by(user_id=auth.user_id).delete()
+        db.query(models.User).filter_by(id=auth.user_id).delete()
+        db.delete(auth)
+        db.commit()
+    db.close()
+
+class StatementRecorder:
+    """记录请求期间发出的SQL语句"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.lstrip().split()[0].upper())
+
+    @property
+    def writes(self):
+        return [s for s in self.statements if s in ("INSERT", "UPDATE", "DELETE")]
+
+def apple_login(client, token):
+    return client.post("/users/apple-login", json={"identity_token": token, "authorization_code": "code",
+                                                    "user_identifier": token})
+
+class TestThirdPartyLogin:
+    """第三方登录测试"""
+
+    def test_apple_returning_user_single_read(self, client, apple_user_id):
+        first = apple_login(client, apple_user_id)
+        assert first.status_code == 200
+        assert first.json()["is_new_user"] is True
+
+        with StatementRecorder() as recorder:
+            second = apple_login(client, apple_user_id)
+        assert second.status_code == 200
+        assert second.json()["is_new_user"] is False
+        assert second.json()["user"]["id"] == first.json()["user"]["id"]
+        assert recorder.statements == ["SELECT"]
+
+    def test_apple_cold_cache_joined_lookup(self, client, apple_user_id):
+        """身份缓存未命中时一次联表查询"""
+        user_id = apple_login(client, apple_user_id).json()["user"]["id"]
+        identity_cache.clear()
+
+        with StatementRecorder() as recorder:
+            response = apple_login(client, apple_user_id)
+        assert response.json()["user"]["id"] == user_id
+        assert recorder.statements == ["SELECT"]
+        assert identity_cache.get("apple", apple_user_id) == str(user_id)
+
+    def test_stale_cache_entry(self, client, apple_user_id):
+        """缓存指向的用户不存在时回退到联表查询"""
+        user_id = apple_login(client, apple_user_id).json()["user"]["id"]
+        identity_cache.put("apple", apple_user_id, "1")
+        response = apple_login(client, apple_user_id)
+        assert response.json()["user"]["id"] == user_id
+
+    def test_wechat_returning_user_no_writes(self, client):
+        openid = f"wx-{uuid.uuid4().hex}"
+        try:
+            body = {"platform": "wechat", "platform_user_id": openid, "username": "微信用户"}
+            first = client.post("/users/wechat-login", json=body)
+            assert first.status_code == 200
+
+            with StatementRecorder() as recorder:
+                second = client.post("/users/wechat-login", json=body)
+            assert second.json()["id"] == first.json()["id"]
+            assert recorder.writes == []
+        finally:
+            cleanup("wechat", openid)
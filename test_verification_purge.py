@@ -0,0 +1,112 @@
+"""
+验证码过期清理测试
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import SessionLocal, async_session_scope
+from verification_purge import purge_verification_codes
+import crud
+import models
+
+PHONE_PREFIX = "1399000"
+
+class TestVerificationPurge:
+    """验证码冷热分离测试"""
+
+    @pytest.fixture(autouse=True)
+    def clean_codes(self):
+        def clean():
+            db = SessionLocal()
+            for model in (models.VerificationCode, models.VerificationCodeArchive):
+                db.query(model).filter(model.phone.like(f"{PHONE_PREFIX}%")).delete(synchronize_session=False)
+            db.commit()
+            db.close()
+        clean()
+        yield
+        clean()
+
+    def add_code(self, db, phone: str, created_at: datetime, expires_at: datetime, code: str = "123456"):
+        db.add(models.VerificationCode(phone=phone, code=code, created_at=created_at, expires_at=expires_at))
+
+    def count(self, model, phone: str = None) -> int:
+        db = SessionLocal()
+        try:
+            query = db.query(model).filter(model.phone.like(f"{PHONE_PREFIX}%"))
+            if phone:
+                query = query.filter(model.phone == phone)
+            return query.count()
+        finally:
+            db.close()
+
+    def test_dead_codes_archived_in_batches(self):
+        """过期且超出发送间隔的记录分批移入冷数据表"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        for i in range(25):
+            self.add_code(db, f"{PHONE_PREFIX}{i:04d}", now - timedelta(hours=1), now - timedelta(minutes=55))
+        db.commit()
+        db.close()
+
+        metrics = purge_verification_codes(batch_size=10, now=now)
+        assert metrics["purged"] >= 25
+        assert metrics["batches"] >= 3
+        assert self.count(models.VerificationCode) == 0
+        assert self.count(models.VerificationCodeArchive) == 25
+
+        db = SessionLocal()
+        archived = db.query(models.VerificationCodeArchive).filter(
+            models.VerificationCodeArchive.phone == f"{PHONE_PREFIX}0000").one()
+        assert not hasattr(archived, "code")
+        assert archived.archived_at == now
+        db.close()
+
+    def test_live_codes_kept(self):
+        """未过期、以及仍在发送间隔内的记录保留在热数据表"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        # 未过期
+        self.add_code(db, f"{PHONE_PREFIX}0001", now - timedelta(minutes=1), now + timedelta(minutes=4))
+        # 已过期但仍在发送间隔内，发送频率检查需要它
+        self.add_code(db, f"{PHONE_PREFIX}0002", now - timedelta(minutes=2), now - timedelta(seconds=1))
+        db.commit()
+        db.close()
+
+        purge_verification_codes(now=now)
+        assert self.count(models.VerificationCode) == 2
+        assert self.count(models.VerificationCodeArchive) == 0
+
+        async def run():
+            async with async_session_scope(read_only=True) as db:
+                return (await crud.can_send_verification_code(db, f"{PHONE_PREFIX}0002"),
+                        await crud.get_valid_verification_code(db, f"{PHONE_PREFIX}0001", "123456"))
+        can_send, verified = asyncio.run(run())
+        assert can_send is False
+        assert verified is not None
+
+    def test_archive_retention(self):
+        """冷数据超过保留天数后删除；保留天数为0时不写冷数据表"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        db.add(models.VerificationCodeArchive(id="1", phone=f"{PHONE_PREFIX}0003", archived_at=now - timedelta(days=31)))
+        db.add(models.VerificationCodeArchive(id="2", phone=f"{PHONE_PREFIX}0004", archived_at=now - timedelta(days=1)))
+        self.add_code(db, f"{PHONE_PREFIX}0005", now - timedelta(hours=1), now - timedelta(minutes=55))
+        db.commit()
+        db.close()
+
+        metrics = purge_verification_codes(retention_days=0, now=now)
+        assert metrics["archive_deleted"] >= 2
+        assert self.count(models.VerificationCode) == 0
+        assert self.count(models.VerificationCodeArchive) == 0
+
+        db = SessionLocal()
+        db.add(models.VerificationCodeArchive(id="3", phone=f"{PHONE_PREFIX}0006", archived_at=now - timedelta(days=31)))
+        db.add(models.VerificationCodeArchive(id="4", phone=f"{PHONE_PREFIX}0007", archived_at=now - timedelta(days=1)))
+        db.commit()
+        db.close()
+        purge_verification_codes(retention_days=30, now=now)
+        assert self.count(models.VerificationCodeArchive, f"{PHONE_PREFIX}0006") == 0
+        assert self.count(models.VerificationCodeArchive, f"{PHONE_PREFIX}0007") == 1
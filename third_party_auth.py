@@ -6,6 +6,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 import logging
 
+from jwks_cache import apple_jwks
+
 logger = logging.getLogger(__name__)
 
 class AppleAuthService:
@@ -16,7 +18,8 @@ class AppleAuthService:
         self.team_id = os.getenv('APPLE_TEAM_ID')
         self.key_id = os.getenv('APPLE_KEY_ID')
         self.private_key = os.getenv('APPLE_PRIVATE_KEY')
-        self.apple_public_keys_url = 'https://appleid.apple.com/auth/keys'
+        # Apple公钥缓存（kid索引，后台刷新）
+        self.jwks = apple_jwks
         
     def is_configured(self) -> bool:
         """检查Apple认证是否已配置"""
@@ -34,23 +37,12 @@ class AppleAuthService:
                 logger.warning("Apple认证未配置，使用模拟验证")
                 return self._mock_verify_token(identity_token)
             
-            # 获取Apple公钥
-            apple_keys = self._get_apple_public_keys()
-            if not apple_keys:
-                logger.error("无法获取Apple公钥")
-                return None
-            
             # 解码JWT头部获取kid
             header = jwt.get_unverified_header(identity_token)
             kid = header.get('kid')
             
-            # 找到对应的公钥
-            public_key = None
-            for key in apple_keys['keys']:
-                if key['kid'] == kid:
-                    public_key = jwt.PyJWK(key).key
-                    break
-            
+            # 按kid从公钥缓存中取公钥
+            public_key = self.jwks.get_key(kid)
             if not public_key:
                 logger.error(f"找不到对应的Apple公钥，kid: {kid}")
                 return None
@@ -58,7 +50,7 @@ class AppleAuthService:
             # 验证JWT
             payload = jwt.decode(
                 identity_token,
-                public_key,
+                public_key.key,
                 algorithms=['RS256'],
                 audience=self.client_id,
                 issuer='https://appleid.apple.com'
@@ -76,16 +68,6 @@ class AppleAuthService:
             logger.error(f"验证Apple身份令牌时发生错误: {e}")
             return None
     
-    def _get_apple_public_keys(self) -> Optional[Dict[str, Any]]:
-        """获取Apple公钥"""
-        try:
-            response = requests.get(self.apple_public_keys_url, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"获取Apple公钥失败: {e}")
-            return None
-    
     def _mock_verify_token(self, identity_token: str) -> Dict[str, Any]:
         """模拟验证令牌（开发环境使用）"""
         logger.info("使用模拟Apple认证")
@@ -0,0 +1,138 @@
+"""
+验证码过期清理
+
+verification_codes只保留仍可能被查询的记录：未过期的验证码，以及发送频率检查窗口内的记录。
+后台线程定期把其余记录分批移入冷数据表verification_code_archive（不含验证码本身）后删除，
+每批单独提交，不会长时间持有写锁；冷数据超过保留天数后同样分批删除。
+这样发送频率检查和验证码校验的查询始终只面对少量热数据，耗时不随短信量增长。
+
+用法: python verification_purge.py  （立即执行一次清理）
+"""
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text, bindparam, DateTime
+
+from database import SessionLocal
+import crud
+
+logger = logging.getLogger(__name__)
+
+# 每批处理的行数
+PURGE_BATCH_SIZE = int(os.getenv('VERIFICATION_PURGE_BATCH_SIZE', '1000'))
+# 清理间隔（秒）
+PURGE_INTERVAL = float(os.getenv('VERIFICATION_PURGE_INTERVAL', '60'))
+# 冷数据保留天数，0表示不保留（直接删除过期验证码）
+ARCHIVE_RETENTION_DAYS = int(os.getenv('VERIFICATION_ARCHIVE_RETENTION_DAYS', '30'))
+
+# 已过期且超出发送频率检查窗口的记录，按过期时间索引分批查找
+EXPIRED_BATCH_SQL = text("""
+    SELECT id FROM verification_codes
+    WHERE expires_at <= :now AND created_at <= :window_start
+    ORDER BY expires_at
+    LIMIT :limit
+""").bindparams(bindparam("now", type_=DateTime), bindparam("window_start", type_=DateTime))
+
+ARCHIVE_SQL = text("""
+    INSERT OR IGNORE INTO verification_code_archive (id, phone, created_at, expires_at, used, archived_at)
+    SELECT id, phone, created_at, expires_at, used, :now FROM verification_codes WHERE id IN :ids
+""").bindparams(bindparam("now", type_=DateTime), bindparam("ids", expanding=True))
+
+DELETE_SQL = text("DELETE FROM verification_codes WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+
+# 冷数据按主键顺序删除（主键时间有序，最早的记录在前）
+ARCHIVE_EXPIRED_SQL = text("""
+    DELETE FROM verification_code_archive
+    WHERE id IN (
+        SELECT id FROM verification_code_archive WHERE archived_at < :before ORDER BY id LIMIT :limit
+    )
+""").bindparams(bindparam("before", type_=DateTime))
+
+def purge_verification_codes(session_factory=SessionLocal, batch_size: int = PURGE_BATCH_SIZE,
+                             retention_days: int = ARCHIVE_RETENTION_DAYS,
+                             now: Optional[datetime] = None) -> dict:
+    """清理过期验证码，返回移出热数据表及删除的冷数据行数"""
+    now = now or datetime.utcnow()
+    started = time.monotonic()
+    metrics = {'purged': 0, 'archive_deleted': 0, 'batches': 0}
+
+    db = session_factory()
+    try:
+        while True:
+            ids = [row[0] for row in db.execute(EXPIRED_BATCH_SQL, {
+                'now': now, 'window_start': now - crud.SEND_CODE_INTERVAL, 'limit': batch_size
+            })]
+            if not ids:
+                break
+            if retention_days > 0:
+                db.execute(ARCHIVE_SQL, {'now': now, 'ids': ids})
+            db.execute(DELETE_SQL, {'ids': ids})
+            db.commit()
+            metrics['purged'] += len(ids)
+            metrics['batches'] += 1
+            if len(ids) < batch_size:
+                break
+
+        before = now - timedelta(days=retention_days)
+        while True:
+            deleted = db.execute(ARCHIVE_EXPIRED_SQL, {'before': before, 'limit': batch_size}).rowcount
+            db.commit()
+            metrics['archive_deleted'] += deleted
+            if deleted < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    metrics['elapsed'] = time.monotonic() - started
+    if metrics['purged'] or metrics['archive_deleted']:
+        logger.info(f"验证码清理完成: {metrics}")
+    return metrics
+
+class VerificationCodePurger:
+    """验证码定期清理线程"""
+
+    def __init__(self, session_factory=SessionLocal, interval: float = PURGE_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.last_metrics: Optional[dict] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动清理线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="verification-purge", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止清理线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # 启动时立即清理一次，处理停机期间积压的过期记录
+        while True:
+            try:
+                self.last_metrics = purge_verification_codes(self.session_factory)
+            except Exception as e:
+                logger.error(f"验证码清理失败，稍后重试: {e}")
+            if self._stop_event.wait(self.interval):
+                break
+
+# 全局验证码清理线程
+verification_purger = VerificationCodePurger()
+
+if __name__ == "__main__":
+    print(purge_verification_codes())